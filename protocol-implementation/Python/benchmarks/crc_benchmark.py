@@ -0,0 +1,80 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import sys
+import timeit
+from random import randint
+import emb_ser_protocol.protocol as prot
+
+
+# The bitwise calculate_crc implementation shipped up to 1.1.23, kept as the baseline
+def legacy_calculate_crc(msg):
+    crc = 0xFFFF
+    byte_list = []
+    byte_list.append(prot.HEADER_BYTE0)
+    byte_list.append(prot.HEADER_BYTE1)
+    byte_list.append(prot.HEADER_BYTE2)
+    byte_list.append(msg.src_addr)
+    byte_list.append(msg.tgt_addr)
+    byte_list.append(msg.msg_type)
+    byte_list.append(msg.msg_len >> 8 & 0xFF)
+    byte_list.append(msg.msg_len & 0xFF)
+    for i in range(msg.msg_len):
+        byte_list.append(msg.msg_payload[i])
+    for i in range(len(byte_list)):
+        crc = crc ^ byte_list[i]
+        for j in range(8):
+            if (crc & 0x0001):
+                crc = crc >> 1
+                crc = crc ^ 0xA001
+            else:
+                crc = crc >> 1
+    return crc
+
+
+# Time a single call of func(msg), best of a few runs
+def time_call(func, msg, repeat):
+    return min(timeit.repeat(lambda: func(msg), number=1, repeat=repeat))
+
+
+# Main function for the CRC benchmark.
+def main(argv):
+    repeat = 5
+    if len(argv) > 0:
+        repeat = int(argv[0])
+
+    print("{:>8} {:>14} {:>14} {:>10}".format("length", "legacy (ms)",
+                                              "table (ms)", "speedup"))
+    for length in (0, 16, 256, 4096, prot.MAX_MSG_LEN):
+        payload = [randint(0, 255) for i in range(length)]
+        msg = prot.message(randint(0, 255), 0x01, 0x02, length, payload, 0)
+
+        # The new engine must match the old one bit for bit
+        if legacy_calculate_crc(msg) != prot.calculate_crc(msg):
+            print("Error: CRC mismatch at length " + str(length))
+            sys.exit(2)
+
+        legacy = time_call(legacy_calculate_crc, msg, repeat)
+        table = time_call(prot.calculate_crc, msg, repeat)
+        print("{:>8} {:>14.3f} {:>14.3f} {:>9.1f}x".format(
+            length, legacy * 1000, table * 1000, legacy / table))
+
+
+# Main caller
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,359 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import getopt
+import json
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from random import Random
+import emb_ser_protocol.protocol as prot
+
+# Payload size of the large frame cases
+LARGE_LEN = prot.MAX_MSG_LEN
+
+# Bytes of traffic in each stream case
+STREAM_LEN = 1 << 16
+
+# Number of messages queued in the heavy queue case
+QUEUE_DEPTH = 100000
+
+# Random source for the benchmark data, reseeded for every benchmark
+rng = Random()
+
+
+# Build a message sourced from 0x02 for 0x01 with a random payload
+def random_message(length):
+    return prot._build_message(rng.randint(0, 255), 0x02, 0x01, bytes(
+        rng.randint(0, 255) for i in range(length)))
+
+
+# Build a stream of about STREAM_LEN bytes of frames for 0x01
+def build_stream(max_len, junk=0, bad_crc=0, foreign=0):
+    """
+    Build a stream of frames for the parser benchmarks.
+
+    Args:
+        max_len: Largest payload length, payloads are drawn from 0..max_len
+        junk: Fraction of frames preceded by up to 32 bytes of line noise
+        bad_crc: Fraction of frames with a corrupted CRC
+        foreign: Fraction of frames addressed to 0x03 rather than 0x01
+
+    Returns:
+        Tuple of the stream bytes and the number of good frames in it
+    """
+    stream = bytearray()
+    good = 0
+    while len(stream) < STREAM_LEN:
+        if rng.random() < junk:
+            # Noise never contains a header byte, so it costs resyncs without eating frames
+            stream += bytes(rng.randint(0, 0xA9) for i in range(rng.randint(1, 32)))
+        frame = bytearray(random_message(rng.randint(0, max_len)).to_bytes())
+        if foreign and rng.random() < foreign:
+            frame = bytearray(prot._build_message(frame[5], 0x02, 0x03, frame[8:-2]).to_bytes())
+        if rng.random() < bad_crc:
+            frame[-1] ^= 0xFF
+        else:
+            good += 1
+        stream += frame
+    return bytes(stream), good
+
+
+# Cut a stream of frames with no noise to at most limit bytes, at a frame boundary
+def whole_frames(stream, limit):
+    pos = 0
+    while pos < len(stream):
+        end = pos + prot.FRAME_OVERHEAD_LEN + (stream[pos + 6] << 8 | stream[pos + 7])
+        # Keep at least one frame, however long
+        if end > limit and pos > 0:
+            break
+        pos = end
+    return stream[:pos]
+
+
+# Benchmark cases, each returns (function to time, bytes processed per call, per-call setup or None)
+def case_calculate_crc(length):
+    msg = random_message(length)
+    return lambda: prot.calculate_crc(msg), msg.frame_len(), None
+
+
+def case_build_message(length):
+    payload = bytes(rng.randint(0, 255) for i in range(length))
+    return lambda: prot._build_message(0x10, 0x02, 0x01, payload), length + prot.FRAME_OVERHEAD_LEN, None
+
+
+def case_to_list(length):
+    msg = random_message(length)
+    return msg.to_list, msg.frame_len(), None
+
+
+def case_to_bytes(length):
+    msg = random_message(length)
+    return msg.to_bytes, msg.frame_len(), None
+
+
+def case_parse_byte(max_len, timing=False, foreign=0, validate=False):
+    stream, good = build_stream(max_len, foreign=foreign)
+    # A whole number of frames, so every timed run starts with the parser idle
+    stream = whole_frames(stream, 4096)
+    p = prot.parser(0x01, validate_foreign_crc=validate)
+    if timing:
+        p.enable_timing(lambda msg, latency: None)
+
+    def run():
+        parse_byte = p.parse_byte
+        for byte in stream:
+            parse_byte(byte)
+        p.check_for_parsed_messages()
+    return run, len(stream), None
+
+
+def case_parse_input_buffer(max_len, junk=0, bad_crc=0, chunk=None, timing=False, foreign=0,
+                            validate=False):
+    stream, good = build_stream(max_len, junk, bad_crc, foreign)
+    p = prot.parser(0x01, validate_foreign_crc=validate)
+    if timing:
+        p.enable_timing(lambda msg, latency: None)
+    if chunk is None:
+        def run():
+            p.parse_input_buffer(stream)
+            p.check_for_parsed_messages()
+    else:
+        view = memoryview(stream)
+
+        def run():
+            for pos in range(0, len(stream), chunk):
+                p.parse_input_buffer(view[pos:pos + chunk])
+            p.check_for_parsed_messages()
+    return run, len(stream), None
+
+
+def case_check_for_parsed_messages(depth):
+    p = prot.parser(0x01)
+    msg = random_message(16)
+
+    def fill():
+        put = p.parsed_message_queue.put
+        for i in range(depth):
+            put(msg)
+    return p.check_for_parsed_messages, 0, fill
+
+
+# Every benchmark: (name, group, case function, arguments)
+BENCHMARKS = [
+    ("calculate_crc[16]", "crc", case_calculate_crc, (16,)),
+    ("calculate_crc[64k]", "crc", case_calculate_crc, (LARGE_LEN,)),
+    ("build_message[16]", "encode", case_build_message, (16,)),
+    ("build_message[64k]", "encode", case_build_message, (LARGE_LEN,)),
+    ("to_list[16]", "encode", case_to_list, (16,)),
+    ("to_list[64k]", "encode", case_to_list, (LARGE_LEN,)),
+    ("to_bytes[16]", "encode", case_to_bytes, (16,)),
+    ("to_bytes[64k]", "encode", case_to_bytes, (LARGE_LEN,)),
+    ("parse_byte[small]", "parse", case_parse_byte, (64,)),
+    ("parse_byte[small,timing]", "parse", case_parse_byte, (64, True)),
+    ("parse_input_buffer[clean,small]", "parse", case_parse_input_buffer, (64,)),
+    ("parse_input_buffer[clean,64k]", "parse", case_parse_input_buffer, (LARGE_LEN,)),
+    ("parse_input_buffer[noisy,small]", "parse", case_parse_input_buffer, (64, 0.5)),
+    ("parse_input_buffer[bad_crc,small]", "parse", case_parse_input_buffer, (64, 0, 0.25)),
+    ("parse_input_buffer[chunked_256,small]", "parse", case_parse_input_buffer,
+     (64, 0, 0, 256)),
+    ("parse_input_buffer[chunked_256,small,timing]", "parse", case_parse_input_buffer,
+     (64, 0, 0, 256, True)),
+    # Multi-drop bus traffic, frames for other addresses are skipped unless validate_foreign_crc is set
+    ("parse_byte[foreign_50,small]", "foreign", case_parse_byte, (64, False, 0.5)),
+    ("parse_byte[foreign_50,small,validate]", "foreign", case_parse_byte, (64, False, 0.5, True)),
+    ("parse_byte[foreign_90,small]", "foreign", case_parse_byte, (64, False, 0.9)),
+    ("parse_byte[foreign_90,small,validate]", "foreign", case_parse_byte, (64, False, 0.9, True)),
+    ("parse_input_buffer[foreign_50,small]", "foreign", case_parse_input_buffer,
+     (64, 0, 0, None, False, 0.5)),
+    ("parse_input_buffer[foreign_50,small,validate]", "foreign", case_parse_input_buffer,
+     (64, 0, 0, None, False, 0.5, True)),
+    ("parse_input_buffer[foreign_90,small]", "foreign", case_parse_input_buffer,
+     (64, 0, 0, None, False, 0.9)),
+    ("parse_input_buffer[foreign_90,small,validate]", "foreign", case_parse_input_buffer,
+     (64, 0, 0, None, False, 0.9, True)),
+    ("parse_input_buffer[foreign_90,64k,chunked_256]", "foreign", case_parse_input_buffer,
+     (LARGE_LEN, 0, 0, 256, False, 0.9)),
+    ("parse_input_buffer[foreign_90,64k,chunked_256,validate]", "foreign",
+     case_parse_input_buffer, (LARGE_LEN, 0, 0, 256, False, 0.9, True)),
+    ("check_for_parsed_messages[100k]", "queue", case_check_for_parsed_messages, (QUEUE_DEPTH,)),
+]
+
+
+# Time one benchmark and measure its allocations
+def run_benchmark(name, group, case, args, repeat):
+    """
+    Run one benchmark case.
+
+    Args:
+        name: Name of the benchmark
+        group: Group the benchmark is reported under
+        case: Case function returning the function to time, bytes per call and a per-call setup
+        args: Arguments for the case function
+        repeat: Number of timing runs, the best is reported
+
+    Returns:
+        Dictionary of the benchmark results
+    """
+    # Seed per benchmark so a case measures the same data however many cases run before it
+    rng.seed(name)
+    func, nbytes, setup = case(*args)
+    if setup is None:
+        number = timeit.Timer(func).autorange()[0]
+        best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    else:
+        # Calls that consume their input are timed one at a time after a fresh setup
+        number = 1
+        times = []
+        for i in range(repeat):
+            setup()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        best = min(times)
+
+    # Allocation of a single call, measured separately as tracing slows everything down
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "name": name,
+        "group": group,
+        "seconds_per_call": best,
+        "calls_per_second": 1.0 / best if best > 0 else None,
+        "bytes_per_call": nbytes,
+        "bytes_per_second": nbytes / best if nbytes and best > 0 else None,
+        "peak_alloc_bytes": peak - before,
+        "retained_bytes": current - before,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+# Compare results against a baseline file, returning the names of the regressed benchmarks
+def compare(results, baseline_file, threshold):
+    try:
+        with open(baseline_file, "r") as f:
+            baseline = {r["name"]: r for r in json.load(f)["results"]}
+    except Exception as e:
+        print("Error: " + str(e))
+        sys.exit(2)
+    regressions = []
+    print("")
+    print("{:<40} {:>12} {:>12} {:>8}".format("benchmark", "baseline us", "current us", "change"))
+    for r in results:
+        old = baseline.get(r["name"])
+        if old is None:
+            continue
+        change = r["seconds_per_call"] / old["seconds_per_call"] - 1.0
+        flag = ""
+        if change > threshold:
+            flag = " REGRESSION"
+            regressions.append(r["name"])
+        print("{:<40} {:>12.2f} {:>12.2f} {:>+7.0%}{}".format(
+            r["name"], old["seconds_per_call"] * 1e6, r["seconds_per_call"] * 1e6, change, flag))
+    return regressions
+
+
+# Print the usage of the program.
+def print_usage():
+    print("Usage: protocol_benchmark.py [options]")
+    print("Options:")
+    print("-h, --help: Print this help message.")
+    print("-o, --output: JSON file to write the results to, default benchmark_results.json.")
+    print("-b, --baseline: JSON results of an earlier run to compare against.")
+    print("-t, --threshold: Slowdown reported as a regression, default 0.2 (20%).")
+    print("-r, --repeat: Number of timing runs per benchmark, default 5.")
+    print("-k, --filter: Only run benchmarks whose name contains this string.")
+
+
+# Main function for the protocol benchmark.
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "ho:b:t:r:k:", [
+            "help", "output=", "baseline=", "threshold=", "repeat=", "filter="])
+    except getopt.GetoptError:
+        print(sys.exc_info()[1])
+        print_usage()
+        sys.exit(2)
+
+    output = "benchmark_results.json"
+    baseline = ""
+    threshold = 0.2
+    repeat = 5
+    name_filter = ""
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print_usage()
+            sys.exit()
+        elif opt in ("-o", "--output"):
+            output = arg
+        elif opt in ("-b", "--baseline"):
+            baseline = arg
+        elif opt in ("-t", "--threshold"):
+            threshold = float(arg)
+        elif opt in ("-r", "--repeat"):
+            repeat = int(arg)
+        elif opt in ("-k", "--filter"):
+            name_filter = arg
+
+    results = []
+    print("{:<40} {:>12} {:>12} {:>14}".format("benchmark", "us/call", "MB/s", "peak alloc"))
+    for name, group, case, case_args in BENCHMARKS:
+        if name_filter not in name:
+            continue
+        r = run_benchmark(name, group, case, case_args, repeat)
+        results.append(r)
+        rate = ""
+        if r["bytes_per_second"] is not None:
+            rate = "{:.2f}".format(r["bytes_per_second"] / 1e6)
+        print("{:<40} {:>12.2f} {:>12} {:>14}".format(
+            name, r["seconds_per_call"] * 1e6, rate, r["peak_alloc_bytes"]))
+
+    report = {
+        "version": prot.get_version(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("")
+    print("Results written to " + output)
+
+    if baseline != "":
+        regressions = compare(results, baseline, threshold)
+        if len(regressions) > 0:
+            print("")
+            print("Error: " + str(len(regressions)) + " benchmarks regressed")
+            sys.exit(1)
+
+
+# Main caller
+if __name__ == "__main__":
+    main(sys.argv[1:])
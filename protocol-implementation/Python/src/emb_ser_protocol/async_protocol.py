@@ -0,0 +1,178 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import asyncio
+from emb_ser_protocol import protocol
+
+
+class serial_protocol(asyncio.Protocol):
+    """
+    Class for an asyncio protocol speaking the serial framing. Works over any asyncio transport, for
+    example loop.create_connection(lambda: serial_protocol(0x01), sock=sock) or a pySerial-asyncio
+    serial connection. Received chunks go straight into the parser and parsed messages come out of
+    the messages queue, or by iterating the protocol with async for.
+
+    Attributes:
+        parser: Parser decoding the received bytes
+        messages: asyncio.Queue of parsed messages
+        transport: Transport the protocol is attached to, None until connected
+    """
+
+    def __init__(self, addr=0x01, msg_parser=None):
+        """
+        Constructor for the serial_protocol class
+
+        Args:
+            addr: Address of this device, ignored when msg_parser is given
+            msg_parser: Parser to decode with, a new parser for addr is created when None
+        """
+        if msg_parser is None:
+            msg_parser = protocol.parser(addr)
+        self.parser = msg_parser
+        self.messages = asyncio.Queue()
+        self.transport = None
+        self._paused = False
+        self._drain_waiters = []
+        self._lost = False
+
+    def connection_made(self, transport):
+        """
+        Called by the event loop when the transport is connected.
+
+        Args:
+            transport: The connected transport
+        """
+        self.transport = transport
+
+    def data_received(self, data):
+        """
+        Called by the event loop with each received chunk. The chunk is decoded in one pass and any
+        completed messages are queued.
+
+        Args:
+            data: bytes received from the transport
+        """
+        self.parser.parse_input_buffer(data)
+        for msg in self.parser.check_for_parsed_messages():
+            self.messages.put_nowait(msg)
+
+    def connection_lost(self, exc):
+        """
+        Called by the event loop when the transport closes. Ends any async for loops over the protocol
+        and wakes any send waiting on drain.
+
+        Args:
+            exc: Exception that closed the connection, None on a clean close
+        """
+        self._lost = True
+        self.messages.put_nowait(None)
+        self._wake_drain_waiters()
+
+    def pause_writing(self):
+        """
+        Called by the transport when its write buffer goes over the high water mark.
+        """
+        self._paused = True
+
+    def resume_writing(self):
+        """
+        Called by the transport when its write buffer drains below the low water mark.
+        """
+        self._paused = False
+        self._wake_drain_waiters()
+
+    async def drain(self):
+        """
+        Wait until the transport write buffer has drained below its low water mark.
+        """
+        if self._lost:
+            raise ConnectionResetError("Connection lost")
+        if not self._paused:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._drain_waiters.append(waiter)
+        await waiter
+
+    async def send(self, type, addr, payload):
+        """
+        Build and send a message, then wait on drain() so a fast sender is held back by the transport
+        write buffer rather than growing it without bound.
+
+        Args:
+            type: Message type.
+            addr: Target address of the message.
+            payload: Payload of the message.
+
+        Returns:
+            The message that was sent.
+        """
+        msg = self.parser.build_message(type, addr, payload)
+        await self.send_message(msg)
+        return msg
+
+    async def send_message(self, msg):
+        """
+        Send an already built message and wait on drain().
+
+        Args:
+            msg: Message to send.
+        """
+        if self.transport is None or self._lost:
+            raise ConnectionResetError("Not connected")
+        self.transport.write(msg.to_bytes())
+        await self.drain()
+
+    async def recv(self):
+        """
+        Wait for the next parsed message.
+
+        Returns:
+            The next parsed message.
+        """
+        msg = await self.messages.get()
+        if msg is None:
+            # Leave the end marker for any other waiter
+            self.messages.put_nowait(None)
+            raise ConnectionResetError("Connection lost")
+        return msg
+
+    def close(self):
+        """
+        Close the transport.
+        """
+        if self.transport is not None:
+            self.transport.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.recv()
+        except ConnectionResetError:
+            raise StopAsyncIteration
+
+    def _wake_drain_waiters(self):
+        waiters = self._drain_waiters
+        self._drain_waiters = []
+        for waiter in waiters:
+            if not waiter.done():
+                if self._lost:
+                    waiter.set_exception(ConnectionResetError("Connection lost"))
+                else:
+                    waiter.set_result(None)
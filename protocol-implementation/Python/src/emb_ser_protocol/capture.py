@@ -0,0 +1,387 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import mmap
+import struct
+import time
+
+# Capture file layout: a file header, then records of a record header followed by the raw frame
+CAPTURE_MAGIC = b"ESPCAP"
+CAPTURE_VERSION = 1
+FILE_HEADER_STRUCT = struct.Struct("<6sBB")
+
+# Record header: timestamp in nanoseconds since the epoch, port id and frame length
+RECORD_STRUCT = struct.Struct("<QHI")
+
+# Sparse index sidecar, one entry per block of records: first record offset, end offset,
+# lowest and highest timestamp and a 256 bit bitmap of the message types in the block
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"ESPIDX"
+INDEX_STRUCT = struct.Struct("<QQQQ32s")
+
+# Byte position of the message type in a frame
+FRAME_TYPE_POS = 5
+
+
+class index_entry:
+    """
+    Class for one sparse index entry, covering a block of consecutive records
+
+    Attributes:
+        offset: File offset of the first record in the block
+        end: File offset just past the last record in the block
+        min_ts: Lowest record timestamp in the block, in nanoseconds
+        max_ts: Highest record timestamp in the block, in nanoseconds
+        types: Bitmask of the message types seen in the block, bit n set for type n
+    """
+    __slots__ = ("offset", "end", "min_ts", "max_ts", "types")
+
+    def __init__(self, offset, end, min_ts, max_ts, types):
+        """
+        Constructor for the index_entry class
+
+        Args:
+            offset: File offset of the first record in the block
+            end: File offset just past the last record in the block
+            min_ts: Lowest record timestamp in the block, in nanoseconds
+            max_ts: Highest record timestamp in the block, in nanoseconds
+            types: Bitmask of the message types seen in the block
+        """
+        self.offset = offset
+        self.end = end
+        self.min_ts = min_ts
+        self.max_ts = max_ts
+        self.types = types
+
+    def pack(self):
+        """
+        Pack the entry for the index sidecar
+
+        Returns:
+            bytes holding the packed entry
+        """
+        return INDEX_STRUCT.pack(self.offset, self.end, self.min_ts, self.max_ts,
+                                 self.types.to_bytes(32, "little"))
+
+
+# Convert a timestamp in seconds to nanoseconds, None means now
+def _to_ns(timestamp):
+    if timestamp is None:
+        return time.time_ns()
+    return int(timestamp * 1000000000)
+
+
+class capture_writer:
+    """
+    Class for a capture file writer. Every record holds a timestamp, a port id and the raw frame bytes
+    and is appended through a buffered file, so recording costs one small header pack and two buffered
+    writes per frame. Each block of index_interval records adds an entry to the sparse index sidecar
+    (path + INDEX_SUFFIX) that lets the reader skip straight to a time range or message type. The
+    writer is not thread safe, record from a single thread such as a serial_reader callback.
+
+    Attributes:
+        path: Path of the capture file
+        port: Port id recorded when a write does not give one
+        index_interval: Number of records per sparse index entry
+        records: Number of records written
+    """
+
+    def __init__(self, path, port=0, buffer_size=1 << 16, index_interval=1024):
+        """
+        Constructor for the capture_writer class. An existing capture at path is replaced.
+
+        Args:
+            path: Path of the capture file
+            port: Port id recorded when a write does not give one
+            buffer_size: Size of the write buffer in bytes
+            index_interval: Number of records per sparse index entry
+        """
+        if index_interval < 1:
+            raise Exception("Index interval must be at least 1")
+        self.path = path
+        self.port = port
+        self.index_interval = index_interval
+        self.records = 0
+        self._file = open(path, "wb", buffering=buffer_size)
+        self._index = open(path + INDEX_SUFFIX, "wb")
+        self._file.write(FILE_HEADER_STRUCT.pack(CAPTURE_MAGIC, CAPTURE_VERSION, 0))
+        self._index.write(FILE_HEADER_STRUCT.pack(INDEX_MAGIC, CAPTURE_VERSION, 0))
+        self._offset = FILE_HEADER_STRUCT.size
+        self._block = None
+        self._block_records = 0
+
+    def write_frame(self, frame, timestamp=None, port=None):
+        """
+        Append a raw frame to the capture.
+
+        Args:
+            frame: bytes-like object holding the encoded frame
+            timestamp: Time the frame was seen in seconds since the epoch, None for now
+            port: Port id of the record, None for the writer's port
+        """
+        ts = _to_ns(timestamp)
+        if port is None:
+            port = self.port
+        length = len(frame)
+        block = self._block
+        if block is None:
+            block = index_entry(self._offset, self._offset, ts, ts, 0)
+            self._block = block
+        elif ts < block.min_ts:
+            block.min_ts = ts
+        elif ts > block.max_ts:
+            block.max_ts = ts
+        if length > FRAME_TYPE_POS:
+            block.types |= 1 << frame[FRAME_TYPE_POS]
+        self._file.write(RECORD_STRUCT.pack(ts, port, length))
+        self._file.write(frame)
+        self._offset += RECORD_STRUCT.size + length
+        block.end = self._offset
+        self.records += 1
+        self._block_records += 1
+        if self._block_records == self.index_interval:
+            self._index.write(block.pack())
+            self._block = None
+            self._block_records = 0
+
+    def write_message(self, msg, timestamp=None, port=None):
+        """
+        Append a message to the capture as its encoded frame. Takes a single message so it can be
+        used directly as a parser handler, serial_reader callback or dispatcher wildcard.
+
+        Args:
+            msg: Message to record
+            timestamp: Time the message was seen in seconds since the epoch, None for now
+            port: Port id of the record, None for the writer's port
+        """
+        self.write_frame(msg.to_bytes(), timestamp, port)
+
+    __call__ = write_message
+
+    def flush(self):
+        """
+        Flush the buffered records to disk. The partial index block is left to the reader, which
+        indexes records past the last full block itself.
+        """
+        self._file.flush()
+        self._index.flush()
+
+    def close(self):
+        """
+        Write the index entry for the last partial block and close the capture.
+        """
+        if self._file.closed:
+            return
+        if self._block is not None:
+            self._index.write(self._block.pack())
+            self._block = None
+            self._block_records = 0
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class capture_reader:
+    """
+    Class for a capture file reader. The capture is memory mapped and records are yielded as
+    (timestamp, port, frame) tuples where frame is a memoryview into the mapping, so reading copies
+    nothing. The sparse index from the sidecar narrows a read to the blocks that can hold the
+    requested time range and message types. Records past the end of the sidecar, or a capture with no
+    sidecar at all, are indexed by scanning the record headers when the reader opens. A record cut
+    short by a crash while writing ends the capture.
+
+    Frames are only valid while the reader is open, copy them with bytes() to keep them.
+
+    Attributes:
+        path: Path of the capture file
+        index: List of index_entry covering every complete record in the capture
+    """
+
+    def __init__(self, path, index_interval=1024):
+        """
+        Constructor for the capture_reader class
+
+        Args:
+            path: Path of the capture file
+            index_interval: Number of records per index entry built for records the sidecar does not cover
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise Exception("Not a capture file: " + path)
+        self._view = memoryview(self._map)
+        if len(self._map) < FILE_HEADER_STRUCT.size or \
+                FILE_HEADER_STRUCT.unpack_from(self._map, 0)[:2] != (CAPTURE_MAGIC, CAPTURE_VERSION):
+            self.close()
+            raise Exception("Not a capture file: " + path)
+        self.index = self._load_index()
+        start = self.index[-1].end if self.index else FILE_HEADER_STRUCT.size
+        self.index.extend(self._build_index(start, index_interval))
+
+    def records(self, start=None, stop=None, msg_types=None, port=None):
+        """
+        Iterate over the records of the capture in file order.
+
+        Args:
+            start: Earliest timestamp to return in seconds since the epoch, None for no limit
+            stop: Timestamp in seconds to stop before, None for no limit
+            msg_types: Iterable of message types to return, None for every type
+            port: Port id to return, None for every port
+
+        Returns:
+            Generator of (timestamp, port, frame) tuples, timestamp in seconds and frame a memoryview
+        """
+        start_ns = None if start is None else _to_ns(start)
+        stop_ns = None if stop is None else _to_ns(stop)
+        type_mask = None
+        if msg_types is not None:
+            type_mask = 0
+            for msg_type in msg_types:
+                type_mask |= 1 << msg_type
+        unpack_from = RECORD_STRUCT.unpack_from
+        header_len = RECORD_STRUCT.size
+        view = self._view
+        for entry in self.index:
+            # Skip whole blocks that cannot hold a matching record
+            if start_ns is not None and entry.max_ts < start_ns:
+                continue
+            if stop_ns is not None and entry.min_ts >= stop_ns:
+                continue
+            if type_mask is not None and not entry.types & type_mask:
+                continue
+            pos = entry.offset
+            while pos < entry.end:
+                ts, rec_port, length = unpack_from(view, pos)
+                frame_start = pos + header_len
+                pos = frame_start + length
+                if start_ns is not None and ts < start_ns:
+                    continue
+                if stop_ns is not None and ts >= stop_ns:
+                    continue
+                if port is not None and rec_port != port:
+                    continue
+                if type_mask is not None and (length <= FRAME_TYPE_POS or
+                                              not type_mask >> view[frame_start + FRAME_TYPE_POS] & 1):
+                    continue
+                yield ts / 1000000000, rec_port, view[frame_start:pos]
+
+    __iter__ = records
+
+    def replay(self, msg_parser, start=None, stop=None, msg_types=None, port=None):
+        """
+        Feed the recorded frames into a parser, as if they had arrived on the link. Parsed messages
+        come out of the parser queue or its handler as usual.
+
+        Args:
+            msg_parser: Parser to feed
+            start: Earliest timestamp to replay in seconds since the epoch, None for no limit
+            stop: Timestamp in seconds to stop before, None for no limit
+            msg_types: Iterable of message types to replay, None for every type
+            port: Port id to replay, None for every port
+
+        Returns:
+            Number of frames fed to the parser
+        """
+        count = 0
+        for ts, rec_port, frame in self.records(start, stop, msg_types, port):
+            msg_parser.parse_input_buffer(frame)
+            count += 1
+        return count
+
+    def close(self):
+        """
+        Close the capture. Any frame memoryviews still held must be released first.
+        """
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+            self._map.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _load_index(self):
+        """
+        Load the sparse index sidecar, keeping only entries that lie within the capture.
+        """
+        index = []
+        try:
+            with open(self.path + INDEX_SUFFIX, "rb") as f:
+                data = f.read()
+        except OSError:
+            return index
+        if len(data) < FILE_HEADER_STRUCT.size:
+            return index
+        magic, version, flags = FILE_HEADER_STRUCT.unpack_from(data, 0)
+        if magic != INDEX_MAGIC or version != CAPTURE_VERSION:
+            return index
+        # Drop a partly written trailing entry
+        entries = data[FILE_HEADER_STRUCT.size:]
+        entries = entries[:len(entries) - len(entries) % INDEX_STRUCT.size]
+        expected = FILE_HEADER_STRUCT.size
+        size = len(self._map)
+        for offset, end, min_ts, max_ts, types in INDEX_STRUCT.iter_unpack(entries):
+            # Entries must tile the capture in order, anything else means a stale sidecar
+            if offset != expected or end > size or end <= offset:
+                break
+            index.append(index_entry(offset, end, min_ts, max_ts, int.from_bytes(types, "little")))
+            expected = end
+        return index
+
+    def _build_index(self, pos, interval):
+        """
+        Index the records from pos to the end of the capture by scanning their headers.
+        """
+        index = []
+        view = self._view
+        size = len(view)
+        header_len = RECORD_STRUCT.size
+        unpack_from = RECORD_STRUCT.unpack_from
+        entry = None
+        count = 0
+        while pos + header_len <= size:
+            ts, rec_port, length = unpack_from(view, pos)
+            end = pos + header_len + length
+            if end > size:
+                break
+            if entry is None:
+                entry = index_entry(pos, end, ts, ts, 0)
+                index.append(entry)
+            entry.min_ts = min(entry.min_ts, ts)
+            entry.max_ts = max(entry.max_ts, ts)
+            if length > FRAME_TYPE_POS:
+                entry.types |= 1 << view[pos + header_len + FRAME_TYPE_POS]
+            entry.end = end
+            pos = end
+            count += 1
+            if count == interval:
+                entry = None
+                count = 0
+        return index
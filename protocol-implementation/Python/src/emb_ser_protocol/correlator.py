@@ -0,0 +1,186 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import time
+from collections import deque
+from emb_ser_protocol import protocol
+
+
+class exchange:
+    """
+    Class for one command / response exchange tracked by the correlator
+
+    Attributes:
+        command: Message sent to the device
+        expected: Expected response message, used to match the response
+        response: Response message matched to the command, None if it never arrived
+        attempts: Number of times the command was sent
+        rtt: Round trip time in seconds from the last send to the response, None if it never arrived
+        timed_out: True if every attempt timed out
+    """
+    __slots__ = ("command", "expected", "response", "attempts", "rtt", "timed_out",
+                 "sent_at")
+
+    def __init__(self, command, expected):
+        """
+        Constructor for the exchange class
+
+        Args:
+            command: Message sent to the device
+            expected: Expected response message
+        """
+        self.command = command
+        self.expected = expected
+        self.response = None
+        self.attempts = 0
+        self.rtt = None
+        self.timed_out = False
+        self.sent_at = 0.0
+
+    def key(self):
+        """
+        Key responses are matched on
+
+        Returns:
+            Tuple of the expected response's source address and message type
+        """
+        return (self.expected.src_addr, self.expected.msg_type)
+
+
+class correlator:
+    """
+    Class for a pipelined command / response correlator. Keeps up to window commands in flight and
+    matches each parsed response to the oldest outstanding command expecting the same
+    (src_addr, msg_type). Commands that see no response within timeout seconds are resent up to
+    retries times.
+
+    Attributes:
+        window: Maximum number of commands in flight
+        timeout: Seconds to wait for a response before resending or giving up
+        retries: Number of times a command is resent after a timeout
+        unmatched: Parsed messages that did not match any outstanding command
+    """
+
+    def __init__(self, write, read, msg_parser, window=1, timeout=1.0, retries=0,
+                 clock=time.monotonic):
+        """
+        Constructor for the correlator class
+
+        Args:
+            write: Callable taking the bytes to send, e.g. ser.write
+            read: Callable returning received bytes, possibly empty, e.g. a short timeout ser.read
+            msg_parser: Parser used to decode the responses
+            window: Maximum number of commands in flight
+            timeout: Seconds to wait for a response before resending or giving up
+            retries: Number of times a command is resent after a timeout
+            clock: Monotonic clock returning seconds
+        """
+        if window < 1:
+            raise Exception("Window must be at least 1")
+        self.write = write
+        self.read = read
+        self.parser = msg_parser
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+        self.clock = clock
+        self.unmatched = []
+
+    def run(self, pairs):
+        """
+        Run a list of command / expected response pairs through the device.
+
+        Args:
+            pairs: Iterable of (command, expected_response) message tuples.
+
+        Returns:
+            List of exchanges in the same order as pairs.
+        """
+        exchanges = [exchange(command, expected) for command, expected in pairs]
+        pending = deque(exchanges)
+        outstanding = {}
+        in_flight = 0
+
+        while pending or in_flight:
+            # Fill the window, every newly admitted command goes out in a single write
+            burst = []
+            while pending and in_flight < self.window:
+                ex = pending.popleft()
+                outstanding.setdefault(ex.key(), deque()).append(ex)
+                burst.append(ex)
+                in_flight += 1
+            if burst:
+                self._send(burst)
+
+            # Match responses to the oldest outstanding command with the same key
+            data = self.read()
+            if data:
+                self.parser.parse_input_buffer(data)
+                now = self.clock()
+                for msg in self.parser.check_for_parsed_messages():
+                    waiting = outstanding.get((msg.src_addr, msg.msg_type))
+                    if waiting:
+                        ex = waiting.popleft()
+                        ex.response = msg
+                        ex.rtt = now - ex.sent_at
+                        in_flight -= 1
+                    else:
+                        self.unmatched.append(msg)
+
+            # Resend or give up on commands that have timed out
+            now = self.clock()
+            resend = []
+            for key, waiting in outstanding.items():
+                for ex in list(waiting):
+                    if now - ex.sent_at < self.timeout:
+                        continue
+                    if ex.attempts <= self.retries:
+                        resend.append(ex)
+                    else:
+                        waiting.remove(ex)
+                        ex.timed_out = True
+                        in_flight -= 1
+            if resend:
+                self._send(resend)
+        return exchanges
+
+    def _send(self, exchanges):
+        self.write(protocol.encode_many(ex.command for ex in exchanges))
+        now = self.clock()
+        for ex in exchanges:
+            ex.sent_at = now
+            ex.attempts += 1
+
+
+# Compute a latency percentile
+def percentile(values, pct):
+    """
+    Percentile of a list of values, picking the nearest sample rather than interpolating.
+
+    Args:
+        values: List of numbers.
+        pct: Percentile between 0 and 100.
+
+    Returns:
+        The percentile value, None for an empty list.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[rank]
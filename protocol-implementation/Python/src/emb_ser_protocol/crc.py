@@ -0,0 +1,78 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+# CRC-16 parameters used by the protocol (reflected 0x8005, a.k.a. CRC-16/MODBUS)
+CRC_POLY = 0xA001
+CRC_INIT = 0xFFFF
+
+
+# Build the 256 entry lookup table
+def _build_table():
+    """
+    Build the CRC lookup table. Entry n holds the result of running the bitwise
+    algorithm over a single byte n with a starting CRC of zero.
+
+    Returns:
+        List of 256 CRC values.
+    """
+    table = []
+    for n in range(256):
+        crc = n
+        for j in range(8):
+            if (crc & 0x0001):
+                crc = (crc >> 1) ^ CRC_POLY
+            else:
+                crc = crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC_TABLE = tuple(_build_table())
+
+
+# Fold a chunk of bytes into a running CRC
+def update(crc, chunk):
+    """
+    Fold a chunk of bytes into a running CRC. Chunks can be fed in as they arrive,
+    update(update(CRC_INIT, a), b) is equal to update(CRC_INIT, a + b).
+
+    Args:
+        crc: Running CRC value, start with CRC_INIT.
+        chunk: bytes, bytearray, memoryview or iterable of ints in 0..255.
+
+    Returns:
+        Updated CRC value.
+    """
+    table = CRC_TABLE
+    for byte in chunk:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+# Calculate the CRC of a complete block of bytes
+def crc16(data):
+    """
+    Calculate the CRC of a complete block of bytes.
+
+    Args:
+        data: bytes, bytearray, memoryview or iterable of ints in 0..255.
+
+    Returns:
+        CRC of the data.
+    """
+    return update(CRC_INIT, data)
@@ -0,0 +1,141 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+from emb_ser_protocol import crc as crc16
+from emb_ser_protocol.crc import CRC_INIT, CRC_TABLE
+from emb_ser_protocol.protocol import FRAME_OVERHEAD_LEN
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# True when NumPy is installed and the batch functions are vectorised
+HAVE_NUMPY = numpy is not None
+
+# Once fewer frames than this are still being folded the rest finish in pure Python, a handful of
+# long frames would otherwise pay the NumPy call overhead for every one of their bytes
+VECTOR_MIN_FRAMES = 32
+
+if HAVE_NUMPY:
+    _NP_TABLE = numpy.array(CRC_TABLE, dtype=numpy.uint16)
+
+
+# Compute the CRC of many frames at once with NumPy
+def _crc16_batch_numpy(frames):
+    """
+    Compute the CRC of every frame, less its two trailing CRC bytes, in one pass. The frames are
+    concatenated into one array and sorted longest first so the frames still being folded at byte j
+    are always a prefix, then byte j of every one of them is folded in with a single table lookup.
+
+    Args:
+        frames: List of bytes-like frames
+
+    Returns:
+        Tuple of the uint16 array of CRCs, the uint8 array of the concatenated frames and the int64
+        array of the offset each frame ends at
+    """
+    count = len(frames)
+    sizes = numpy.fromiter((len(f) for f in frames), dtype=numpy.int64, count=count)
+    ends = numpy.cumsum(sizes)
+    flat = numpy.frombuffer(b"".join(frames), dtype=numpy.uint8)
+    lengths = numpy.maximum(sizes - 2, 0)
+    order = numpy.argsort(-lengths, kind="stable")
+    starts = (ends - sizes)[order]
+    sorted_lengths = lengths[order]
+    crc = numpy.full(count, CRC_INIT, dtype=numpy.uint16)
+    table = _NP_TABLE
+
+    # active[j] is the number of frames longer than j bytes
+    longest = int(sorted_lengths[0]) if count else 0
+    active = numpy.searchsorted(-sorted_lengths, -numpy.arange(longest), side="left")
+    j = 0
+    while j < longest and active[j] >= VECTOR_MIN_FRAMES:
+        k = active[j]
+        c = crc[:k]
+        crc[:k] = (c >> 8) ^ table[(c ^ flat[starts[:k] + j]) & 0xFF]
+        j += 1
+
+    # Finish the few long frames left one at a time
+    if j < longest:
+        data = memoryview(flat)
+        for i in range(int(active[j])):
+            start = int(starts[i])
+            crc[i] = crc16.update(int(crc[i]), data[start + j:start + int(sorted_lengths[i])])
+
+    result = numpy.empty(count, dtype=numpy.uint16)
+    result[order] = crc
+    return result, flat, ends
+
+
+# Compute the CRC of many frames
+def crc16_batch(frames, use_numpy=None):
+    """
+    Compute the CRC each frame should carry, over everything but its two trailing CRC bytes. For a
+    well formed frame this is calculate_crc of the decoded message. With NumPy the table lookups are
+    vectorised across the frames, without it each frame goes through the pure Python table CRC.
+
+    Args:
+        frames: Iterable of bytes-like encoded frames, e.g. the frames of a capture_reader
+        use_numpy: True or False to force a path, None to use NumPy when it is installed
+
+    Returns:
+        numpy.ndarray of uint16 CRCs with NumPy, otherwise a list of ints
+    """
+    if use_numpy is None:
+        use_numpy = HAVE_NUMPY
+    frames = list(frames)
+    if use_numpy:
+        if not HAVE_NUMPY:
+            raise Exception("NumPy is not installed")
+        return _crc16_batch_numpy(frames)[0]
+    return [crc16.crc16(memoryview(f)[:-2]) for f in frames]
+
+
+# Validate the CRC of many frames
+def validate_batch(frames, use_numpy=None):
+    """
+    Check the trailing CRC of many frames at once. Frames shorter than a frame with an empty payload
+    are never valid.
+
+    Args:
+        frames: Iterable of bytes-like encoded frames, e.g. the frames of a capture_reader
+        use_numpy: True or False to force a path, None to use NumPy when it is installed
+
+    Returns:
+        numpy.ndarray of bools with NumPy, otherwise a list of bools, True for frames whose CRC matches
+    """
+    if use_numpy is None:
+        use_numpy = HAVE_NUMPY
+    frames = list(frames)
+    if use_numpy:
+        if not HAVE_NUMPY:
+            raise Exception("NumPy is not installed")
+        crc, flat, ends = _crc16_batch_numpy(frames)
+        mask = numpy.diff(ends, prepend=0) >= FRAME_OVERHEAD_LEN
+        last = ends[mask]
+        stored = numpy.zeros(len(frames), dtype=numpy.uint16)
+        stored[mask] = flat[last - 2].astype(numpy.uint16) << 8 | flat[last - 1]
+        return mask & (stored == crc)
+    valid = []
+    for f in frames:
+        if len(f) < FRAME_OVERHEAD_LEN:
+            valid.append(False)
+        else:
+            valid.append(f[-2] << 8 | f[-1] == crc16.crc16(memoryview(f)[:-2]))
+    return valid
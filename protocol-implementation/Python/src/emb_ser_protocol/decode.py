@@ -0,0 +1,177 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import bisect
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from emb_ser_protocol import crc as crc16
+from emb_ser_protocol.protocol import (HEADER, HEADER_CRC, FRAME_HEADER_LEN, FRAME_OVERHEAD_LEN,
+                                       MAX_MSG_LEN, message, payload_bytes)
+
+# Smallest chunk handed to a worker, smaller chunks cost more in process overhead than they save
+MIN_CHUNK_SIZE = 1 << 20
+
+
+# Scan a region of a raw dump for frames
+def _scan(data, view, pos, limit, addr, sync=None):
+    """
+    Scan data from pos for frames starting before limit. A frame is accepted when its length is legal,
+    it fits in data and its CRC matches, the scan then continues after the frame. Anything else is a
+    false header and the scan continues from the byte after it. The next position scanned depends
+    only on the current one, which is what lets separately decoded chunks be stitched together.
+
+    Args:
+        data: Raw bytes with a find method (bytes, mmap)
+        view: memoryview of data
+        pos: Position to start scanning at
+        limit: Frames starting at or past limit are left for the next chunk
+        addr: Only return frames for this target address, None for every frame
+        sync: Set of frame start positions to stop at, None to scan to limit
+
+    Returns:
+        Tuple of the list of (start, message) for the returned frames, the list of every accepted
+        frame start, the position the scan stopped at and the sync position reached or None
+    """
+    found = []
+    starts = []
+    n = len(data)
+    while True:
+        start = data.find(HEADER, pos)
+        if start < 0:
+            return found, starts, n, None
+        if start >= limit:
+            return found, starts, start, None
+        if n - start < FRAME_HEADER_LEN:
+            pos = start + 1
+            continue
+        src_addr, tgt_addr, msg_type, len_msb, len_lsb = view[start + 3:start + FRAME_HEADER_LEN]
+        msg_len = len_msb << 8 | len_lsb
+        end = start + FRAME_OVERHEAD_LEN + msg_len
+        if msg_len > MAX_MSG_LEN or end > n:
+            pos = start + 1
+            continue
+        msg_crc = view[end - 2] << 8 | view[end - 1]
+        if msg_crc != crc16.update(HEADER_CRC, view[start + 3:end - 2]):
+            pos = start + 1
+            continue
+        if sync is not None and start in sync:
+            return found, starts, start, start
+        starts.append(start)
+        if addr is None or tgt_addr == addr:
+            found.append((start, message(msg_type, src_addr, tgt_addr, msg_len,
+                                         payload_bytes(view[start + FRAME_HEADER_LEN:end - 2]),
+                                         msg_crc)))
+        pos = end
+
+
+# Decode one chunk of a dump in a worker process
+def _decode_chunk(path, begin, limit, addr):
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            try:
+                # Frame payloads are copies, nothing returned refers to the mapping
+                return _scan(data, view, begin, limit, addr)[:3]
+            finally:
+                view.release()
+
+
+# Decode a buffer of raw bytes in one pass
+def decode_buffer(data, addr=None):
+    """
+    Decode every frame in a buffer of raw bytes, single threaded. This is the reference decode_file
+    matches.
+
+    Args:
+        data: bytes, bytearray or mmap holding the raw stream
+        addr: Only return frames for this target address, None for every frame
+
+    Returns:
+        List of messages in stream order
+    """
+    with memoryview(data) as view:
+        found = _scan(data, view, 0, len(data), addr)[0]
+    return [msg for start, msg in found]
+
+
+# Decode a raw byte dump across several processes
+def decode_file(path, workers=None, addr=None, chunk_size=None):
+    """
+    Decode every frame in a raw byte dump, splitting the file into chunks decoded in parallel by a
+    ProcessPoolExecutor. Each worker resyncs at the first header after its chunk boundary whose frame
+    passes the CRC, and decodes every frame starting inside its chunk, reading past the boundary to
+    finish the last one. Chunks are merged in file order. Where a frame straddles a boundary the next
+    chunk's decode is checked against the position the previous chunk stopped at, and any frames a
+    worker resynced onto by mistake (a header inside the straddling frame) are replaced by decoding
+    serially until the two agree. The result is always identical to decode_buffer over the whole file.
+
+    Args:
+        path: Path of the raw dump
+        workers: Number of worker processes, None for the number of CPUs, 1 to decode in process
+        addr: Only return frames for this target address, None for every frame
+        chunk_size: Bytes per chunk, None to split the file into a few chunks per worker
+
+    Returns:
+        List of messages in stream order
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    if chunk_size is None:
+        chunk_size = max(MIN_CHUNK_SIZE, -(-size // (workers * 4)))
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            try:
+                if workers == 1 or size <= chunk_size:
+                    return [msg for start, msg in _scan(data, view, 0, size, addr)[0]]
+                bounds = list(range(0, size, chunk_size)) + [size]
+                with ProcessPoolExecutor(workers) as pool:
+                    results = pool.map(_decode_chunk, [path] * (len(bounds) - 1), bounds[:-1],
+                                       bounds[1:], [addr] * (len(bounds) - 1))
+                    return _merge(data, view, bounds, results, addr)
+            finally:
+                view.release()
+
+
+# Stitch the decoded chunks together in order
+def _merge(data, view, bounds, results, addr):
+    messages = []
+    stop = 0
+    for i, (found, starts, chunk_stop) in enumerate(results):
+        begin = bounds[i]
+        first = data.find(HEADER, begin)
+        # In sync when scanning on from where the last chunk stopped reaches this chunk's first header
+        if i == 0 or data.find(HEADER, stop) == first:
+            messages.extend(msg for start, msg in found)
+            stop = chunk_stop
+            continue
+        # A frame straddled the boundary, decode serially until reaching a frame the worker also found
+        serial, serial_starts, serial_stop, hit = _scan(data, view, stop, bounds[i + 1], addr,
+                                                        set(starts))
+        messages.extend(msg for start, msg in serial)
+        if hit is None:
+            stop = serial_stop
+        else:
+            keep = bisect.bisect_left([start for start, msg in found], hit)
+            messages.extend(msg for start, msg in found[keep:])
+            stop = chunk_stop
+    return messages
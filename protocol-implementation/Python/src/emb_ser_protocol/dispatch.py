@@ -0,0 +1,145 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+# Matches any source address when registering a handler
+ANY_ADDR = None
+
+
+class dispatcher:
+    """
+    Class for a message dispatcher. Handlers are registered per message type, optionally narrowed to
+    a single source address, and looked up through 256 entry tables indexed by msg_type and src_addr
+    so dispatch costs the same whatever the number of handlers. Wildcard handlers see every message,
+    the default handler sees messages no handler was registered for.
+
+    Attach it to a parser with parser.handler = dispatcher.dispatch (or pass handler= to the parser)
+    and handlers run as each frame completes, inside the parser call and with the parser lock held,
+    instead of messages going through the parsed message queue.
+
+    A handler that raises does not stop the others or the parser. The exception is counted in errors
+    and passed to error_handler.
+
+    Attributes:
+        default: Handler for messages with no registered handler, None to drop them
+        wildcards: Handlers called for every message before the matched handler
+        error_handler: Callable given (msg, exception) when a handler raises, None to only count
+        errors: Number of handler calls that raised
+    """
+
+    def __init__(self, default=None, error_handler=None):
+        """
+        Constructor for the dispatcher class
+
+        Args:
+            default: Handler for messages with no registered handler, None to drop them
+            error_handler: Callable given (msg, exception) when a handler raises, None to only count
+        """
+        self.default = default
+        self.error_handler = error_handler
+        self.errors = 0
+        self.wildcards = []
+        self._by_type = [None] * 256
+        self._by_type_src = [None] * 256
+
+    def register(self, msg_type, handler, src_addr=ANY_ADDR):
+        """
+        Register a handler for a message type. A handler registered for a specific source address
+        takes precedence over one registered for ANY_ADDR.
+
+        Args:
+            msg_type: Message type to handle
+            handler: Callable taking the message
+            src_addr: Source address to handle, ANY_ADDR for every source
+        """
+        if src_addr is ANY_ADDR:
+            self._by_type[msg_type] = handler
+        else:
+            table = self._by_type_src[msg_type]
+            if table is None:
+                table = [None] * 256
+                self._by_type_src[msg_type] = table
+            table[src_addr] = handler
+
+    def unregister(self, msg_type, src_addr=ANY_ADDR):
+        """
+        Remove a handler registered with register.
+
+        Args:
+            msg_type: Message type the handler was registered for
+            src_addr: Source address the handler was registered for
+        """
+        if src_addr is ANY_ADDR:
+            self._by_type[msg_type] = None
+        elif self._by_type_src[msg_type] is not None:
+            self._by_type_src[msg_type][src_addr] = None
+
+    def add_wildcard(self, handler):
+        """
+        Register a handler called for every message, for logging or capture.
+
+        Args:
+            handler: Callable taking the message
+        """
+        self.wildcards.append(handler)
+
+    def lookup(self, msg_type, src_addr):
+        """
+        Find the handler a message would be dispatched to, ignoring wildcards.
+
+        Args:
+            msg_type: Message type
+            src_addr: Source address
+
+        Returns:
+            The matching handler, the default handler, or None
+        """
+        table = self._by_type_src[msg_type]
+        if table is not None:
+            handler = table[src_addr]
+            if handler is not None:
+                return handler
+        handler = self._by_type[msg_type]
+        if handler is not None:
+            return handler
+        return self.default
+
+    def dispatch(self, msg):
+        """
+        Dispatch a message to the wildcard handlers and then its matched handler.
+
+        Args:
+            msg: Message to dispatch
+        """
+        for handler in self.wildcards:
+            self._call(handler, msg)
+        handler = self.lookup(msg.msg_type, msg.src_addr)
+        if handler is not None:
+            self._call(handler, msg)
+
+    def _call(self, handler, msg):
+        """
+        Call a handler, counting and reporting any exception it raises.
+        """
+        try:
+            handler(msg)
+        except Exception as e:
+            self.errors += 1
+            if self.error_handler is not None:
+                self.error_handler(msg, e)
+
+    __call__ = dispatch
@@ -0,0 +1,233 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import time
+from collections import deque
+from random import Random
+from emb_ser_protocol import protocol
+from emb_ser_protocol.correlator import percentile
+
+
+class load_generator:
+    """
+    Class for a load generator measuring the sustained frame rate and round trip latency of a
+    device. Requests are sent at a target rate, or as fast as the window allows, with payload sizes
+    drawn from a weighted distribution. Each response is matched to the oldest outstanding request,
+    so the device must answer in order. A request with no response within timeout seconds is lost.
+
+    Responses carry nothing that ties them to a request, so a late response cannot be told apart
+    from a timely one. After a request times out nothing is sent for guard seconds, and responses
+    arriving in that time are counted as late and discarded rather than paired with a later request.
+    The limits: responses to requests still in flight behind the lost one are discarded with them
+    and those requests count as lost too, and a response later than timeout plus guard still shifts
+    the pairing until the next timeout.
+
+    Attributes:
+        window: Maximum number of requests in flight
+        rate: Target requests per second, 0 to send as fast as the window allows
+        timeout: Seconds to wait for a response before counting the request as lost
+        guard: Seconds after a timeout during which nothing is sent and responses are discarded
+        msg_type: Message type of the requests
+        target_addr: Address the requests are sent to
+        response_type: Message type of the responses
+        response_addr: Source address of the responses
+        sizes: List of the payload sizes requests are drawn from
+        weights: Cumulative weights of the payload sizes
+    """
+
+    def __init__(self, write, read, msg_parser, msg_type, target_addr, response_type=None,
+                 response_addr=None, payload_sizes=(0,), window=1, rate=0.0, timeout=1.0,
+                 seed=None, guard=None, clock=time.monotonic):
+        """
+        Constructor for the load_generator class
+
+        Args:
+            write: Callable taking the bytes to send, e.g. ser.write
+            read: Callable returning received bytes, possibly empty, e.g. a short timeout ser.read
+            msg_parser: Parser decoding the responses, requests are sent from its address
+            msg_type: Message type of the requests
+            target_addr: Address the requests are sent to
+            response_type: Message type of the responses, None for the request type
+            response_addr: Source address of the responses, None for the target address. On a
+                loopback the requests come back as they were sent, pass the parser's address and a
+                promiscuous parser
+            payload_sizes: List of payload sizes, or of (size, weight) pairs, requests draw from
+            window: Maximum number of requests in flight
+            rate: Target requests per second, 0 to send as fast as the window allows
+            timeout: Seconds to wait for a response before counting the request as lost
+            seed: Seed for the payload sizes and contents, None for a random seed
+            guard: Seconds after a timeout during which nothing is sent and responses are discarded,
+                None for the timeout
+            clock: Monotonic clock returning seconds
+        """
+        if window < 1:
+            raise Exception("Window must be at least 1")
+        self.write = write
+        self.read = read
+        self.parser = msg_parser
+        self.msg_type = msg_type
+        self.target_addr = target_addr
+        self.response_type = msg_type if response_type is None else response_type
+        self.response_addr = target_addr if response_addr is None else response_addr
+        self.window = window
+        self.rate = rate
+        self.timeout = timeout
+        self.guard = timeout if guard is None else guard
+        self.clock = clock
+        self._rng = Random(seed)
+
+        # Payload sizes and their cumulative weights
+        self.sizes = []
+        self.weights = []
+        total = 0.0
+        for entry in payload_sizes:
+            size, weight = (entry, 1.0) if isinstance(entry, int) else entry
+            if size < 0 or size > protocol.MAX_MSG_LEN:
+                raise Exception("Payload size out of range: " + str(size))
+            total += weight
+            self.sizes.append(size)
+            self.weights.append(total)
+        if len(self.sizes) == 0 or total <= 0:
+            raise Exception("No payload sizes to draw from")
+
+        # Payloads are slices of one random block, so building a request costs no random draws
+        self._block = bytes(self._rng.getrandbits(8) for i in range(max(self.sizes)))
+
+    def run(self, count=0, duration=0.0):
+        """
+        Run the load until count requests have been sent or duration seconds have passed, then wait
+        for the outstanding responses.
+
+        Args:
+            count: Number of requests to send, 0 for no limit
+            duration: Seconds to send for, 0 for no limit
+
+        Returns:
+            Dictionary report of the run, see report()
+        """
+        if count <= 0 and duration <= 0:
+            raise Exception("Either a count or a duration is needed")
+        rng = self._rng
+        choose = rng.choices
+        build = self.parser.build_message
+        response_key = (self.response_addr, self.response_type)
+        stats = self.parser.stats
+        crc_failures = stats.crc_failures
+
+        outstanding = deque()
+        rtts = []
+        sent = 0
+        tx_bytes = 0
+        rx_bytes = 0
+        lost = 0
+        late = 0
+        unexpected = 0
+        guard_until = None
+        start = self.clock()
+        end = start + duration if duration > 0 else None
+        next_send = start
+        sending = True
+
+        while sending or outstanding:
+            now = self.clock()
+            if sending and ((count > 0 and sent >= count) or (end is not None and now >= end)):
+                sending = False
+
+            # Fill the window, never ahead of the target rate
+            burst = []
+            while sending and len(outstanding) + len(burst) < self.window and now >= next_send:
+                size = choose(self.sizes, cum_weights=self.weights)[0]
+                burst.append(build(self.msg_type, self.target_addr, self._block[:size]))
+                sent += 1
+                if self.rate > 0:
+                    next_send += 1.0 / self.rate
+                if count > 0 and sent >= count:
+                    break
+            if burst:
+                data = protocol.encode_many(burst)
+                self.write(data)
+                tx_bytes += len(data)
+                now = self.clock()
+                for msg in burst:
+                    outstanding.append(now)
+
+            # Match responses to the oldest outstanding request, unless they may be late
+            data = self.read()
+            if data:
+                self.parser.parse_input_buffer(data)
+                now = self.clock()
+                guarded = guard_until is not None and now < guard_until
+                for msg in self.parser.check_for_parsed_messages():
+                    if (msg.src_addr, msg.msg_type) != response_key:
+                        unexpected += 1
+                    elif guarded:
+                        late += 1
+                    elif outstanding:
+                        rtts.append(now - outstanding.popleft())
+                        rx_bytes += msg.msg_len + protocol.FRAME_OVERHEAD_LEN
+                    else:
+                        unexpected += 1
+
+            # Requests waiting longer than the timeout are lost, and start the guard
+            now = self.clock()
+            while outstanding and now - outstanding[0] >= self.timeout:
+                outstanding.popleft()
+                lost += 1
+                guard_until = now + self.guard
+                next_send = max(next_send, guard_until)
+
+        return self.report(start, self.clock(), sent, rtts, lost, late, unexpected,
+                           stats.crc_failures - crc_failures, tx_bytes, rx_bytes)
+
+    def report(self, start, stop, sent, rtts, lost, late, unexpected, crc_errors, tx_bytes,
+               rx_bytes):
+        """
+        Build the report of a run.
+
+        Returns:
+            Dictionary of the requests sent, responses received, losses, late responses discarded,
+            CRC errors, unexpected messages, achieved throughput and the round trip percentiles in milliseconds
+        """
+        seconds = stop - start
+        received = len(rtts)
+        rtt_ms = None
+        if received > 0:
+            rtt_ms = {
+                "min": min(rtts) * 1000,
+                "mean": sum(rtts) / received * 1000,
+                "p50": percentile(rtts, 50) * 1000,
+                "p99": percentile(rtts, 99) * 1000,
+                "p999": percentile(rtts, 99.9) * 1000,
+                "max": max(rtts) * 1000,
+            }
+        return {
+            "sent": sent,
+            "received": received,
+            "lost": lost,
+            "loss_ratio": lost / float(sent) if sent else 0.0,
+            "late": late,
+            "crc_errors": crc_errors,
+            "unexpected": unexpected,
+            "seconds": seconds,
+            "window": self.window,
+            "target_rate": self.rate,
+            "frames_per_second": received / seconds if seconds > 0 else None,
+            "tx_bytes_per_second": tx_bytes / seconds if seconds > 0 else None,
+            "rx_bytes_per_second": rx_bytes / seconds if seconds > 0 else None,
+            "rtt_ms": rtt_ms,
+        }
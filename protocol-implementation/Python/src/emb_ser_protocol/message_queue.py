@@ -0,0 +1,152 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import threading
+from collections import deque
+from enum import Enum
+
+
+# Enumeration of what a full queue does with a new message
+class overflow_policy(Enum):
+    DROP_OLDEST = 0
+    DROP_NEWEST = 1
+    BLOCK = 2
+
+
+class message_queue:
+    """
+    Class for a bounded, thread safe queue of parsed messages. Backed by a deque, put, pop and drain
+    are O(1) per message and drain hands back the queued messages without copying and clearing a
+    list. A full queue either drops its oldest message, drops the new message or blocks the producer
+    until a consumer makes room. BLOCK only makes sense when the consumer runs on another thread.
+
+    Attributes:
+        capacity: Maximum number of queued messages, 0 for unbounded
+        policy: What a full queue does with a new message
+        accepted: Number of messages accepted into the queue
+        dropped: Number of messages dropped because the queue was full
+    """
+
+    def __init__(self, capacity=0, policy=overflow_policy.DROP_OLDEST):
+        """
+        Constructor for the message_queue class
+
+        Args:
+            capacity: Maximum number of queued messages, 0 for unbounded
+            policy: What a full queue does with a new message
+        """
+        self.capacity = capacity
+        self.policy = policy
+        self.accepted = 0
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition(threading.Lock())
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, msg, timeout=None):
+        """
+        Queue a message, applying the overflow policy if the queue is full.
+
+        Args:
+            msg: Message to queue
+            timeout: Seconds a BLOCK queue waits for room, None to wait forever
+
+        Returns:
+            True if the message was queued, False if it was dropped
+        """
+        with self._cond:
+            if self.capacity and len(self._items) >= self.capacity:
+                if self.policy == overflow_policy.DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                elif self.policy == overflow_policy.DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                elif not self._cond.wait_for(
+                        lambda: len(self._items) < self.capacity, timeout):
+                    self.dropped += 1
+                    return False
+            self._items.append(msg)
+            self.accepted += 1
+            self._cond.notify_all()
+            return True
+
+    def pop(self, timeout=0):
+        """
+        Take the oldest message off the queue.
+
+        Args:
+            timeout: Seconds to wait for a message, 0 to return at once, None to wait forever
+
+        Returns:
+            The oldest message, or None if the queue stayed empty
+        """
+        with self._cond:
+            if not self._items:
+                if timeout == 0 or not self._cond.wait_for(lambda: self._items, timeout):
+                    return None
+            msg = self._items.popleft()
+            self._cond.notify_all()
+            return msg
+
+    def drain(self, max_n=None):
+        """
+        Take up to max_n of the oldest messages off the queue.
+
+        Args:
+            max_n: Maximum number of messages to take, None for all of them
+
+        Returns:
+            List of messages, oldest first, empty if the queue is empty
+        """
+        with self._cond:
+            if not self._items:
+                return []
+            if max_n is None or max_n >= len(self._items):
+                items = self._items
+                self._items = deque()
+            else:
+                popleft = self._items.popleft
+                items = [popleft() for i in range(max_n)]
+            self._cond.notify_all()
+        return list(items)
+
+    def clear(self):
+        """
+        Drop every queued message without counting them as dropped.
+        """
+        with self._cond:
+            self._items.clear()
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        Snapshot of the queue counters.
+
+        Returns:
+            Dictionary of the queue length, capacity and accepted / dropped counts
+        """
+        with self._cond:
+            return {
+                "length": len(self._items),
+                "capacity": self.capacity,
+                "accepted": self.accepted,
+                "dropped": self.dropped
+            }
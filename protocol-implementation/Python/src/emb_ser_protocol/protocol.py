@@ -16,14 +16,23 @@
 #Contact: budgettsfrog@protonmail.com
 #GitHub: https://github.com/warrenwoolseyiii
 
+import struct
+import sys
+import threading
+import time
+import types
 from enum import Enum
 from emb_ser_protocol import version as ver
+from emb_ser_protocol import crc as crc16
+from emb_ser_protocol.crc import CRC_TABLE
+from emb_ser_protocol.message_queue import message_queue, overflow_policy
 
 
 # Enumeration of errors in the state machine
 class error_state(Enum):
     NO_ERROR = 0
     ILLEGAL_MESSAGE_LENGTH = 1
+    CRC_MISMATCH = 2
 
 
 # Enumeration of the states in the state machine
@@ -39,6 +48,7 @@ class parsing_state(Enum):
     PAYLOAD_START_POS = 8
     CRC_POS_1 = 9
     CRC_POS_2 = 10
+    SKIP_POS = 11
 
 
 # Constant values for the protocol
@@ -46,16 +56,59 @@ HEADER_BYTE0 = 0xAA
 HEADER_BYTE1 = 0x55
 HEADER_BYTE2 = 0xFF
 
+# Header as a byte string, used by the buffer scanner to locate frames
+HEADER = bytes([HEADER_BYTE0, HEADER_BYTE1, HEADER_BYTE2])
+
+# Frame layout: header, addresses, type and length, payload, then two CRC bytes
+FRAME_HEADER_LEN = 8
+FRAME_OVERHEAD_LEN = 10
+
+# Packed layouts of the frame header and trailing CRC
+HEADER_STRUCT = struct.Struct(">3sBBBH")
+CRC_STRUCT = struct.Struct(">H")
+
+# Running CRC after the three header bytes, every frame starts from this value
+HEADER_CRC = crc16.crc16(HEADER)
+
 # User address, you can change this to whatever you want
 my_addr = 0x01
 
 # Maximum allowable length, you can change this - there is a maximum value of 65535 bytes
 MAX_MSG_LEN = 65535
 
+# Largest single read iter_messages makes from a stream
+DEFAULT_CHUNK_SIZE = 4096
+
+
+class payload_bytes(bytes):
+    """
+    Class for a message payload. A plain bytes object that also compares equal to a list or tuple
+    of ints holding the same values, so code written against the old list payloads keeps working.
+    """
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple)):
+            try:
+                return bytes.__eq__(self, bytes(other))
+            except (TypeError, ValueError):
+                return False
+        return bytes.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = bytes.__hash__
+
+
+# Shared empty payload, saves building one for every state machine reset
+EMPTY_PAYLOAD = payload_bytes()
+
 
 class message:
     """
-    Class for a message
+    Class for a message. Messages are slotted and hold their payload as payload_bytes, one byte per
+    payload byte rather than a list of ints.
 
     Attributes:
         error: Error state of the message
@@ -65,14 +118,11 @@ class message:
         msg_len: Length of the message payload in bytes
         msg_payload: Payload of the message
         msg_crc: CRC of the message
+        matched_addr: Local or broadcast address of the parser that accepted the message, None when
+            no address matched (messages built locally, or passed on by a promiscuous parser)
     """
-    error = error_state.NO_ERROR
-    msg_type = 0
-    src_addr = 0
-    tgt_addr = 0
-    msg_len = 0
-    msg_payload = []
-    msg_crc = 0
+    __slots__ = ("error", "msg_type", "src_addr", "tgt_addr", "msg_len",
+                 "msg_payload", "msg_crc", "matched_addr")
 
     def __init__(self, msg_type, src_addr, tgt_addr, msg_len, msg_payload, msg_crc):
         """
@@ -83,9 +133,11 @@ class message:
             src_addr: Source address of the message (sender)
             tgt_addr: Target address of the message (receiver)
             msg_len: Length of the message payload in bytes
-            msg_payload: Payload of the message
+            msg_payload: Payload of the message, any bytes-like object or list of ints
             msg_crc: CRC of the message
         """
+        if not isinstance(msg_payload, payload_bytes):
+            msg_payload = payload_bytes(msg_payload)
         self.error = error_state.NO_ERROR
         self.msg_type = msg_type
         self.src_addr = src_addr
@@ -93,6 +145,46 @@ class message:
         self.msg_len = msg_len
         self.msg_payload = msg_payload
         self.msg_crc = msg_crc
+        self.matched_addr = None
+
+    def __eq__(self, other):
+        """
+        Two messages are equal when all of their fields are equal
+
+        Returns:
+            True if the messages are equal
+        """
+        if not isinstance(other, message):
+            return NotImplemented
+        return (self.msg_type == other.msg_type and self.src_addr == other.src_addr and
+                self.tgt_addr == other.tgt_addr and self.msg_len == other.msg_len and
+                self.msg_payload == other.msg_payload and self.msg_crc == other.msg_crc and
+                self.error == other.error)
+
+    def __hash__(self):
+        """
+        Hash of the fields compared by __eq__, so equal messages can be used in sets and as dict
+        keys. Do not change a message's fields while it is in a set or used as a key.
+
+        Returns:
+            Hash of the message fields
+        """
+        return hash((self.msg_type, self.src_addr, self.tgt_addr, self.msg_len,
+                     bytes(self.msg_payload), self.msg_crc, self.error))
+
+    def __reduce__(self):
+        """
+        Pickle the message as a constructor call, much cheaper than the default for slotted objects
+        when messages are passed between processes.
+
+        Returns:
+            Tuple of the class and its constructor arguments, plus the matched address when set
+        """
+        args = (self.msg_type, self.src_addr, self.tgt_addr, self.msg_len,
+                bytes(self.msg_payload), self.msg_crc)
+        if self.matched_addr is None:
+            return (message, args)
+        return (message, args, (None, {"matched_addr": self.matched_addr}))
 
     def __str__(self):
         """
@@ -103,7 +195,7 @@ class message:
         """
         return "msg_type: {}, src_addr: {}, tgt_addr: {}, msg_len: {}, msg_payload: {}, msg_crc: {}, error: {}".format(
             hex(self.msg_type), hex(self.src_addr), hex(self.tgt_addr),
-            hex(self.msg_len), self.msg_payload, hex(self.msg_crc), self.error)
+            hex(self.msg_len), list(self.msg_payload), hex(self.msg_crc), self.error)
 
     def to_list(self):
         """
@@ -127,16 +219,925 @@ class message:
         msg_list.append(self.msg_crc & 0xFF)
         return msg_list
 
+    def frame_len(self):
+        """
+        Length of the message on the wire
+
+        Returns:
+            Number of bytes in the encoded frame
+        """
+        return FRAME_OVERHEAD_LEN + self.msg_len
+
+    def to_bytes(self):
+        """
+        Convert the message to the bytes sent on the wire
+
+        Returns:
+            bytes object holding the encoded frame
+        """
+        return b"".join((HEADER_STRUCT.pack(HEADER, self.src_addr, self.tgt_addr,
+                                            self.msg_type, self.msg_len),
+                         self._payload(), CRC_STRUCT.pack(self.msg_crc & 0xFFFF)))
+
+    def encode_into(self, buf, offset=0):
+        """
+        Encode the message into a preallocated buffer. The header and CRC are packed in place and the
+        payload is copied with a single slice assignment.
+
+        Args:
+            buf: Writable buffer (bytearray, memoryview, mmap, ...) with frame_len() bytes free at offset
+            offset: Position in buf to write the frame at
+
+        Returns:
+            Offset just past the encoded frame
+        """
+        HEADER_STRUCT.pack_into(buf, offset, HEADER, self.src_addr, self.tgt_addr,
+                                self.msg_type, self.msg_len)
+        start = offset + FRAME_HEADER_LEN
+        end = start + self.msg_len
+        with memoryview(buf) as view:
+            view[start:end] = self._payload()
+        CRC_STRUCT.pack_into(buf, end, self.msg_crc & 0xFFFF)
+        return end + 2
+
+    def _payload(self):
+        if len(self.msg_payload) != self.msg_len:
+            return self.msg_payload[:self.msg_len]
+        return self.msg_payload
+
+
+# Calculate the CRC of the message
+def calculate_crc(msg):
+    """
+    Calculate the CRC of the message.
+
+    Args:
+        msg: Message to calculate the CRC of
+    """
+    crc = crc16.update(HEADER_CRC, (msg.src_addr & 0xFF, msg.tgt_addr & 0xFF,
+                                    msg.msg_type & 0xFF, msg.msg_len >> 8 & 0xFF,
+                                    msg.msg_len & 0xFF))
+    payload = msg.msg_payload
+    if len(payload) != msg.msg_len:
+        payload = payload[:msg.msg_len]
+    return crc16.update(crc, payload)
+
+
+class parser_stats:
+    """
+    Class for the parser counters. The counters are always on, each is a single integer add on a
+    path the parser takes anyway. The latency counters only move while timing is enabled on the parser.
+
+    Attributes:
+        bytes_in: Bytes passed to the parser
+        frames_ok: Frames that passed the CRC and were handed on
+        crc_failures: Headers for this parser (every header when promiscuous or validating foreign
+            CRCs) dropped as false because the frame failed the CRC
+        addr_mismatches: Complete frames dropped because they were addressed to another device
+        resyncs: Headers found after the parser had to discard bytes to get back in sync
+        oversize_lengths: Headers dropped as false because their length field was over MAX_MSG_LEN
+        bytes_discarded: Bytes outside any frame dropped while hunting for a header, including the
+            first byte of every false header
+        latency_count: Frames timed from their first header byte to notify
+        latency_total: Sum of the frame latencies in seconds
+        latency_max: Largest frame latency in seconds
+    """
+    __slots__ = ("bytes_in", "frames_ok", "crc_failures", "addr_mismatches", "resyncs",
+                 "oversize_lengths", "bytes_discarded", "latency_count", "latency_total",
+                 "latency_max")
+
+    def __init__(self):
+        """
+        Constructor for the parser_stats class
+        """
+        self.bytes_in = 0
+        self.frames_ok = 0
+        self.crc_failures = 0
+        self.addr_mismatches = 0
+        self.resyncs = 0
+        self.oversize_lengths = 0
+        self.bytes_discarded = 0
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def snapshot(self):
+        """
+        Snapshot of the counters
+
+        Returns:
+            Dictionary of counter name to value, plus the mean latency in seconds
+        """
+        snap = {name: getattr(self, name) for name in self.__slots__}
+        snap["latency_mean"] = self.latency_total / self.latency_count if self.latency_count else 0.0
+        return snap
+
+
+class parser:
+    """
+    Class for a parser, one instance per serial link. Each instance owns its own state machine,
+    address and parsed message queue so any number of links can be decoded in one process.
+
+    Thread safety: every public method takes the instance lock, so a single parser can be fed and
+    drained from several threads without corrupting its state. Each call is atomic, a chunk passed
+    to parse_input_buffer is decoded in full before another thread's chunk is started. The order in
+    which chunks from different threads reach the parser is up to the caller. Separate parser
+    instances share no state and never contend with each other. Parsed messages go into a
+    message_queue with its own lock, so draining never waits on a parse in progress.
+
+    Errors never abort parsing. A header followed by an illegal length or a bad CRC is a false header,
+    it is counted, passed to the error_handler if one is set, and scanning carries on from the byte
+    after it, so a real frame that started inside the false one is still found. Complete frames come
+    out exactly as decode.decode_buffer finds them, apart from frames for other addresses, which are
+    skipped unchecked unless validate_foreign_crc (or promiscuous) is set.
+
+    Attributes:
+        my_addr: Address of the device this parser receives for
+        local_addrs: Further addresses the parser receives for, e.g. the nodes a gateway stands in for
+        broadcast_addr: Address every device receives, None for no broadcast
+        addr_filter: 256 entry bitmap of the accepted target addresses, one lookup per frame
+        p_state: State of the byte state machine
+        current_msg: Message being assembled by the byte state machine
+        current_payload: Payload of current_msg as it is assembled
+        current_crc: Running CRC of current_msg, folded in as bytes arrive
+        rx_buffer: Partial frame left over by the buffer scanner between calls
+        parsed_message_queue: message_queue of parsed messages waiting for check_for_parsed_messages
+        handler: Callable given each parsed message as it completes instead of queuing it, None to queue
+        promiscuous: When True every frame that passes the CRC is emitted whatever its target address
+        validate_foreign_crc: When True frames for other addresses are CRC checked, otherwise their
+            payload and CRC are skipped over without being buffered or checked
+        stats: parser_stats counters
+        timing_callback: Callable given (msg, latency) for each frame while timing is enabled
+        error_handler: Callable given the message of each frame rejected for an illegal length or a
+            bad CRC, with its error field set, None to only count them
+    """
+
+    def __init__(self, addr=0x01, capacity=0, policy=overflow_policy.DROP_OLDEST, handler=None,
+                 promiscuous=False, broadcast_addr=None, local_addrs=(), validate_foreign_crc=False,
+                 error_handler=None):
+        """
+        Constructor for the parser class
+
+        Args:
+            addr: Address of the device this parser receives for
+            capacity: Maximum number of parsed messages held, 0 for unbounded
+            policy: What a full parsed message queue does with a new message
+            handler: Callable given each parsed message as it completes instead of queuing it,
+                for example a dispatcher. It runs with the parser lock held.
+            promiscuous: Emit every frame that passes the CRC whatever its target address, for sniffing
+            broadcast_addr: Address every device receives, None for no broadcast
+            local_addrs: Further addresses the parser receives for
+            validate_foreign_crc: CRC check frames for other addresses instead of skipping them. A
+                header match inside payload data then shows up as a CRC failure rather than
+                silently skipping the length it claims
+            error_handler: Callable given the message of each frame rejected for an illegal length
+                or a bad CRC, with its error field set. It runs with the parser lock held.
+        """
+        self.lock = threading.Lock()
+        self.addr_filter = bytearray(256)
+        self.local_addrs = set(local_addrs)
+        self.broadcast_addr = broadcast_addr
+        self._my_addr = addr
+        self._update_addr_filter()
+        self.p_state = parsing_state.HEADER_POS0
+        self.current_msg = message(0, 0, 0, 0, EMPTY_PAYLOAD, 0)
+        self.current_payload = bytearray()
+        self.current_crc = HEADER_CRC
+        self.rx_buffer = bytearray()
+        self.parsed_message_queue = message_queue(capacity, policy)
+        self.handler = handler
+        self.promiscuous = promiscuous
+        self.validate_foreign_crc = validate_foreign_crc
+        self.stats = parser_stats()
+        self.timing_callback = None
+        self.error_handler = error_handler
+        self._replay = None
+        self._discarding = False
+        self._skip_left = 0
+        self._clock = None
+        self._frame_started = 0.0
+        self._rx_started = 0.0
+
+    @property
+    def my_addr(self):
+        """
+        Address of the device this parser receives for.
+        """
+        return self._my_addr
+
+    @my_addr.setter
+    def my_addr(self, addr):
+        self._my_addr = addr
+        self._update_addr_filter()
+
+    @property
+    def message_available(self):
+        """
+        True when parsed messages are waiting in the queue.
+        """
+        return len(self.parsed_message_queue) > 0
+
+    def enable_timing(self, callback=None, clock=time.perf_counter):
+        """
+        Start timing frames from the arrival of their first header byte to notify. For the byte state
+        machine a frame arrives with its first header byte, for parse_input_buffer it arrives with the
+        chunk holding its first header byte. Latencies are added to the stats and, when callback is
+        given, passed to it with the message. Timing costs a clock read per chunk and per frame,
+        disabled it costs one attribute test per frame.
+
+        Args:
+            callback: Callable given (msg, latency) for each frame, called with the parser lock held
+            clock: Clock returning seconds
+        """
+        with self.lock:
+            self.timing_callback = callback
+            self._clock = clock
+            self._rx_started = clock()
+
+    def disable_timing(self):
+        """
+        Stop timing frames.
+        """
+        with self.lock:
+            self.timing_callback = None
+            self._clock = None
+
+    def stats_snapshot(self):
+        """
+        Snapshot of the parser counters together with the parsed message queue counters.
+
+        Returns:
+            Dictionary of counter name to value
+        """
+        with self.lock:
+            snap = self.stats.snapshot()
+        queue = self.parsed_message_queue.stats()
+        snap["queue_length"] = queue["length"]
+        snap["queue_dropped"] = queue["dropped"]
+        return snap
+
+    def set_my_address(self, addr):
+        """
+        Set the address of the device this parser receives for.
+
+        Args:
+            addr: Address of the current device
+        """
+        with self.lock:
+            self.my_addr = addr
+
+    def add_address(self, addr):
+        """
+        Receive frames for another address as well as my_addr.
+
+        Args:
+            addr: Address to receive for
+        """
+        with self.lock:
+            self.local_addrs.add(addr)
+            self._update_addr_filter()
+
+    def remove_address(self, addr):
+        """
+        Stop receiving frames for an address added with add_address.
+
+        Args:
+            addr: Address to stop receiving for
+        """
+        with self.lock:
+            self.local_addrs.discard(addr)
+            self._update_addr_filter()
+
+    def set_broadcast_address(self, addr):
+        """
+        Set the broadcast address, frames sent to it are received as well as those for our addresses.
+
+        Args:
+            addr: Broadcast address, None for no broadcast
+        """
+        with self.lock:
+            self.broadcast_addr = addr
+            self._update_addr_filter()
+
+    def accepts(self, addr):
+        """
+        Check whether frames for an address are received.
+
+        Args:
+            addr: Target address
+
+        Returns:
+            True if the address is one of ours or the broadcast address
+        """
+        return 0 <= addr < 256 and self.addr_filter[addr] != 0
+
+    def notify_parsed_message(self, msg):
+        """
+        Notify the user that a message has been parsed. The message goes straight to the handler if
+        one is set, otherwise it is stored in the parsed_message_queue. Called with the instance lock held.
+
+        Args:
+            msg: Message that has been parsed
+        """
+        if self.handler is not None:
+            self.handler(msg)
+        else:
+            self.parsed_message_queue.put(msg)
+
+    def reset_parsing_state(self):
+        """
+        Reset the parsing state machine. Sets p_state to HEADER_POS0 and current_msg to a new message.
+        """
+        with self.lock:
+            self._reset_parsing_state()
+
+    def reset(self):
+        """
+        Reset the parser completely, dropping the state machine, any partial frame held by the buffer
+        scanner and any parsed messages that have not been collected.
+        """
+        with self.lock:
+            self._reset_parsing_state()
+            self.rx_buffer.clear()
+            self.parsed_message_queue.clear()
+            self.stats = parser_stats()
+            self._discarding = False
+
+    def parse_byte(self, byte):
+        """
+        Parse the incoming byte in the state machine.
+
+        Args:
+            byte: Byte to parse from the incoming byte stream.
+        """
+        with self.lock:
+            self.stats.bytes_in += 1
+            self._feed((byte,))
+
+    def parse_input_buffer(self, input_buffer):
+        """
+        Parse an incoming list of bytes. Whole frames are decoded straight out of the buffer by the
+        buffer scanner rather than one parse_byte call per byte. Lists holding values that do not fit
+        in a byte fall back to the byte state machine. Bad frames are counted and never raise, an
+        exception from a handler is passed on to the caller once the frame it was given is consumed.
+
+        Args:
+            input_buffer: List of bytes, bytes, bytearray, memoryview or any iterable of ints to parse.
+        """
+        if input_buffer is None:
+            return
+        with self.lock:
+            if not isinstance(input_buffer, (bytes, bytearray, memoryview, list, tuple)):
+                # Generators and other iterables have no len() and cannot be indexed
+                input_buffer = list(input_buffer)
+            self.stats.bytes_in += len(input_buffer)
+            # Let the byte state machine finish any frame it has in flight, a frame for another
+            # address is skipped over in one step
+            if self.p_state != parsing_state.HEADER_POS0:
+                consumed = 0
+                n = len(input_buffer)
+                try:
+                    while consumed < n and self.p_state != parsing_state.HEADER_POS0:
+                        if self.p_state == parsing_state.SKIP_POS:
+                            step = min(self._skip_left, n - consumed)
+                            self._skip(step)
+                            consumed += step
+                        else:
+                            consumed += 1
+                            self._parse_byte(input_buffer[consumed - 1])
+                            if self._replay is not None:
+                                break
+                except Exception:
+                    # A handler raised on the frame that completed, keep the rest for the next call
+                    self._keep(input_buffer[consumed:])
+                    raise
+                input_buffer = input_buffer[consumed:]
+                if self._replay is not None:
+                    # The frame in flight was a false header, its bytes go back through the scanner
+                    replay = self._replay
+                    self._replay = None
+                    if isinstance(input_buffer, (bytes, bytearray, memoryview)):
+                        input_buffer = bytes(replay) + bytes(input_buffer)
+                    else:
+                        input_buffer = list(replay) + list(input_buffer)
+
+            carried = len(self.rx_buffer)
+            if isinstance(input_buffer, (bytes, bytearray, memoryview)):
+                self.rx_buffer.extend(input_buffer)
+            else:
+                try:
+                    self.rx_buffer.extend(bytes(input_buffer))
+                except ValueError:
+                    self._drain_rx_buffer()
+                    self._feed(input_buffer)
+                    return
+            self._scan_rx_buffer(carried, self._clock() if self._clock is not None else 0.0)
+
+    def flush(self):
+        """
+        Treat the input so far as the end of the stream. A partial frame can never complete, so its
+        header is dropped as a false header and the bytes after it are scanned for complete frames,
+        as decode.decode_buffer does at the end of a dump. The parser is left ready for a new stream.
+        """
+        with self.lock:
+            pending = bytearray()
+            if self.p_state == parsing_state.SKIP_POS:
+                self._reset_parsing_state()
+            elif self.p_state != parsing_state.HEADER_POS0:
+                pending.append(HEADER_BYTE0)
+                pending += self._frame_tail()
+                self._reset_parsing_state()
+            pending += self.rx_buffer
+            self.rx_buffer[:] = pending
+            self._scan_rx_buffer(final=True)
+
+    def check_for_parsed_messages(self, max_n=None):
+        """
+        Check for parsed messages in the queue. Returns a list of parsed messages. If no messages are available, returns an empty list.
+
+        Args:
+            max_n: Maximum number of messages to return, None for all of them
+
+        Returns:
+            List of parsed messages.
+        """
+        return self.parsed_message_queue.drain(max_n)
+
+    def pop_message(self, timeout=0):
+        """
+        Take the oldest parsed message off the queue.
+
+        Args:
+            timeout: Seconds to wait for a message, 0 to return at once, None to wait forever
+
+        Returns:
+            The oldest parsed message, or None if none arrived
+        """
+        return self.parsed_message_queue.pop(timeout)
+
+    def iter_messages(self, source, chunk_size=DEFAULT_CHUNK_SIZE, flush=True):
+        """
+        Decode a stream lazily, yielding each message as soon as the chunk completing it is parsed.
+        Chunks are read into one reusable buffer and messages are taken off the queue one at a time,
+        so memory stays constant however long the stream is. Messages go through the queue, so the
+        parser must not have a handler set. A serial port has no end of stream, iteration goes on
+        until the caller stops it or the port fails.
+
+        Args:
+            source: Object with recv_into (socket), readinto (file, serial.Serial) or read, an
+                iterable of bytes chunks, or a single bytes-like object
+            chunk_size: Largest single read from source
+            flush: Call flush() at the end of the stream so frames after a partial one are found
+
+        Yields:
+            Parsed messages in stream order
+        """
+        pop = self.parsed_message_queue.pop
+        for chunk in _read_chunks(source, chunk_size):
+            self.parse_input_buffer(chunk)
+            msg = pop()
+            while msg is not None:
+                yield msg
+                msg = pop()
+        if flush:
+            self.flush()
+            msg = pop()
+            while msg is not None:
+                yield msg
+                msg = pop()
+
+    def build_message(self, type, addr, payload):
+        """
+        Build a message sourced from this parser's address. This method will calculate the CRC and return the message.
+
+        Args:
+            type: Message type.
+            addr: Target address of the message.
+            payload: Payload of the message.
+
+        Returns:
+            Message to send to the message handler.
+        """
+        return _build_message(type, self.my_addr, addr, payload)
+
+    def _update_addr_filter(self):
+        """
+        Rebuild the address bitmap from my_addr, local_addrs and broadcast_addr.
+        """
+        addr_filter = self.addr_filter
+        addr_filter[:] = bytes(256)
+        for addr in self.local_addrs | {self._my_addr, self.broadcast_addr}:
+            if addr is not None and 0 <= addr < 256:
+                addr_filter[addr] = 1
+
+    def _reset_parsing_state(self):
+        self.p_state = parsing_state.HEADER_POS0
+        self._skip_left = 0
+        self.current_msg = message(0, 0, 0, 0, EMPTY_PAYLOAD, 0)
+        self.current_payload.clear()
+        self.current_crc = HEADER_CRC
+
+    def _parse_byte(self, byte):
+        """
+        Parse the incoming byte in the state machine. Sets p_state to the next state and fills in
+        current_msg as it becomes parsed. Every byte between the header and the CRC is folded into
+        current_crc on arrival, so the CRC check at CRC_POS_2 is a single comparison.
+
+        Args:
+            byte: Byte to parse from the incoming byte stream.
+        """
+        # Hand any partial frame held by the buffer scanner over to the state machine
+        if self.rx_buffer:
+            self._drain_rx_buffer()
+        p_state = self.p_state
+        current_msg = self.current_msg
+        # Switch based on the state
+        if p_state == parsing_state.HEADER_POS0:
+            if byte == HEADER_BYTE0:
+                self.p_state = parsing_state.HEADER_POS1
+                if self._clock is not None:
+                    self._frame_started = self._clock()
+            else:
+                self._discarding = True
+                self.stats.bytes_discarded += 1
+                self._reset_parsing_state()
+        elif p_state == parsing_state.HEADER_POS1:
+            if byte == HEADER_BYTE1:
+                self.p_state = parsing_state.HEADER_POS2
+            else:
+                self._backtrack(byte)
+        elif p_state == parsing_state.HEADER_POS2:
+            if byte == HEADER_BYTE2:
+                self.p_state = parsing_state.SRC_ADDR_POS
+                if self._discarding:
+                    self._discarding = False
+                    self.stats.resyncs += 1
+            else:
+                self._backtrack(byte)
+        elif p_state == parsing_state.SKIP_POS:
+            self._skip(1)
+        elif p_state == parsing_state.CRC_POS_1:
+            current_msg.msg_crc = (byte & 0xFF) << 8
+            self.p_state = parsing_state.CRC_POS_2
+        elif p_state == parsing_state.CRC_POS_2:
+            current_msg.msg_crc |= (byte & 0xFF)
+            # Check the CRC of frames for us, or of every frame when promiscuous
+            tgt_addr = current_msg.tgt_addr
+            matched = tgt_addr < 256 and self.addr_filter[tgt_addr]
+            if matched or self.promiscuous:
+                if current_msg.msg_crc == self.current_crc:
+                    # CRC is good, send the message to the message handler
+                    current_msg.msg_payload = payload_bytes(self.current_payload)
+                    if matched:
+                        current_msg.matched_addr = tgt_addr
+                    self.stats.frames_ok += 1
+                    if self._clock is not None:
+                        self._time_frame(current_msg, self._frame_started)
+                    # Reset the parsing state machine first, a handler that raises must not leave
+                    # the frame in flight
+                    self._reset_parsing_state()
+                    self.notify_parsed_message(current_msg)
+                else:
+                    self._reject(current_msg, error_state.CRC_MISMATCH, byte)
+            elif current_msg.msg_crc != self.current_crc:
+                # Only frames for other addresses with validate_foreign_crc set get this far
+                self._reject(current_msg, error_state.CRC_MISMATCH, byte)
+            else:
+                self.stats.addr_mismatches += 1
+                self._reset_parsing_state()
+        else:
+            # Every byte between the header and the CRC is covered by the CRC
+            crc = self.current_crc
+            self.current_crc = (crc >> 8) ^ CRC_TABLE[(crc ^ byte) & 0xFF]
+            if p_state == parsing_state.SRC_ADDR_POS:
+                current_msg.src_addr = byte
+                self.p_state = parsing_state.TGT_ADDR_POS
+            elif p_state == parsing_state.TGT_ADDR_POS:
+                current_msg.tgt_addr = byte
+                self.p_state = parsing_state.MSG_TYPE_POS
+            elif p_state == parsing_state.MSG_TYPE_POS:
+                current_msg.msg_type = byte
+                self.p_state = parsing_state.PAYLOAD_LEN_MSB_POS
+            elif p_state == parsing_state.PAYLOAD_LEN_MSB_POS:
+                current_msg.msg_len = byte << 8
+                self.p_state = parsing_state.PAYLOAD_LEN_LSB_POS
+            elif p_state == parsing_state.PAYLOAD_LEN_LSB_POS:
+                current_msg.msg_len |= byte
+                if current_msg.msg_len > MAX_MSG_LEN:
+                    self._reject(current_msg, error_state.ILLEGAL_MESSAGE_LENGTH, byte)
+                elif not (self.promiscuous or self.validate_foreign_crc or
+                          (current_msg.tgt_addr < 256 and self.addr_filter[current_msg.tgt_addr])):
+                    # Nothing more of a frame for another address is needed, skip its payload and CRC
+                    self._skip_left = current_msg.msg_len + 2
+                    self.p_state = parsing_state.SKIP_POS
+                elif current_msg.msg_len > 0:
+                    self.p_state = parsing_state.PAYLOAD_START_POS
+                else:
+                    self.p_state = parsing_state.CRC_POS_1
+            elif p_state == parsing_state.PAYLOAD_START_POS:
+                self.current_payload.append(byte)
+                if len(self.current_payload) == current_msg.msg_len:
+                    self.p_state = parsing_state.CRC_POS_1
+
+    def _feed(self, data):
+        """
+        Run bytes through the byte state machine. When a frame in flight turns out to be a false
+        header its bytes after the first header byte are run through again ahead of the rest.
+
+        Args:
+            data: Sequence of bytes
+        """
+        i = 0
+        n = len(data)
+        while i < n:
+            self._parse_byte(data[i])
+            i += 1
+            if self._replay is not None:
+                data = list(self._replay) + list(data[i:])
+                self._replay = None
+                i = 0
+                n = len(data)
+
+    def _frame_tail(self):
+        """
+        Rebuild the bytes the state machine has taken in for the frame in flight, less the first
+        header byte.
+
+        Returns:
+            bytearray of the frame bytes after the first header byte
+        """
+        msg = self.current_msg
+        state = self.p_state.value
+        fields = (HEADER_BYTE1, HEADER_BYTE2, msg.src_addr & 0xFF, msg.tgt_addr & 0xFF,
+                  msg.msg_type & 0xFF, (msg.msg_len >> 8) & 0xFF, msg.msg_len & 0xFF)
+        tail = bytearray(fields[:min(state - 1, len(fields))])
+        if state >= parsing_state.PAYLOAD_START_POS.value:
+            tail += self.current_payload
+        if self.p_state == parsing_state.CRC_POS_2:
+            tail.append((msg.msg_crc >> 8) & 0xFF)
+        return tail
+
+    def _backtrack(self, byte):
+        """
+        Drop the first header byte of the frame in flight as a false header and queue the rest of its
+        bytes, ending with byte, to be parsed again.
+
+        Args:
+            byte: Byte that showed the header was false
+        """
+        tail = self._frame_tail()
+        tail.append(byte & 0xFF)
+        self._reset_parsing_state()
+        self._discarding = True
+        self.stats.bytes_discarded += 1
+        self._replay = tail
+
+    def _reject(self, msg, error, byte):
+        """
+        Count and report a frame rejected for an illegal length or a bad CRC, then backtrack.
+
+        Args:
+            msg: Message of the rejected frame
+            error: error_state of the rejection
+            byte: Byte that completed the rejected field
+        """
+        if error == error_state.ILLEGAL_MESSAGE_LENGTH:
+            self.stats.oversize_lengths += 1
+        else:
+            self.stats.crc_failures += 1
+        if self.error_handler is not None:
+            msg.error = error
+            msg.msg_payload = payload_bytes(self.current_payload)
+            self.error_handler(msg)
+        self._backtrack(byte)
 
-# Parsing state global variable
-p_state = parsing_state(0)
+    def _report_error(self, error, msg_type, src_addr, tgt_addr, msg_len, payload, msg_crc):
+        """
+        Pass a frame rejected by the buffer scanner to the error_handler.
+
+        Args:
+            error: error_state of the rejection
+            msg_type, src_addr, tgt_addr, msg_len: Header fields of the rejected frame
+            payload: Payload bytes of the rejected frame, empty for an illegal length
+            msg_crc: CRC received with the rejected frame, 0 for an illegal length
+        """
+        msg = message(msg_type, src_addr, tgt_addr, msg_len, payload_bytes(payload), msg_crc)
+        msg.error = error
+        self.error_handler(msg)
+
+    def _skip(self, count):
+        """
+        Skip over count bytes of a frame for another address, counting the frame once it is passed.
+
+        Args:
+            count: Number of bytes skipped, at most _skip_left
+        """
+        self._skip_left -= count
+        if self._skip_left == 0:
+            self.stats.addr_mismatches += 1
+            self._reset_parsing_state()
+
+    def _keep(self, data):
+        """
+        Hold bytes not parsed yet in rx_buffer for the next call, dropping values that do not fit in
+        a byte.
+
+        Args:
+            data: Sequence of bytes
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self.rx_buffer.extend(data)
+        else:
+            self.rx_buffer.extend(bytes(b for b in data if 0 <= b <= 0xFF))
 
-# Current message global variable
-current_msg = message(0, 0, 0, 0, [], 0)
+    def _drain_rx_buffer(self):
+        """
+        Move the partial frame held by the buffer scanner into the byte state machine. This is only
+        needed when callers mix parse_byte and parse_input_buffer on the same stream.
+        """
+        pending = bytes(self.rx_buffer)
+        self.rx_buffer.clear()
+        self._feed(pending)
 
-# Global parsed notification and storage
-parsed_message_queue = []
-message_available = False
+    def _scan_rx_buffer(self, carried=0, arrived=0.0, final=False):
+        """
+        Scan rx_buffer for complete frames. Frames are located with bytes.find on the header, the
+        five header fields are read in one slice and the payload is copied as a single slice. A frame
+        that passes the CRC, or is for another address and skipped, is consumed whole. A header with
+        an illegal length or a bad CRC is false and the scan carries on from the byte after it, like
+        decode._scan. Only a trailing partial frame (or partial header) is kept in rx_buffer for the
+        next call.
+
+        Args:
+            carried: Number of bytes at the front of rx_buffer left over from an earlier call
+            arrived: Clock reading when the new bytes arrived, only used while timing is enabled
+            final: No more bytes will arrive, partial frames are false headers and nothing is kept
+        """
+        buf = self.rx_buffer
+        n = len(buf)
+        pos = 0
+        stats = self.stats
+        addr_filter = self.addr_filter
+        promiscuous = self.promiscuous
+        validate_foreign_crc = self.validate_foreign_crc
+        try:
+            with memoryview(buf) as view:
+                while True:
+                    start = buf.find(HEADER, pos)
+                    if start < 0:
+                        # Keep a trailing partial header so it can complete on the next call,
+                        # unless nothing more is coming
+                        end = n
+                        if not final:
+                            if n - pos >= 2 and buf[n - 2] == HEADER_BYTE0 and buf[n - 1] == HEADER_BYTE1:
+                                end = n - 2
+                            elif n - pos >= 1 and buf[n - 1] == HEADER_BYTE0:
+                                end = n - 1
+                        if end > pos:
+                            self._discarding = True
+                            stats.bytes_discarded += end - pos
+                        pos = end
+                        break
+                    if start > pos or self._discarding:
+                        self._discarding = False
+                        stats.resyncs += 1
+                        stats.bytes_discarded += start - pos
+                    if n - start < FRAME_HEADER_LEN:
+                        if final:
+                            self._discarding = True
+                            stats.bytes_discarded += 1
+                            pos = start + 1
+                            continue
+                        pos = start
+                        break
+                    src_addr, tgt_addr, msg_type, len_msb, len_lsb = view[start + 3:start +
+                                                                           FRAME_HEADER_LEN]
+                    msg_len = len_msb << 8 | len_lsb
+                    if msg_len > MAX_MSG_LEN:
+                        # An illegal length means a false header, rescan from the byte after it
+                        stats.oversize_lengths += 1
+                        if self.error_handler is not None:
+                            self._report_error(error_state.ILLEGAL_MESSAGE_LENGTH, msg_type,
+                                               src_addr, tgt_addr, msg_len, b"", 0)
+                        self._discarding = True
+                        stats.bytes_discarded += 1
+                        pos = start + 1
+                        continue
+                    end = start + FRAME_OVERHEAD_LEN + msg_len
+                    accepted = addr_filter[tgt_addr] or promiscuous
+                    if end > n:
+                        if final:
+                            self._discarding = True
+                            stats.bytes_discarded += 1
+                            pos = start + 1
+                            continue
+                        if accepted or validate_foreign_crc:
+                            pos = start
+                        else:
+                            # The rest of a frame for another address is skipped as it arrives
+                            # rather than held in rx_buffer
+                            self._skip_left = end - n
+                            self.p_state = parsing_state.SKIP_POS
+                            pos = n
+                        break
+                    if accepted or validate_foreign_crc:
+                        msg_crc = buf[end - 2] << 8 | buf[end - 1]
+                        if msg_crc != crc16.update(HEADER_CRC, view[start + 3:end - 2]):
+                            # A bad CRC means a false header, rescan from the byte after it
+                            stats.crc_failures += 1
+                            if self.error_handler is not None:
+                                self._report_error(error_state.CRC_MISMATCH, msg_type, src_addr,
+                                                   tgt_addr, msg_len,
+                                                   view[start + FRAME_HEADER_LEN:end - 2], msg_crc)
+                            self._discarding = True
+                            stats.bytes_discarded += 1
+                            pos = start + 1
+                            continue
+                        if accepted:
+                            msg = message(msg_type, src_addr, tgt_addr, msg_len,
+                                          payload_bytes(view[start + FRAME_HEADER_LEN:end - 2]),
+                                          msg_crc)
+                            if addr_filter[tgt_addr]:
+                                msg.matched_addr = tgt_addr
+                            stats.frames_ok += 1
+                            if self._clock is not None:
+                                # Frames begun in an earlier call arrived with that call's bytes
+                                self._time_frame(msg, self._rx_started if start < carried else arrived)
+                            # Consume the frame first, a handler that raises must not see it again
+                            pos = end
+                            self.notify_parsed_message(msg)
+                            continue
+                        stats.addr_mismatches += 1
+                    else:
+                        stats.addr_mismatches += 1
+                    pos = end
+        finally:
+            # Release the consumed bytes, the memoryview must be gone first
+            del buf[:pos]
+            if pos >= carried:
+                self._rx_started = arrived
+
+    def _time_frame(self, msg, started):
+        """
+        Record the latency of a frame from the arrival of its first header byte, called just before
+        the frame is notified.
+
+        Args:
+            msg: Parsed message
+            started: Clock reading when the first header byte arrived
+        """
+        latency = self._clock() - started
+        stats = self.stats
+        stats.latency_count += 1
+        stats.latency_total += latency
+        if latency > stats.latency_max:
+            stats.latency_max = latency
+        if self.timing_callback is not None:
+            self.timing_callback(msg, latency)
+
+
+# Default parser used by the module level functions below
+default_parser = parser(my_addr)
+
+# Module globals from before the parser class, now held by the default parser
+_DEFAULT_PARSER_ATTRS = ("p_state", "current_msg", "parsed_message_queue")
+
+
+# Read the module globals that moved into the default parser
+def __getattr__(name):
+    """
+    Keep the module globals that moved into the default parser readable. parsed_message_queue is
+    the default parser's message_queue and message_available is True while it holds messages.
+
+    Args:
+        name: Name of the module attribute
+
+    Returns:
+        Value of the attribute on the default parser
+    """
+    if name in _DEFAULT_PARSER_ATTRS:
+        return getattr(default_parser, name)
+    if name == "message_available":
+        return len(default_parser.parsed_message_queue) > 0
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+class _protocol_module(types.ModuleType):
+    """
+    Class for this module, so that assigning my_addr, p_state or current_msg on the module still
+    reaches the default parser, as it did when they were plain module globals.
+    """
+
+    def __setattr__(self, name, value):
+        if name == "my_addr":
+            default_parser.my_addr = value
+        elif name in _DEFAULT_PARSER_ATTRS:
+            setattr(default_parser, name, value)
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _protocol_module
 
 
 # Set my address
@@ -149,184 +1150,130 @@ def set_my_address(addr):
     """
     global my_addr
     my_addr = addr
+    default_parser.set_my_address(addr)
 
 
-# Internal notify of a parsed message
-def notify_parsed_message(msg):
+# Set the broadcast address
+def set_broadcast_address(addr):
     """
-    Notify the user that a message has been parsed, and store the message in the parsed_message_queue list.
-    Sets the message_available global variable to True.
+    Set the broadcast address the default parser receives as well as my_addr.
 
     Args:
-        msg: Message that has been parsed
+        addr: Broadcast address, None for no broadcast
     """
-    global parsed_message_queue
-    global message_available
-    parsed_message_queue.append(msg)
-    message_available = True
+    default_parser.set_broadcast_address(addr)
 
 
-# Calculate the CRC of the message
-def calculate_crc(msg):
+# Internal notify of a parsed message
+def notify_parsed_message(msg):
     """
-    Calculate the CRC of the message.
+    Notify the user that a message has been parsed, and store the message in the default parser's queue.
 
     Args:
-        msg: Message to calculate the CRC of
+        msg: Message that has been parsed
     """
-    crc = 0xFFFF
-    byte_list = []
-    byte_list.append(HEADER_BYTE0)
-    byte_list.append(HEADER_BYTE1)
-    byte_list.append(HEADER_BYTE2)
-    byte_list.append(msg.src_addr)
-    byte_list.append(msg.tgt_addr)
-    byte_list.append(msg.msg_type)
-    byte_list.append(msg.msg_len >> 8 & 0xFF)
-    byte_list.append(msg.msg_len & 0xFF)
-    for i in range(msg.msg_len):
-        byte_list.append(msg.msg_payload[i])
-    for i in range(len(byte_list)):
-        crc = crc ^ byte_list[i]
-        for j in range(8):
-            if (crc & 0x0001):
-                crc = crc >> 1
-                crc = crc ^ 0xA001
-            else:
-                crc = crc >> 1
-    return crc
+    with default_parser.lock:
+        default_parser.notify_parsed_message(msg)
 
 
 # Reset the parsing state machine
 def reset_parsing_state():
     """
-    Reset the parsing state machine. Sets the p_state global variable to HEADER_POS0. 
-    Sets the current_msg global variable to a new message. If a message is successfully parsed, 
-    this method will call notify_parsed_message.
+    Reset the default parser's state machine to HEADER_POS0.
     """
-    global p_state
-    global current_msg
-    p_state = parsing_state.HEADER_POS0
-    current_msg = message(0, 0, 0, 0, [], 0)
+    default_parser.reset_parsing_state()
 
 
 # Parse the incoming byte in the state machine
 def parse_byte(byte):
     """
-    Parse the incoming byte in the state machine. Sets the p_state global variable to the next state. 
-    Sets the current_msg global variable to the parsed message as it becomes parsed.
+    Parse the incoming byte in the default parser's state machine.
 
     Args:
         byte: Byte to parse from the incoming byte stream.
     """
-    global p_state
-    global current_msg
-    # Switch based on the state
-    if p_state == parsing_state.HEADER_POS0:
-        if byte == HEADER_BYTE0:
-            p_state = parsing_state.HEADER_POS1
-        else:
-            reset_parsing_state()
-    elif p_state == parsing_state.HEADER_POS1:
-        if byte == HEADER_BYTE1:
-            p_state = parsing_state.HEADER_POS2
-        else:
-            reset_parsing_state()
-    elif p_state == parsing_state.HEADER_POS2:
-        if byte == HEADER_BYTE2:
-            p_state = parsing_state.SRC_ADDR_POS
-        else:
-            reset_parsing_state()
-    elif p_state == parsing_state.SRC_ADDR_POS:
-        current_msg.src_addr = byte
-        p_state = parsing_state.TGT_ADDR_POS
-    elif p_state == parsing_state.TGT_ADDR_POS:
-        current_msg.tgt_addr = byte
-        p_state = parsing_state.MSG_TYPE_POS
-    elif p_state == parsing_state.MSG_TYPE_POS:
-        current_msg.msg_type = byte
-        p_state = parsing_state.PAYLOAD_LEN_MSB_POS
-    elif p_state == parsing_state.PAYLOAD_LEN_MSB_POS:
-        current_msg.msg_len = byte << 8
-        p_state = parsing_state.PAYLOAD_LEN_LSB_POS
-    elif p_state == parsing_state.PAYLOAD_LEN_LSB_POS:
-        current_msg.msg_len |= byte
-        if current_msg.msg_len > MAX_MSG_LEN:
-            reset_parsing_state()
-            raise Exception("Message length too large")
-        elif current_msg.msg_len > 0:
-            p_state = parsing_state.PAYLOAD_START_POS
-        else:
-            p_state = parsing_state.CRC_POS_1
-    elif p_state == parsing_state.PAYLOAD_START_POS:
-        current_msg.msg_payload.append(byte)
-        if len(current_msg.msg_payload) == current_msg.msg_len:
-            p_state = parsing_state.CRC_POS_1
-    elif p_state == parsing_state.CRC_POS_1:
-        current_msg.msg_crc = (byte & 0xFF) << 8
-        p_state = parsing_state.CRC_POS_2
-    elif p_state == parsing_state.CRC_POS_2:
-        current_msg.msg_crc |= (byte & 0xFF)
-        # Check the CRC
-        global my_addr
-        if current_msg.msg_crc == calculate_crc(
-                current_msg) and current_msg.tgt_addr == my_addr:
-            # CRC is good, send the message to the message handler
-            notify_parsed_message(current_msg)
-            reset_parsing_state()
-        else:
-            # CRC is bad, reset the parsing state machine
-            reset_parsing_state()
+    default_parser.parse_byte(byte)
 
 
 # Parse an incoming list of bytes into the state machine
 def parse_input_buffer(input_buffer):
     """
-    Parse an incoming list of bytes into the state machine. This message simply takes a list and calls parse_byte on each byte.
+    Parse an incoming list of bytes with the default parser.
 
     Args:
-        input_buffer: List of bytes to parse.
+        input_buffer: List of bytes, bytes, bytearray or memoryview to parse.
     """
-    try:
-        # Parse the input buffer into the state machine
-        for byte in input_buffer:
-            parse_byte(byte)
-    except Exception as e:
-        print("Exception: " + str(e))
+    default_parser.parse_input_buffer(input_buffer)
 
 
 # Check for parsed messages in the queue
 def check_for_parsed_messages():
     """
-    Check for parsed messages in the queue. Returns a list of parsed messages. If no messages are available, returns an empty list.
+    Check for parsed messages in the default parser's queue. Returns a list of parsed messages. If no messages are available, returns an empty list.
 
     Returns:
         List of parsed messages.
     """
-    global parsed_message_queue
-    global message_available
-    if message_available:
-        message_available = False
-        queue = parsed_message_queue.copy()
-        parsed_message_queue.clear()
-        return queue
-    else:
-        return []
+    return default_parser.check_for_parsed_messages()
 
 
-# Send a message to the message handler
-def build_message(type, addr, payload):
+# Iterate over the messages in a stream
+def iter_messages(source, chunk_size=DEFAULT_CHUNK_SIZE, msg_parser=None):
     """
-    Build a message to send to the message handler. This method will calculate the CRC and return the message.
+    Decode a stream lazily, see parser.iter_messages. The default parser is left alone, a new parser
+    for my_addr decodes the stream unless one is given.
 
     Args:
-        type: Message type.
-        addr: Target address of the message.
-        payload: Payload of the message.
+        source: Socket, file, serial.Serial, iterable of bytes chunks or bytes-like object
+        chunk_size: Largest single read from source
+        msg_parser: Parser to decode with, None for a new parser for my_addr
 
     Returns:
-        Message to send to the message handler.
+        Generator of the parsed messages in stream order
+    """
+    if msg_parser is None:
+        msg_parser = parser(my_addr)
+    return msg_parser.iter_messages(source, chunk_size)
+
+
+# Read a stream as a sequence of chunks
+def _read_chunks(source, chunk_size):
     """
+    Yield the chunks of a stream. Reads go into one reusable buffer, each chunk is a memoryview of
+    it that is only valid until the next chunk is taken. A port, anything with in_waiting, is read
+    for whatever it has waiting so frames come out without waiting for a full chunk, and a read
+    timeout does not end the stream. Anything else ends at the first empty read.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+        return
+    read_into = getattr(source, "recv_into", None) or getattr(source, "readinto", None)
+    read = getattr(source, "read", None)
+    if read_into is None and read is None:
+        for chunk in source:
+            yield chunk
+        return
+
+    is_port = hasattr(source, "in_waiting")
+    buf = bytearray(chunk_size)
+    with memoryview(buf) as view:
+        while True:
+            size = max(1, min(source.in_waiting, chunk_size)) if is_port else chunk_size
+            if read_into is not None:
+                n = read_into(view[:size])
+                chunk = view[:n] if n else None
+            else:
+                chunk = read(size)
+                n = None if chunk is None else len(chunk)
+            if n:
+                yield chunk
+            elif n is not None and not is_port:
+                # Empty read, the end of a file or a socket closed by the peer
+                return
+
+
+# Build a message from a source address
+def _build_message(type, src_addr, addr, payload):
     # Check for null payload
     if payload is None:
         payload = []
@@ -336,14 +1283,48 @@ def build_message(type, addr, payload):
         raise Exception("Message length too large")
 
     # Create the message
-    global my_addr
-    msg = message(type, my_addr, addr, len(payload), payload, 0)
+    msg = message(type, src_addr, addr, len(payload), payload, 0)
     # Calculate the CRC
     msg.msg_crc = calculate_crc(msg)
     # Return the message
     msg.error = error_state.NO_ERROR
     return msg
 
+
+# Send a message to the message handler
+def build_message(type, addr, payload):
+    """
+    Build a message to send to the message handler. This method will calculate the CRC and return the message.
+
+    Args:
+        type: Message type.
+        addr: Target address of the message.
+        payload: Payload of the message.
+
+    Returns:
+        Message to send to the message handler.
+    """
+    return _build_message(type, my_addr, addr, payload)
+
+# Encode a burst of messages into one buffer
+def encode_many(messages):
+    """
+    Encode a burst of messages back to back into one contiguous buffer, ready for a single write() call.
+
+    Args:
+        messages: Iterable of messages.
+
+    Returns:
+        bytearray holding every encoded frame in order.
+    """
+    messages = list(messages)
+    buf = bytearray(sum(FRAME_OVERHEAD_LEN + m.msg_len for m in messages))
+    offset = 0
+    for m in messages:
+        offset = m.encode_into(buf, offset)
+    return buf
+
+
 # Get the version information from the library
 def get_version():
     """
@@ -0,0 +1,148 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import threading
+import time
+
+
+class serial_reader:
+    """
+    Class for a background reader that owns an open pySerial port on its own thread. The thread reads
+    whatever the port has waiting in one bulk read into a reusable buffer and feeds it to the parser,
+    so decoding and I/O wait no longer take turns on the caller's thread. Parsed messages stay in the
+    parser's thread safe queue, or are handed to a callback on the reader thread when one is given.
+
+    Any object with read / readinto and in_waiting works, pySerial ports (including
+    serial.serial_for_url("loop://")) being the usual case. Give the port a read timeout, or use a
+    port that supports cancel_read, so stop() can interrupt a blocked read.
+
+    Attributes:
+        ser: Port being read
+        parser: Parser fed with the received bytes
+        callback: Callable given each parsed message on the reader thread, None to leave them queued
+        error: Exception that stopped the reader thread, None if it has not failed
+    """
+
+    def __init__(self, ser, msg_parser, callback=None, read_size=4096):
+        """
+        Constructor for the serial_reader class
+
+        Args:
+            ser: Open port to read from
+            msg_parser: Parser to feed with the received bytes
+            callback: Callable given each parsed message on the reader thread, None to leave them queued
+            read_size: Largest single read, also the size of the reusable buffer
+        """
+        self.ser = ser
+        self.parser = msg_parser
+        self.callback = callback
+        self.error = None
+        self._buf = bytearray(read_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._bytes_read = 0
+        self._reads = 0
+        self._messages = 0
+        self._started_at = None
+
+    def start(self):
+        """
+        Start the reader thread.
+        """
+        if self._thread is not None:
+            raise Exception("Reader already started")
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="serial_reader " +
+                                        str(getattr(self.ser, "port", "")), daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the reader thread and wait for it to exit. The port is left open.
+
+        Args:
+            timeout: Seconds to wait for the thread, None to wait forever
+        """
+        self._stop.set()
+        cancel_read = getattr(self.ser, "cancel_read", None)
+        if cancel_read is not None:
+            cancel_read()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_running(self):
+        """
+        True while the reader thread is alive.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self):
+        """
+        Snapshot of the reader counters.
+
+        Returns:
+            Dictionary of the port name, bytes read, number of reads, messages parsed and read rate
+        """
+        with self._lock:
+            elapsed = 0.0
+            if self._started_at is not None:
+                elapsed = time.monotonic() - self._started_at
+            return {
+                "port": getattr(self.ser, "port", None),
+                "bytes_read": self._bytes_read,
+                "reads": self._reads,
+                "messages": self._messages,
+                "bytes_per_second": self._bytes_read / elapsed if elapsed > 0 else 0.0,
+                "error": None if self.error is None else str(self.error)
+            }
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _run(self):
+        view = memoryview(self._buf)
+        size = len(self._buf)
+        try:
+            while not self._stop.is_set():
+                # Take everything waiting in one read, or block for the first byte up to the timeout
+                n = self.ser.readinto(view[:max(1, min(self.ser.in_waiting, size))])
+                if not n:
+                    continue
+                queued = self.parser.parsed_message_queue.accepted
+                self.parser.parse_input_buffer(view[:n])
+                count = self.parser.parsed_message_queue.accepted - queued
+                if self.callback is not None:
+                    for msg in self.parser.check_for_parsed_messages():
+                        self.callback(msg)
+                with self._lock:
+                    self._bytes_read += n
+                    self._reads += 1
+                    self._messages += count
+        except Exception as e:
+            # A port closed out from under us on shutdown is not an error
+            if not self._stop.is_set():
+                self.error = e
+        finally:
+            view.release()
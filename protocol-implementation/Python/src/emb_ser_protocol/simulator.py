@@ -0,0 +1,395 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import getopt
+import heapq
+import os
+import random
+import select
+import sys
+import threading
+import time
+from emb_ser_protocol import protocol
+
+try:
+    import pty
+    import tty
+except ImportError:
+    pty = None
+
+# Bits on the wire per byte at 8N1, used for baud pacing
+BITS_PER_BYTE = 10
+
+# Message types of the basic_example.ino sketch
+MSG_VERSION = 0x00
+MSG_PING = 0x01
+MSG_SET_VALUE_0 = 0x02
+MSG_GET_VALUE_0 = 0x03
+MSG_POLL_FOR_DATA = 0x04
+MSG_BROADCAST = 0x05
+MSG_NACK = 0x05
+
+
+class device_simulator:
+    """
+    Class for a virtual device on a pseudo-terminal. The simulator opens a pty pair and runs the
+    protocol as a responder on the master side from its own thread, while the tester or any pySerial
+    code opens the slave side (the port attribute) as if it were a real serial device.
+
+    Each frame addressed to the device is passed to the handler registered for its message type. A
+    handler returns the reply: None for no reply, a (msg_type, payload) tuple sent back to the
+    sender, a message sent as is, or a list of those. Replies can be delayed by a fixed latency,
+    paced to a baud rate in both directions, and have errors injected: dropped replies, corrupted
+    replies (one bit flipped) and bursts of line noise before a reply.
+
+    Attributes:
+        addr: Address of the simulated device, frames for it or the broadcast address are handled
+        port: Path of the pty slave, open it with serial.Serial(port)
+        parser: Parser decoding the host's frames
+        handlers: Dictionary of message type to handler
+        default: Handler for message types with no registered handler, None to ignore them
+        latency: Seconds between receiving a frame and starting its reply
+        baud: Baud rate both directions are paced to, None for no pacing
+        drop_rate: Fraction of replies never sent
+        corrupt_rate: Fraction of replies sent with a bit flipped
+        noise_rate: Fraction of replies preceded by up to 16 bytes of line noise
+        error: Exception that stopped the simulator thread, None if it has not failed
+    """
+
+    def __init__(self, addr=0x1A, handlers=None, default=None, latency=0.0, baud=None,
+                 drop_rate=0.0, corrupt_rate=0.0, noise_rate=0.0, seed=None, read_size=4096,
+                 broadcast_addr=0xFF):
+        """
+        Constructor for the device_simulator class. The pty pair is opened straight away so the
+        port can be handed out before the simulator is started.
+
+        Args:
+            addr: Address of the simulated device
+            handlers: Dictionary of message type to handler, None for no handlers
+            default: Handler for message types with no registered handler, None to ignore them
+            latency: Seconds between receiving a frame and starting its reply
+            baud: Baud rate both directions are paced to, None for no pacing
+            drop_rate: Fraction of replies never sent
+            corrupt_rate: Fraction of replies sent with a bit flipped
+            noise_rate: Fraction of replies preceded by up to 16 bytes of line noise
+            seed: Seed for the error injection, None for a random seed
+            read_size: Largest single read from the pty
+            broadcast_addr: Broadcast address the device also answers on, None for none
+        """
+        if pty is None:
+            raise Exception("The device simulator needs a POSIX pseudo-terminal")
+        self.addr = addr
+        self.parser = protocol.parser(addr, broadcast_addr=broadcast_addr)
+        self.handlers = dict(handlers) if handlers is not None else {}
+        self.default = default
+        self.latency = latency
+        self.baud = baud
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.noise_rate = noise_rate
+        self.error = None
+        self._rng = random.Random(seed)
+        self._read_size = read_size
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._wake_r, self._wake_w = os.pipe()
+        self._pending = []
+        self._seq = 0
+        self._tx_free_at = 0.0
+        self._counters = {"bytes_rx": 0, "bytes_tx": 0, "frames_rx": 0, "replies": 0,
+                          "dropped": 0, "corrupted": 0, "noise_bursts": 0}
+
+    def on(self, msg_type, handler):
+        """
+        Register the handler for a message type.
+
+        Args:
+            msg_type: Message type to handle
+            handler: Callable taking the message and returning the reply
+        """
+        self.handlers[msg_type] = handler
+
+    def send(self, msg_type, addr, payload=None, delay=0.0):
+        """
+        Send an unsolicited frame from the device, for example a hello or an async event. The frame
+        goes through the same pacing as replies but never has errors injected.
+
+        Args:
+            msg_type: Message type
+            addr: Target address
+            payload: Payload of the message
+            delay: Seconds to wait before sending
+        """
+        self._schedule(self.parser.build_message(msg_type, addr, payload).to_bytes(), delay)
+
+    def start(self):
+        """
+        Start the simulator thread.
+        """
+        if self._thread is not None:
+            raise Exception("Simulator already started")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="device_simulator " + self.port,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the simulator thread. The pty stays open until close().
+
+        Args:
+            timeout: Seconds to wait for the thread, None to wait forever
+        """
+        self._stop.set()
+        os.write(self._wake_w, b"\x00")
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def close(self):
+        """
+        Stop the simulator and close the pty pair.
+        """
+        self.stop()
+        if self._master is not None:
+            for fd in (self._master, self._slave, self._wake_r, self._wake_w):
+                os.close(fd)
+            self._master = None
+
+    def is_running(self):
+        """
+        True while the simulator thread is alive.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self):
+        """
+        Snapshot of the simulator counters.
+
+        Returns:
+            Dictionary of bytes received and sent, frames received, replies sent and injected errors
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _wire_time(self, length):
+        if self.baud is None:
+            return 0.0
+        return length * BITS_PER_BYTE / float(self.baud)
+
+    def _schedule(self, data, delay):
+        """
+        Queue bytes to be written once delay has passed and the paced line is free. The bytes are
+        written in one go when their last byte would have left the device.
+        """
+        with self._lock:
+            start = max(time.monotonic() + delay, self._tx_free_at)
+            due = start + self._wire_time(len(data))
+            if self.baud is not None:
+                self._tx_free_at = due
+            heapq.heappush(self._pending, (due, self._seq, data))
+            self._seq += 1
+        os.write(self._wake_w, b"\x00")
+
+    def _reply(self, request, reply):
+        """
+        Turn a handler's reply into frames and schedule them, injecting errors.
+        """
+        if reply is None:
+            return
+        if isinstance(reply, list):
+            for item in reply:
+                self._reply(request, item)
+            return
+        if isinstance(reply, protocol.message):
+            msg = reply
+        else:
+            msg_type, payload = reply
+            msg = self.parser.build_message(msg_type, request.src_addr, payload)
+        rng = self._rng
+        with self._lock:
+            self._counters["replies"] += 1
+            if rng.random() < self.drop_rate:
+                self._counters["dropped"] += 1
+                return
+            frame = bytearray(msg.to_bytes())
+            if rng.random() < self.corrupt_rate:
+                # Flip a bit past the header so the frame still looks like a frame but fails the CRC
+                frame[rng.randrange(3, len(frame))] ^= 1 << rng.randrange(8)
+                self._counters["corrupted"] += 1
+            if rng.random() < self.noise_rate:
+                frame[0:0] = bytes(rng.randrange(0, 0xAA) for i in range(rng.randint(1, 16)))
+                self._counters["noise_bursts"] += 1
+        self._schedule(bytes(frame), self.latency)
+
+    def _handle(self, data):
+        self.parser.parse_input_buffer(data)
+        for msg in self.parser.check_for_parsed_messages():
+            with self._lock:
+                self._counters["frames_rx"] += 1
+            handler = self.handlers.get(msg.msg_type, self.default)
+            if handler is not None:
+                self._reply(msg, handler(msg))
+
+    def _run(self):
+        out = bytearray()
+        rx_ready_at = 0.0
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+
+                # Move due frames to the output buffer
+                with self._lock:
+                    while self._pending and self._pending[0][0] <= now:
+                        out += heapq.heappop(self._pending)[2]
+                    next_due = self._pending[0][0] if self._pending else None
+
+                # A paced line takes its time to deliver what the host sent, stop reading until then
+                reading = now >= rx_ready_at
+                timeouts = [t - now for t in (next_due, None if reading else rx_ready_at)
+                            if t is not None]
+                timeout = max(0.0, min(timeouts)) if timeouts else None
+                readable, writable, failed = select.select(
+                    [self._wake_r] + ([self._master] if reading else []),
+                    [self._master] if out else [], [], timeout)
+
+                if self._wake_r in readable:
+                    os.read(self._wake_r, 4096)
+                if self._master in writable:
+                    try:
+                        written = os.write(self._master, out)
+                        del out[:written]
+                        with self._lock:
+                            self._counters["bytes_tx"] += written
+                    except BlockingIOError:
+                        pass
+                if self._master in readable:
+                    try:
+                        data = os.read(self._master, self._read_size)
+                    except BlockingIOError:
+                        continue
+                    with self._lock:
+                        self._counters["bytes_rx"] += len(data)
+                    if self.baud is not None:
+                        rx_ready_at = max(now, rx_ready_at) + self._wire_time(len(data))
+                    self._handle(data)
+        except Exception as e:
+            if not self._stop.is_set():
+                self.error = e
+
+
+# Handlers reproducing the examples/Arduino basic_example.ino sketch
+def basic_example_handlers():
+    """
+    Handlers that answer like the basic_example.ino sketch, so the serial tester's example
+    configuration passes against the simulator.
+
+    Returns:
+        Tuple of the handler dictionary and the default handler
+    """
+    state = {"value_0": 0}
+
+    def set_value(msg):
+        if msg.msg_len > 0:
+            state["value_0"] = msg.msg_payload[0]
+        return (MSG_SET_VALUE_0, [])
+
+    handlers = {
+        MSG_VERSION: lambda msg: (MSG_VERSION, [0x00, 0x02]),
+        MSG_PING: lambda msg: (MSG_PING, []),
+        MSG_SET_VALUE_0: set_value,
+        MSG_GET_VALUE_0: lambda msg: (MSG_GET_VALUE_0, [state["value_0"]]),
+        MSG_POLL_FOR_DATA: lambda msg: (MSG_POLL_FOR_DATA, [1, 1, 1, 1]),
+        MSG_BROADCAST: lambda msg: (MSG_PING, []),
+    }
+    return handlers, lambda msg: (MSG_NACK, [])
+
+
+# Print the usage of the program.
+def print_usage():
+    print("Usage: python -m emb_ser_protocol.simulator [options]")
+    print("Options:")
+    print("-h, --help: Print this help message.")
+    print("-a, --address: Address of the simulated device, default 0x1a.")
+    print("-l, --latency: Seconds before each reply, default 0.")
+    print("-b, --baud: Baud rate to pace the link to, default unpaced.")
+    print("-d, --drop_rate: Fraction of replies dropped.")
+    print("-c, --corrupt_rate: Fraction of replies corrupted.")
+    print("-n, --noise_rate: Fraction of replies preceded by line noise.")
+
+
+# Run a basic_example device on a pty until interrupted
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "ha:l:b:d:c:n:", [
+            "help", "address=", "latency=", "baud=", "drop_rate=", "corrupt_rate=",
+            "noise_rate="])
+    except getopt.GetoptError:
+        print(sys.exc_info()[1])
+        print_usage()
+        sys.exit(2)
+
+    options = {}
+    addr = 0x1A
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print_usage()
+            sys.exit()
+        elif opt in ("-a", "--address"):
+            addr = int(arg, 16)
+        elif opt in ("-l", "--latency"):
+            options["latency"] = float(arg)
+        elif opt in ("-b", "--baud"):
+            options["baud"] = int(arg)
+        elif opt in ("-d", "--drop_rate"):
+            options["drop_rate"] = float(arg)
+        elif opt in ("-c", "--corrupt_rate"):
+            options["corrupt_rate"] = float(arg)
+        elif opt in ("-n", "--noise_rate"):
+            options["noise_rate"] = float(arg)
+
+    handlers, default = basic_example_handlers()
+    with device_simulator(addr, handlers, default, **options) as sim:
+        print("Simulating device " + hex(addr) + " on " + sim.port)
+        sys.stdout.flush()
+        try:
+            while sim.is_running():
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        print(sim.stats())
+        if sim.error != None:
+            print("Error: " + str(sim.error))
+
+
+# Main caller
+if __name__ == "__main__":
+    main(sys.argv[1:])
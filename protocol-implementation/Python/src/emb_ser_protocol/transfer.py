@@ -0,0 +1,413 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import mmap
+import random
+import struct
+import time
+from emb_ser_protocol import protocol
+from emb_ser_protocol import crc as crc16
+
+# Message types of the transfer frames, change them if they clash with the application's types
+TRANSFER_START = 0xF0
+TRANSFER_DATA = 0xF1
+TRANSFER_ACK = 0xF2
+
+# Start payload: transfer id, total length, chunk size
+START_STRUCT = struct.Struct(">IIH")
+# Data payload prefix: transfer id, chunk sequence number, followed by the chunk
+DATA_STRUCT = struct.Struct(">II")
+# Ack payload: transfer id, sequence number of the next chunk expected
+ACK_STRUCT = struct.Struct(">II")
+
+# Largest chunk that fits a frame next to the data prefix
+MAX_CHUNK_SIZE = protocol.MAX_MSG_LEN - DATA_STRUCT.size
+DEFAULT_CHUNK_SIZE = 1024
+
+# Bits on the line per byte, 8N1 framing adds a start and a stop bit
+BITS_PER_BYTE = 10
+
+
+class transfer_sender:
+    """
+    Class for the sending side of a bulk transfer. The data is cut into chunks that each go out in
+    a data frame, after a start frame announcing the total length so the receiver can preallocate.
+    Up to window chunks are in flight at once. The receiver acknowledges cumulatively with the
+    sequence number of the next chunk it expects, and when no acknowledgement moves the window on
+    within timeout seconds every chunk from the oldest unacknowledged one is sent again.
+
+    Chunks are read straight from a memoryview of the data and encoded into one reusable burst
+    buffer, so a large file mapped with mmap is never copied whole. Each transfer gets a random
+    32 bit id, so a receiver does not mistake a new transfer of the same size for an old one.
+
+    Attributes:
+        target_addr: Address of the receiver
+        chunk_size: Data bytes per frame
+        window: Maximum number of chunks in flight
+        timeout: Seconds without progress before the window is sent again
+        retries: Number of times in a row the window is sent again before giving up
+        baud: Line rate in bits per second the throughput is reported against, None to leave it out
+    """
+
+    def __init__(self, write, read, msg_parser, target_addr, chunk_size=DEFAULT_CHUNK_SIZE,
+                 window=8, timeout=0.5, retries=5, baud=None, clock=time.monotonic):
+        """
+        Constructor for the transfer_sender class
+
+        Args:
+            write: Callable taking the bytes to send, e.g. ser.write. The buffer passed is reused,
+                write must be done with it when it returns
+            read: Callable returning received bytes, possibly empty, e.g. a short timeout ser.read
+            msg_parser: Parser decoding the acknowledgements, frames are sent from its address
+            target_addr: Address of the receiver
+            chunk_size: Data bytes per frame, at most MAX_CHUNK_SIZE
+            window: Maximum number of chunks in flight
+            timeout: Seconds without progress before the window is sent again
+            retries: Number of times in a row the window is sent again before giving up
+            baud: Line rate in bits per second the throughput is reported against
+            clock: Monotonic clock returning seconds
+        """
+        if chunk_size < 1 or chunk_size > MAX_CHUNK_SIZE:
+            raise Exception("Chunk size out of range: " + str(chunk_size))
+        if window < 1:
+            raise Exception("Window must be at least 1")
+        self.write = write
+        self.read = read
+        self.parser = msg_parser
+        self.target_addr = target_addr
+        self.chunk_size = chunk_size
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+        self.baud = baud
+        self.clock = clock
+        self._rng = random.SystemRandom()
+        self._burst = bytearray(window * (protocol.FRAME_OVERHEAD_LEN + DATA_STRUCT.size +
+                                          chunk_size))
+
+    def send(self, data):
+        """
+        Send a buffer and wait until the receiver has acknowledged all of it.
+
+        Args:
+            data: bytes, bytearray, memoryview or mmap holding the data
+
+        Returns:
+            Dictionary report of the transfer, see report()
+        """
+        with memoryview(data) as view:
+            with view.cast("B") as flat:
+                return self._send(flat)
+
+    def send_file(self, path):
+        """
+        Send a file, mapped into memory rather than read.
+
+        Args:
+            path: Path of the file
+
+        Returns:
+            Dictionary report of the transfer, see report()
+        """
+        with open(path, "rb") as f:
+            # An empty file cannot be mapped
+            if f.seek(0, 2) == 0:
+                return self.send(b"")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return self.send(data)
+
+    def _send(self, view):
+        total = len(view)
+        chunk_size = self.chunk_size
+        count = (total + chunk_size - 1) // chunk_size
+        transfer_id = self._rng.getrandbits(32)
+        counters = {"frames": 0, "retransmits": 0, "timeouts": 0, "wire_bytes": 0, "unexpected": 0}
+        start = self.clock()
+
+        # The receiver acknowledges the start frame once it has room for the whole transfer
+        start_frame = self.parser.build_message(TRANSFER_START, self.target_addr, START_STRUCT.pack(
+            transfer_id, total, chunk_size)).to_bytes()
+        base = None
+        attempts = 0
+        while base is None and attempts <= self.retries:
+            self.write(start_frame)
+            counters["frames"] += 1
+            counters["wire_bytes"] += len(start_frame)
+            attempts += 1
+            deadline = self.clock() + self.timeout
+            while base is None and self.clock() < deadline:
+                base = self._poll(transfer_id, counters)
+            if base is None:
+                counters["timeouts"] += 1
+        if base is None:
+            return self.report(start, self.clock(), total, 0, count, counters)
+
+        # Go back N, every chunk past the acknowledged base is sent again on a timeout
+        next_seq = base
+        sent_max = base
+        attempts = 0
+        last_progress = self.clock()
+        while base < count:
+            if next_seq < min(base + self.window, count):
+                next_seq = self._send_burst(view, transfer_id, next_seq,
+                                            min(base + self.window, count), sent_max, counters)
+                sent_max = max(sent_max, next_seq)
+            acked = self._poll(transfer_id, counters)
+            now = self.clock()
+            if acked is not None and acked > base:
+                base = min(acked, count)
+                next_seq = max(next_seq, base)
+                attempts = 0
+                last_progress = now
+            elif now - last_progress >= self.timeout:
+                counters["timeouts"] += 1
+                attempts += 1
+                if attempts > self.retries:
+                    break
+                next_seq = base
+                last_progress = now
+        return self.report(start, self.clock(), total, base, count, counters)
+
+    def _send_burst(self, view, transfer_id, seq, stop, sent_max, counters):
+        """
+        Encode the chunks from seq up to stop into the burst buffer and write them in one call.
+
+        Returns:
+            Sequence number of the next chunk to send
+        """
+        buf = self._burst
+        chunk_size = self.chunk_size
+        src_addr = self.parser.my_addr
+        offset = 0
+        with memoryview(buf) as out:
+            while seq < stop:
+                begin = seq * chunk_size
+                chunk = view[begin:begin + chunk_size]
+                msg_len = DATA_STRUCT.size + len(chunk)
+                protocol.HEADER_STRUCT.pack_into(buf, offset, protocol.HEADER, src_addr,
+                                                 self.target_addr, TRANSFER_DATA, msg_len)
+                start = offset + protocol.FRAME_HEADER_LEN
+                DATA_STRUCT.pack_into(buf, start, transfer_id, seq)
+                out[start + DATA_STRUCT.size:start + msg_len] = chunk
+                crc = crc16.update(protocol.HEADER_CRC, out[offset + 3:start + msg_len])
+                protocol.CRC_STRUCT.pack_into(buf, start + msg_len, crc)
+                offset = start + msg_len + 2
+                counters["frames"] += 1
+                if seq < sent_max:
+                    counters["retransmits"] += 1
+                seq += 1
+            self.write(out[:offset])
+        counters["wire_bytes"] += offset
+        return seq
+
+    def _poll(self, transfer_id, counters):
+        """
+        Read once and return the highest acknowledgement of this transfer received.
+
+        Returns:
+            Sequence number of the next chunk the receiver expects, None if no acknowledgement came
+        """
+        acked = None
+        data = self.read()
+        if data:
+            self.parser.parse_input_buffer(data)
+            for msg in self.parser.check_for_parsed_messages():
+                if (msg.src_addr == self.target_addr and msg.msg_type == TRANSFER_ACK and
+                        msg.msg_len == ACK_STRUCT.size):
+                    ack_id, seq = ACK_STRUCT.unpack(msg.msg_payload)
+                    if ack_id == transfer_id:
+                        acked = seq if acked is None else max(acked, seq)
+                        continue
+                counters["unexpected"] += 1
+        return acked
+
+    def report(self, start, stop, total, acked, count, counters):
+        """
+        Build the report of a transfer.
+
+        Returns:
+            Dictionary of the bytes and chunks acknowledged, frames sent and sent again, timeouts,
+            the data rate, and with a baud rate the fraction of the line the data and every byte
+            written took up
+        """
+        seconds = stop - start
+        delivered = min(acked * self.chunk_size, total)
+        bytes_per_second = delivered / seconds if seconds > 0 else None
+        baud_fraction = None
+        wire_fraction = None
+        if self.baud and seconds > 0:
+            baud_fraction = bytes_per_second * BITS_PER_BYTE / self.baud
+            wire_fraction = counters["wire_bytes"] / seconds * BITS_PER_BYTE / self.baud
+        return {
+            "complete": acked >= count,
+            "bytes": total,
+            "bytes_acked": delivered,
+            "chunks": count,
+            "chunks_acked": acked,
+            "chunk_size": self.chunk_size,
+            "window": self.window,
+            "frames_sent": counters["frames"],
+            "retransmits": counters["retransmits"],
+            "timeouts": counters["timeouts"],
+            "unexpected": counters["unexpected"],
+            "wire_bytes": counters["wire_bytes"],
+            "seconds": seconds,
+            "bytes_per_second": bytes_per_second,
+            "baud": self.baud,
+            "baud_fraction": baud_fraction,
+            "wire_fraction": wire_fraction,
+        }
+
+
+class transfer_receiver:
+    """
+    Class for the receiving side of a bulk transfer. A start frame sets up a buffer of the announced
+    length, data frames are copied into it in order and every frame is answered with a cumulative
+    acknowledgement. Chunks that arrive out of order are dropped, the sender goes back and sends
+    them again.
+
+    handle() takes a received frame and returns the reply as a (msg_type, payload) tuple, the form
+    device_simulator handlers return, or None. handlers() gives the dictionary to register.
+
+    Attributes:
+        transfer_id: Id of the current transfer, None before the first start frame
+        total: Length of the current transfer
+        chunk_size: Chunk size of the current transfer
+        expected: Sequence number of the next chunk expected
+        done: True once every chunk of the current transfer is in
+        duplicates: Chunks received again after they were already in
+        out_of_order: Chunks received ahead of a missing one and dropped
+        rejected: Start frames refused because the transfer did not fit, counted per attempt
+        on_complete: Callable given the data as a memoryview when a transfer completes
+    """
+
+    def __init__(self, buffer=None, on_complete=None, max_size=None):
+        """
+        Constructor for the transfer_receiver class
+
+        Args:
+            buffer: Writable buffer (bytearray, mmap, ...) to reassemble into, None to allocate one
+                of the announced length for each transfer
+            on_complete: Callable given the data as a memoryview when a transfer completes
+            max_size: Largest transfer accepted when allocating, None for no limit
+        """
+        self.buffer = buffer
+        self.on_complete = on_complete
+        self.max_size = max_size
+        self.transfer_id = None
+        self.total = 0
+        self.chunk_size = 0
+        self.count = 0
+        self.expected = 0
+        self.done = False
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.rejected = 0
+        self._view = None
+
+    @property
+    def data(self):
+        """
+        memoryview of the reassembled data of the current transfer, None before the first one
+        """
+        if self._view is None:
+            return None
+        return self._view[:self.total]
+
+    def handlers(self):
+        """
+        Handlers to register for the transfer message types, e.g. with device_simulator.on
+
+        Returns:
+            Dictionary of message type to handler
+        """
+        return {TRANSFER_START: self.handle, TRANSFER_DATA: self.handle}
+
+    def handle(self, msg):
+        """
+        Handle a start or data frame.
+
+        Args:
+            msg: Received message
+
+        Returns:
+            (TRANSFER_ACK, payload) reply, None for frames that get no reply
+        """
+        if msg.msg_type == TRANSFER_START and msg.msg_len == START_STRUCT.size:
+            return self._start(*START_STRUCT.unpack(msg.msg_payload))
+        if (msg.msg_type != TRANSFER_DATA or msg.msg_len < DATA_STRUCT.size or
+                self._view is None):
+            return None
+        transfer_id, seq = DATA_STRUCT.unpack_from(msg.msg_payload)
+        if transfer_id != self.transfer_id:
+            return None
+        if seq == self.expected and seq < self.count:
+            begin = seq * self.chunk_size
+            end = min(begin + self.chunk_size, self.total)
+            if msg.msg_len - DATA_STRUCT.size != end - begin:
+                return None
+            with memoryview(msg.msg_payload) as payload:
+                self._view[begin:end] = payload[DATA_STRUCT.size:]
+            self.expected += 1
+            if self.expected == self.count:
+                self._complete()
+        elif seq < self.expected:
+            self.duplicates += 1
+        else:
+            self.out_of_order += 1
+        return (TRANSFER_ACK, ACK_STRUCT.pack(self.transfer_id, self.expected))
+
+    def _start(self, transfer_id, total, chunk_size):
+        """
+        Set up for a transfer, or acknowledge a start frame sent again. A resend is checked for
+        before anything else, so a start whose acknowledgement was lost is only acknowledged again,
+        even once its transfer has completed. Transfer ids are random, so a new transfer of the same
+        size never matches.
+
+        Returns:
+            (TRANSFER_ACK, payload) reply, None if the transfer is refused
+        """
+        if (transfer_id, total, chunk_size) == (self.transfer_id, self.total, self.chunk_size):
+            return (TRANSFER_ACK, ACK_STRUCT.pack(transfer_id, self.expected))
+        if chunk_size == 0:
+            return None
+        if self.buffer is not None:
+            if len(self.buffer) < total:
+                self.rejected += 1
+                return None
+            view = memoryview(self.buffer)
+        else:
+            if self.max_size is not None and total > self.max_size:
+                self.rejected += 1
+                return None
+            view = memoryview(bytearray(total))
+        self._view = view
+        self.transfer_id = transfer_id
+        self.total = total
+        self.chunk_size = chunk_size
+        self.count = (total + chunk_size - 1) // chunk_size
+        self.expected = 0
+        self.done = False
+        if self.count == 0:
+            self._complete()
+        return (TRANSFER_ACK, ACK_STRUCT.pack(transfer_id, 0))
+
+    def _complete(self):
+        self.done = True
+        if self.on_complete is not None:
+            self.on_complete(self.data)
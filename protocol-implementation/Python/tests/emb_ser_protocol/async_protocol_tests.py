@@ -0,0 +1,109 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import asyncio
+import socket
+import unittest
+from random import randint
+from emb_ser_protocol.async_protocol import serial_protocol
+
+
+# Helper function to connect two protocols over a socketpair
+async def connect_pair(addr_a, addr_b):
+    loop = asyncio.get_running_loop()
+    sock_a, sock_b = socket.socketpair()
+    _, side_a = await loop.create_connection(lambda: serial_protocol(addr_a), sock=sock_a)
+    _, side_b = await loop.create_connection(lambda: serial_protocol(addr_b), sock=sock_b)
+    return side_a, side_b
+
+
+class TestAsyncProtocol(unittest.TestCase):
+    # Test a message sent on one side is received on the other
+    def test_send_recv(self):
+        async def run():
+            side_a, side_b = await connect_pair(0x01, 0x02)
+            sent = await side_a.send(0x10, 0x02, [1, 2, 3])
+            received = await asyncio.wait_for(side_b.recv(), 5)
+            side_a.close()
+            side_b.close()
+            return sent, received
+
+        sent, received = asyncio.run(run())
+        self.assertEqual(sent, received)
+
+    # Test async iteration yields every message in order and ends when the peer closes
+    def test_async_iteration(self):
+        async def run():
+            side_a, side_b = await connect_pair(0x01, 0x02)
+            sent = []
+            for i in range(50):
+                sent.append(await side_a.send(i, 0x02, [randint(0, 255) for j in range(i * 10)]))
+            # Frames for another address are dropped by the parser
+            await side_a.send(0x99, 0x03, [])
+            side_a.close()
+            received = []
+            async for msg in side_b:
+                received.append(msg)
+            return sent, received
+
+        sent, received = asyncio.run(asyncio.wait_for(run(), 10))
+        self.assertEqual(sent, received)
+
+    # Test send applies backpressure with a tiny write buffer and large frames
+    def test_backpressure(self):
+        async def run():
+            side_a, side_b = await connect_pair(0x01, 0x02)
+            side_a.transport.set_write_buffer_limits(high=1024)
+            payload = bytes(randint(0, 255) for i in range(60000))
+
+            async def sender():
+                for i in range(20):
+                    await side_a.send(i, 0x02, payload)
+                    # drain() holds the buffer near the high water mark
+                    self.assertLess(side_a.transport.get_write_buffer_size(), 2 * 60010 + 1024)
+
+            async def receiver():
+                count = 0
+                while count < 20:
+                    msg = await side_b.recv()
+                    self.assertEqual(payload, msg.msg_payload)
+                    count += 1
+                return count
+
+            _, count = await asyncio.gather(sender(), receiver())
+            side_a.close()
+            side_b.close()
+            return count
+
+        self.assertEqual(20, asyncio.run(asyncio.wait_for(run(), 30)))
+
+    # Test send after the connection is gone raises
+    def test_send_after_close(self):
+        async def run():
+            side_a, side_b = await connect_pair(0x01, 0x02)
+            side_b.close()
+            async for msg in side_a:
+                pass
+            with self.assertRaises(ConnectionResetError):
+                await side_a.send(0x01, 0x02, [])
+
+        asyncio.run(asyncio.wait_for(run(), 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import os
+import shutil
+import tempfile
+import unittest
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol.capture import capture_writer, capture_reader, INDEX_SUFFIX
+
+
+# Helper function to build frames addressed to 0x01, message type cycling through 0..7
+def build_frames(count):
+    sender = prot.parser(0x02)
+    return [sender.build_message(i % 8, 0x01, [i & 0xFF] * (i % 40)) for i in range(count)]
+
+
+class TestCapture(unittest.TestCase):
+    # Test setup method
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "test.cap")
+
+    # Test teardown method
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    # Helper to record frames one second apart starting at t=1000
+    def record(self, msgs, index_interval=16):
+        with capture_writer(self.path, port=3, index_interval=index_interval) as writer:
+            for i, msg in enumerate(msgs):
+                writer.write_message(msg, timestamp=1000 + i)
+
+    # Test every record reads back in order with its timestamp, port and frame
+    def test_round_trip(self):
+        msgs = build_frames(100)
+        self.record(msgs)
+        with capture_reader(self.path) as reader:
+            records = [(ts, port, bytes(frame)) for ts, port, frame in reader]
+        self.assertEqual(100, len(records))
+        for i, (ts, port, frame) in enumerate(records):
+            self.assertEqual(1000 + i, ts)
+            self.assertEqual(3, port)
+            self.assertEqual(msgs[i].to_bytes(), frame)
+
+    # Test frames come back as memoryviews into the mapping
+    def test_zero_copy(self):
+        self.record(build_frames(4))
+        with capture_reader(self.path) as reader:
+            for ts, port, frame in reader:
+                self.assertIsInstance(frame, memoryview)
+                frame.release()
+
+    # Test the sparse index narrows reads by time and message type
+    def test_index_filters(self):
+        msgs = build_frames(100)
+        self.record(msgs)
+        with capture_reader(self.path) as reader:
+            self.assertEqual(7, len(reader.index))
+            got = [bytes(f) for ts, port, f in reader.records(start=1040, stop=1050)]
+            self.assertEqual([m.to_bytes() for m in msgs[40:50]], got)
+            got = [bytes(f) for ts, port, f in reader.records(msg_types=[3, 5])]
+            self.assertEqual([m.to_bytes() for m in msgs if m.msg_type in (3, 5)], got)
+            self.assertEqual([], list(reader.records(port=4)))
+
+    # Test blocks are skipped using only the index, a type missing from a block never visits it
+    def test_index_skips_blocks(self):
+        sender = prot.parser(0x02)
+        with capture_writer(self.path, index_interval=10) as writer:
+            for i in range(100):
+                writer.write_message(sender.build_message(0x10 if i < 90 else 0x20, 0x01, [i]),
+                                     timestamp=i)
+        with capture_reader(self.path) as reader:
+            blocks = [e for e in reader.index if e.types & 1 << 0x20]
+            self.assertEqual(1, len(blocks))
+            self.assertEqual(10, len(list(reader.records(msg_types=[0x20]))))
+
+    # Test a capture without its sidecar, or with records past the sidecar, is indexed by scanning
+    def test_missing_and_stale_index(self):
+        msgs = build_frames(50)
+        self.record(msgs)
+        os.remove(self.path + INDEX_SUFFIX)
+        with capture_reader(self.path, index_interval=8) as reader:
+            self.assertEqual(7, len(reader.index))
+            self.assertEqual(50, len(list(reader.records(msg_types=range(8)))))
+
+        # A writer that has not been closed leaves a partial block and a partial record
+        writer = capture_writer(self.path, index_interval=16)
+        for i, msg in enumerate(msgs):
+            writer.write_message(msg, timestamp=i)
+        writer.flush()
+        with open(self.path, "ab") as f:
+            f.write(b"\x00\x01\x02")
+        with capture_reader(self.path) as reader:
+            self.assertEqual([m.to_bytes() for m in msgs], [bytes(f) for ts, p, f in reader])
+        writer.close()
+
+    # Test replaying a capture through a parser reproduces the messages
+    def test_replay(self):
+        msgs = build_frames(60)
+        self.record(msgs)
+        p = prot.parser(0x01)
+        with capture_reader(self.path) as reader:
+            self.assertEqual(60, reader.replay(p))
+            self.assertEqual(msgs, p.check_for_parsed_messages())
+            self.assertEqual(10, reader.replay(p, start=1010, stop=1020))
+            self.assertEqual(msgs[10:20], p.check_for_parsed_messages())
+
+    # Test a file that is not a capture is rejected
+    def test_not_a_capture(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a capture file")
+        self.assertRaises(Exception, capture_reader, self.path)
+        open(self.path, "wb").close()
+        self.assertRaises(Exception, capture_reader, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
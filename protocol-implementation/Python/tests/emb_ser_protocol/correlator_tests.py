@@ -0,0 +1,113 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import unittest
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol.correlator import correlator, percentile
+from fake_device import DEVICE_ADDR, HOST_ADDR, fake_device
+
+
+# Fake device that echoes each command's type back after a fixed number of reads
+def echo_device(delay_reads=0, drop_first=(), swap_pairs=False):
+    pending = set(drop_first)
+
+    # Drop the first command of each listed type
+    def drop(count, cmd):
+        if cmd.msg_type in pending:
+            pending.discard(cmd.msg_type)
+            return True
+        return False
+
+    return fake_device(lambda cmd: (cmd.msg_type, cmd.msg_payload), delay_reads, drop=drop,
+                       reverse=swap_pairs)
+
+
+# Helper function to build command / expected response pairs
+def build_pairs(count):
+    host = prot.parser(HOST_ADDR)
+    device = prot.parser(DEVICE_ADDR)
+    pairs = []
+    for i in range(count):
+        cmd = host.build_message(i, DEVICE_ADDR, [i])
+        rsp = device.build_message(i, HOST_ADDR, [i])
+        pairs.append((cmd, rsp))
+    return pairs
+
+
+class TestCorrelator(unittest.TestCase):
+    # Test a window of one behaves like stop and wait
+    def test_stop_and_wait(self):
+        dev = echo_device(delay_reads=2)
+        corr = correlator(dev.write, dev.read, prot.parser(HOST_ADDR), window=1, clock=dev.now)
+        results = corr.run(build_pairs(10))
+        self.assertEqual(1, dev.max_in_flight)
+        for ex in results:
+            self.assertEqual(ex.expected, ex.response)
+            self.assertEqual(1, ex.attempts)
+            self.assertAlmostEqual(0.003, ex.rtt)
+
+    # Test a wider window keeps several commands in flight and finishes in fewer reads
+    def test_pipelined(self):
+        dev = echo_device(delay_reads=5)
+        corr = correlator(dev.write, dev.read, prot.parser(HOST_ADDR), window=8, clock=dev.now)
+        results = corr.run(build_pairs(40))
+        self.assertEqual(8, dev.max_in_flight)
+        self.assertLess(dev.clock, 0.040)
+        for ex in results:
+            self.assertEqual(ex.expected, ex.response)
+
+    # Test responses arriving out of order are still matched to the right command
+    def test_out_of_order(self):
+        dev = echo_device(swap_pairs=True)
+        corr = correlator(dev.write, dev.read, prot.parser(HOST_ADDR), window=4, clock=dev.now)
+        results = corr.run(build_pairs(12))
+        for ex in results:
+            self.assertEqual(ex.expected, ex.response)
+        self.assertEqual([], corr.unmatched)
+
+    # Test a dropped command is resent after the timeout
+    def test_retry(self):
+        dev = echo_device(drop_first=(3,))
+        corr = correlator(dev.write, dev.read, prot.parser(HOST_ADDR), window=4, timeout=0.01,
+                          retries=2, clock=dev.now)
+        results = corr.run(build_pairs(6))
+        self.assertEqual(2, results[3].attempts)
+        self.assertEqual(results[3].expected, results[3].response)
+        self.assertFalse(results[3].timed_out)
+
+    # Test a command that never gets a response times out without stalling the rest
+    def test_timeout(self):
+        dev = echo_device(drop_first=(2,))
+        corr = correlator(dev.write, dev.read, prot.parser(HOST_ADDR), window=4, timeout=0.01,
+                          retries=0, clock=dev.now)
+        results = corr.run(build_pairs(6))
+        self.assertTrue(results[2].timed_out)
+        self.assertIsNone(results[2].response)
+        for i in (0, 1, 3, 4, 5):
+            self.assertEqual(results[i].expected, results[i].response)
+
+    # Test the percentile helper
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(5, percentile(list(range(11)), 50))
+        self.assertEqual(10, percentile(list(range(11)), 100))
+        self.assertEqual(0, percentile(list(range(11)), 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import unittest
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol.crc_batch import crc16_batch, validate_batch, HAVE_NUMPY
+from random import randint
+
+
+# Helper function to build messages with a spread of payload sizes, a few of them long
+def build_messages(count):
+    sender = prot.parser(0x02)
+    msgs = []
+    for i in range(count):
+        size = randint(0, 4000) if i % 50 == 0 else randint(0, 64)
+        msgs.append(sender.build_message(randint(0, 255), randint(0, 255),
+                                         bytes(randint(0, 255) for j in range(size))))
+    return msgs
+
+
+class TestCrcBatchPython(unittest.TestCase):
+    use_numpy = False
+
+    # Test batch CRCs against calculate_crc
+    def test_crc_matches_calculate_crc(self):
+        msgs = build_messages(300)
+        crcs = crc16_batch([m.to_bytes() for m in msgs], use_numpy=self.use_numpy)
+        self.assertEqual([prot.calculate_crc(m) for m in msgs], [int(c) for c in crcs])
+
+    # Test a full length frame
+    def test_max_length_frame(self):
+        msg = prot.build_message(0x01, 0x02, bytes(randint(0, 255) for i in range(prot.MAX_MSG_LEN)))
+        crcs = crc16_batch([msg.to_bytes(), prot.build_message(0x01, 0x02, []).to_bytes()],
+                           use_numpy=self.use_numpy)
+        self.assertEqual(prot.calculate_crc(msg), int(crcs[0]))
+
+    # Test the mask flags corrupted and short frames
+    def test_validate_batch(self):
+        msgs = build_messages(200)
+        frames = [bytearray(m.to_bytes()) for m in msgs]
+        expected = []
+        for i, frame in enumerate(frames):
+            if i % 3 == 0:
+                frame[randint(3, len(frame) - 1)] ^= 1 << randint(0, 7)
+            expected.append(i % 3 != 0)
+        frames += [b"", b"\xaa", bytes(9)]
+        expected += [False, False, False]
+        mask = validate_batch([memoryview(f) for f in frames], use_numpy=self.use_numpy)
+        self.assertEqual(expected, [bool(v) for v in mask])
+
+    # Test an empty batch
+    def test_empty(self):
+        self.assertEqual(0, len(crc16_batch([], use_numpy=self.use_numpy)))
+        self.assertEqual(0, len(validate_batch([], use_numpy=self.use_numpy)))
+
+
+@unittest.skipIf(not HAVE_NUMPY, "NumPy is not installed")
+class TestCrcBatchNumpy(TestCrcBatchPython):
+    use_numpy = True
+
+    # Test the NumPy path returns arrays
+    def test_array_results(self):
+        frames = [m.to_bytes() for m in build_messages(100)]
+        self.assertEqual("uint16", str(crc16_batch(frames).dtype))
+        self.assertEqual("bool", str(validate_batch(frames).dtype))
+        self.assertTrue(validate_batch(frames).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import unittest
+import emb_ser_protocol.crc as crc16
+import emb_ser_protocol.protocol as prot
+from random import randint
+
+
+# Reference bitwise CRC, this is the algorithm the table is derived from
+def bitwise_crc(byte_list):
+    crc = 0xFFFF
+    for byte in byte_list:
+        crc = crc ^ byte
+        for j in range(8):
+            if (crc & 0x0001):
+                crc = crc >> 1
+                crc = crc ^ 0xA001
+            else:
+                crc = crc >> 1
+    return crc
+
+
+class TestCrc(unittest.TestCase):
+    # Test the table against the bitwise algorithm for every single byte value
+    def test_single_bytes(self):
+        for byte in range(256):
+            self.assertEqual(bitwise_crc([byte]), crc16.crc16([byte]))
+
+    # Test random blocks against the bitwise algorithm
+    def test_random_blocks(self):
+        for i in range(20):
+            data = [randint(0, 255) for i in range(randint(0, 2048))]
+            self.assertEqual(bitwise_crc(data), crc16.crc16(data))
+
+    # Test that bytes, bytearray, memoryview and lists all give the same answer
+    def test_buffer_types(self):
+        data = [randint(0, 255) for i in range(512)]
+        expected = bitwise_crc(data)
+        self.assertEqual(expected, crc16.crc16(bytes(data)))
+        self.assertEqual(expected, crc16.crc16(bytearray(data)))
+        self.assertEqual(expected, crc16.crc16(memoryview(bytes(data))))
+
+    # Test that folding chunks in incrementally matches a single pass
+    def test_incremental_update(self):
+        data = bytes([randint(0, 255) for i in range(1000)])
+        crc = crc16.CRC_INIT
+        pos = 0
+        while pos < len(data):
+            step = randint(1, 64)
+            crc = crc16.update(crc, data[pos:pos + step])
+            pos += step
+        self.assertEqual(crc16.crc16(data), crc)
+
+    # Test an empty chunk leaves the CRC untouched
+    def test_empty_update(self):
+        self.assertEqual(crc16.CRC_INIT, crc16.crc16(b""))
+        self.assertEqual(0x1234, crc16.update(0x1234, b""))
+
+    # Test calculate_crc against a known frame from the serial tester output
+    def test_calculate_crc_known_frame(self):
+        msg = prot.message(0x00, 0x01, 0x1a, 0, [], 0)
+        self.assertEqual(0xdee1, prot.calculate_crc(msg))
+        msg = prot.message(0x04, 0x1a, 0x01, 4, [1, 1, 1, 1], 0)
+        self.assertEqual(0x258c, prot.calculate_crc(msg))
+
+    # Test calculate_crc against the bitwise algorithm over the whole frame
+    def test_calculate_crc_matches_bitwise(self):
+        payload = [randint(0, 255) for i in range(300)]
+        msg = prot.message(0x10, 0x02, 0x03, len(payload), payload, 0)
+        frame = [0xAA, 0x55, 0xFF, 0x02, 0x03, 0x10, len(payload) >> 8,
+                 len(payload) & 0xFF] + payload
+        self.assertEqual(bitwise_crc(frame), prot.calculate_crc(msg))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol.decode import decode_buffer, decode_file
+
+
+# Helper function to build a dump of frames, noise, corrupted frames and frames nested in payloads
+def generate_dump(count, seed):
+    rng = random.Random(seed)
+    sender = prot.parser(0x02)
+    stream = bytearray()
+    for i in range(count):
+        kind = rng.randint(0, 9)
+        if kind == 0:
+            stream += bytes(rng.randint(0, 255) for j in range(rng.randint(1, 20)))
+        elif kind == 1:
+            # A valid frame hidden in the payload of another, only the outer frame is real
+            inner = sender.build_message(0x30, 0x01, [0xAA, 0x55, 0xFF]).to_bytes()
+            stream += sender.build_message(0x31, 0x01, bytes(rng.randint(0, 255) for j in range(
+                rng.randint(0, 30))) + inner * 3).to_bytes()
+        elif kind == 2:
+            frame = bytearray(sender.build_message(0x32, 0x01, [i & 0xFF] * 12).to_bytes())
+            frame[rng.randint(3, len(frame) - 1)] ^= 0x10
+            stream += frame
+        else:
+            stream += sender.build_message(i & 0xFF, rng.choice([0x01, 0x03]), bytes(
+                rng.randint(0, 255) for j in range(rng.randint(0, 200)))).to_bytes()
+    return bytes(stream)
+
+
+class TestDecodeFile(unittest.TestCase):
+    # Test setup method
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "dump.bin")
+
+    # Test teardown method
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    # Helper to write a dump
+    def write(self, data):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    # Test a clean stream decodes to the same messages as the parser
+    def test_clean_matches_parser(self):
+        sender = prot.parser(0x02)
+        msgs = [sender.build_message(i & 0xFF, 0x01, [i & 0xFF] * (i % 70)) for i in range(300)]
+        data = prot.encode_many(msgs)
+        self.write(data)
+        self.assertEqual(msgs, decode_buffer(data))
+        self.assertEqual(msgs, decode_file(self.path, workers=3, chunk_size=997))
+
+    # Test parallel decoding matches the single threaded decode for every chunk size
+    def test_parallel_matches_serial(self):
+        data = generate_dump(400, 1)
+        self.write(data)
+        expected = decode_buffer(data)
+        self.assertGreater(len(expected), 300)
+        for chunk_size in (64, 100, 333, 1000, 4096):
+            self.assertEqual(expected, decode_file(self.path, workers=4, chunk_size=chunk_size))
+        self.assertEqual(expected, decode_file(self.path, workers=1))
+
+    # Test a boundary inside a frame with a valid frame nested in its payload
+    def test_nested_frame_at_boundary(self):
+        sender = prot.parser(0x02)
+        inner = sender.build_message(0x30, 0x01, [1, 2, 3]).to_bytes()
+        outer = sender.build_message(0x31, 0x01, bytes(50) + inner + bytes(50)).to_bytes()
+        data = outer * 20
+        self.write(data)
+        expected = decode_buffer(data)
+        self.assertEqual(20, len(expected))
+        for chunk_size in range(40, 200, 7):
+            self.assertEqual(expected, decode_file(self.path, workers=2, chunk_size=chunk_size))
+
+    # Test filtering on the target address
+    def test_address_filter(self):
+        data = generate_dump(200, 2)
+        self.write(data)
+        expected = [m for m in decode_buffer(data) if m.tgt_addr == 0x03]
+        self.assertEqual(expected, decode_buffer(data, addr=0x03))
+        self.assertEqual(expected, decode_file(self.path, workers=2, addr=0x03, chunk_size=500))
+
+    # Test an empty dump
+    def test_empty(self):
+        self.write(b"")
+        self.assertEqual([], decode_file(self.path, workers=2))
+
+
+if __name__ == '__main__':
+    unittest.main()
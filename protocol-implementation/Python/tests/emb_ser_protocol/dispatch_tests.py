@@ -0,0 +1,139 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import unittest
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol.dispatch import dispatcher, ANY_ADDR
+
+
+# Helper function to build a message from a source address
+def build_from(src_addr, msg_type, payload=None):
+    return prot.parser(src_addr).build_message(msg_type, 0x01, payload)
+
+
+class TestDispatcher(unittest.TestCase):
+    # Test messages go to the handler for their type
+    def test_by_type(self):
+        calls = []
+        d = dispatcher()
+        d.register(0x01, lambda m: calls.append(("one", m.msg_type)))
+        d.register(0x02, lambda m: calls.append(("two", m.msg_type)))
+        d.dispatch(build_from(0x10, 0x02))
+        d.dispatch(build_from(0x10, 0x01))
+        d.dispatch(build_from(0x10, 0x03))
+        self.assertEqual([("two", 0x02), ("one", 0x01)], calls)
+
+    # Test a source specific handler wins over the any source handler
+    def test_by_type_and_source(self):
+        calls = []
+        d = dispatcher()
+        d.register(0x01, lambda m: calls.append("any"))
+        d.register(0x01, lambda m: calls.append("src"), src_addr=0x20)
+        d.dispatch(build_from(0x20, 0x01))
+        d.dispatch(build_from(0x21, 0x01))
+        self.assertEqual(["src", "any"], calls)
+
+        d.unregister(0x01, 0x20)
+        d.dispatch(build_from(0x20, 0x01))
+        self.assertEqual(["src", "any", "any"], calls)
+
+    # Test the default handler and wildcards
+    def test_default_and_wildcard(self):
+        seen = []
+        unhandled = []
+        d = dispatcher(default=unhandled.append)
+        d.add_wildcard(seen.append)
+        d.register(0x05, lambda m: None)
+        handled = build_from(0x10, 0x05)
+        other = build_from(0x10, 0x06)
+        d(handled)
+        d(other)
+        self.assertEqual([handled, other], seen)
+        self.assertEqual([other], unhandled)
+        self.assertIs(d.default, d.lookup(0x06, 0x10))
+
+        d.unregister(0x05, ANY_ADDR)
+        d(handled)
+        self.assertEqual([other, handled], unhandled)
+
+    # Test handlers run inside the parser and nothing is queued
+    def test_parser_handler(self):
+        calls = []
+        d = dispatcher()
+        d.register(0x07, calls.append)
+        p = prot.parser(0x01, handler=d.dispatch)
+        frames = [build_from(0x10, 0x07, [i]) for i in range(10)]
+        p.parse_input_buffer(prot.encode_many(frames))
+        self.assertEqual(frames, calls)
+        self.assertFalse(p.message_available)
+
+        # The byte state machine dispatches too
+        for byte in frames[0].to_bytes():
+            p.parse_byte(byte)
+        self.assertEqual(frames + frames[:1], calls)
+
+    # Test a handler that raises does not stop the others and its frame is not delivered again
+    def test_handler_raises(self):
+        calls = []
+        errors = []
+
+        # Handler failing on the first frame
+        def handle(msg):
+            calls.append(msg.msg_payload[0])
+            if msg.msg_payload[0] == 1:
+                raise ValueError("bad frame")
+
+        d = dispatcher(error_handler=lambda msg, e: errors.append((msg.msg_payload[0], str(e))))
+        d.register(0x07, handle)
+        p = prot.parser(0x01, handler=d.dispatch)
+        frames = [build_from(0x10, 0x07, [i]) for i in (1, 2)]
+        p.parse_input_buffer(prot.encode_many(frames))
+        p.parse_input_buffer(b"")
+        self.assertEqual([1, 2], calls)
+        self.assertEqual([(1, "bad frame")], errors)
+        self.assertEqual(1, d.errors)
+
+    # Test a plain parser handler that raises passes the exception on after its frame is consumed
+    def test_parser_handler_raises(self):
+        calls = []
+
+        # Handler failing on the first frame
+        def handle(msg):
+            calls.append(msg.msg_payload[0])
+            if len(calls) == 1:
+                raise ValueError("bad frame")
+
+        frames = [build_from(0x10, 0x07, [i]) for i in (1, 2)]
+        for bytewise in (False, True):
+            del calls[:]
+            p = prot.parser(0x01, handler=handle)
+            if bytewise:
+                for byte in prot.encode_many(frames):
+                    try:
+                        p.parse_byte(byte)
+                    except ValueError:
+                        pass
+            else:
+                with self.assertRaises(ValueError):
+                    p.parse_input_buffer(prot.encode_many(frames))
+                p.parse_input_buffer(b"")
+            self.assertEqual([1, 2], calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
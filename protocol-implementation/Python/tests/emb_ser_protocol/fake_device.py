@@ -0,0 +1,100 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import emb_ser_protocol.protocol as prot
+
+HOST_ADDR = 0x01
+DEVICE_ADDR = 0x1a
+
+
+# Helper function to build a hook that is true for every n-th count, never for 0
+def every(n):
+    return lambda count, msg: n > 0 and count % n == 0
+
+
+# Fake device for the host side tests, answering what is written to it on later reads
+class fake_device:
+    """
+    Decodes every write with its own parser and passes each request to respond, which returns the
+    reply as a message, a (msg_type, payload) tuple sent back to the requester, or None. Replies come
+    out of read after delay_reads further reads, and every read moves the fake clock on by 1 ms.
+
+    The hooks take (count, msg) and return True to act: drop ignores the count-th request, corrupt
+    flips the CRC of the reply to the count-th request and drop_reply loses the count-th reply. The
+    delay hook takes the same arguments and returns the reads to hold the reply to the count-th
+    request for, None for delay_reads.
+    """
+
+    def __init__(self, respond, delay_reads=0, drop=None, corrupt=None, drop_reply=None,
+                 delay=None, reverse=False):
+        self.parser = prot.parser(DEVICE_ADDR)
+        self.respond = respond
+        self.delay_reads = delay_reads
+        self.drop = drop
+        self.corrupt = corrupt
+        self.drop_reply = drop_reply
+        self.delay = delay
+        self.reverse = reverse
+        self.requests = 0
+        self.replies = 0
+        self.bursts = []
+        self.sizes = []
+        self.queue = []
+        self.max_in_flight = 0
+        self.clock = 0.0
+
+    def write(self, data):
+        self.parser.parse_input_buffer(data)
+        cmds = self.parser.check_for_parsed_messages()
+        self.bursts.append(len(cmds))
+        for cmd in cmds:
+            self.requests += 1
+            self.sizes.append(cmd.msg_len)
+            if self.drop is not None and self.drop(self.requests, cmd):
+                continue
+            reply = self.respond(cmd)
+            if reply is None:
+                continue
+            if isinstance(reply, tuple):
+                reply = self.parser.build_message(reply[0], cmd.src_addr, reply[1])
+            self.replies += 1
+            if self.drop_reply is not None and self.drop_reply(self.replies, reply):
+                continue
+            frame = reply.to_bytes()
+            if self.corrupt is not None and self.corrupt(self.requests, cmd):
+                frame = frame[:-1] + bytes([frame[-1] ^ 0xFF])
+            reads = None if self.delay is None else self.delay(self.requests, cmd)
+            self.queue.append([self.delay_reads if reads is None else reads, frame])
+        self.max_in_flight = max(self.max_in_flight, len(self.queue))
+
+    def read(self):
+        self.clock += 0.001
+        ready = []
+        for entry in self.queue:
+            entry[0] -= 1
+            if entry[0] < 0:
+                ready.append(entry)
+        for entry in ready:
+            self.queue.remove(entry)
+        frames = [entry[1] for entry in ready]
+        if self.reverse:
+            frames.reverse()
+        return b"".join(frames)
+
+    def now(self):
+        return self.clock
@@ -0,0 +1,122 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import unittest
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol.load import load_generator
+from fake_device import DEVICE_ADDR, HOST_ADDR, every, fake_device
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+
+# Fake device answering every request with a ping response on the next read
+def ping_device(drop_every=0, corrupt_every=0):
+    return fake_device(lambda cmd: (0x01, []), drop=every(drop_every),
+                       corrupt=every(corrupt_every))
+
+
+class TestLoadGenerator(unittest.TestCase):
+    # Helper function to build a generator against a fake device
+    def generator(self, device, **kwargs):
+        return load_generator(device.write, device.read, prot.parser(HOST_ADDR), 0x01,
+                              DEVICE_ADDR, clock=lambda: device.clock, **kwargs)
+
+    # Test every request is answered and the payload sizes follow the distribution
+    def test_all_received(self):
+        device = ping_device()
+        report = self.generator(device, payload_sizes=[(0, 1), (100, 3)], window=8,
+                                seed=1).run(count=1000)
+        self.assertEqual(1000, report["sent"])
+        self.assertEqual(1000, report["received"])
+        self.assertEqual(0, report["lost"])
+        self.assertEqual(0, report["unexpected"])
+        self.assertEqual({0, 100}, set(device.sizes))
+        self.assertAlmostEqual(0.75, device.sizes.count(100) / 1000.0, delta=0.05)
+        for key in ("p50", "p99", "p999"):
+            self.assertGreater(report["rtt_ms"][key], 0)
+        self.assertGreater(report["frames_per_second"], 0)
+
+    # Test lost responses and CRC errors are counted
+    def test_loss_and_crc_errors(self):
+        device = ping_device(drop_every=10, corrupt_every=25)
+        report = self.generator(device, window=1, timeout=0.01).run(count=100)
+        self.assertEqual(100, report["sent"])
+        self.assertEqual(10 + 4 - 2, report["lost"])
+        self.assertEqual(4 - 2, report["crc_errors"])
+        self.assertEqual(100 - report["lost"], report["received"])
+        self.assertAlmostEqual(0.12, report["loss_ratio"])
+
+    # Test a response arriving after its request timed out is not paired with a later request
+    def test_late_response(self):
+        device = ping_device()
+        device.delay_reads = 2
+        device.delay = lambda count, cmd: 11 if count == 10 else None
+        report = self.generator(device, window=1, timeout=0.01).run(count=50)
+        self.assertEqual(1, report["lost"])
+        self.assertEqual(1, report["late"])
+        self.assertEqual(0, report["unexpected"])
+        self.assertEqual(49, report["received"])
+        self.assertAlmostEqual(3.0, report["rtt_ms"]["min"])
+        self.assertAlmostEqual(3.0, report["rtt_ms"]["max"])
+
+    # Test the window bounds the requests in flight when the device never answers
+    def test_window(self):
+        device = ping_device(drop_every=1)
+        report = self.generator(device, window=4, timeout=0.05).run(count=50)
+        self.assertEqual(50, device.requests)
+        self.assertEqual(4, max(device.bursts))
+        self.assertEqual(50, report["lost"])
+        self.assertIsNone(report["rtt_ms"])
+
+    # Test the target rate paces the requests
+    def test_rate(self):
+        device = ping_device()
+        report = self.generator(device, window=16, rate=500).run(count=100)
+        self.assertEqual(100, report["received"])
+        self.assertGreaterEqual(report["seconds"], 99 / 500.0)
+
+    # Test bad arguments
+    def test_bad_arguments(self):
+        device = ping_device()
+        with self.assertRaises(Exception):
+            self.generator(device, window=0)
+        with self.assertRaises(Exception):
+            self.generator(device, payload_sizes=[prot.MAX_MSG_LEN + 1])
+        with self.assertRaises(Exception):
+            self.generator(device).run()
+
+    # Test a loopback URL, the requests come back as their own responses
+    @unittest.skipIf(serial is None, "pyserial is not installed")
+    def test_loopback(self):
+        ser = serial.serial_for_url("loop://", timeout=0.01)
+        try:
+            gen = load_generator(ser.write, lambda: ser.read(max(1, ser.in_waiting)),
+                                 prot.parser(HOST_ADDR, promiscuous=True), 0x10, DEVICE_ADDR,
+                                 response_addr=HOST_ADDR, payload_sizes=[16, 64], window=8)
+            report = gen.run(count=500)
+        finally:
+            ser.close()
+        self.assertEqual(500, report["received"])
+        self.assertEqual(0, report["lost"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import threading
+import unittest
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol.message_queue import message_queue, overflow_policy
+
+
+class TestMessageQueue(unittest.TestCase):
+    # Test an unbounded queue keeps everything in order
+    def test_unbounded(self):
+        q = message_queue()
+        for i in range(1000):
+            self.assertTrue(q.put(i))
+        self.assertEqual(1000, len(q))
+        self.assertEqual(list(range(1000)), q.drain())
+        self.assertEqual(0, q.dropped)
+
+    # Test drop oldest keeps the newest messages
+    def test_drop_oldest(self):
+        q = message_queue(4, overflow_policy.DROP_OLDEST)
+        for i in range(10):
+            self.assertTrue(q.put(i))
+        self.assertEqual([6, 7, 8, 9], q.drain())
+        self.assertEqual(6, q.dropped)
+        self.assertEqual(10, q.accepted)
+
+    # Test drop newest keeps the oldest messages
+    def test_drop_newest(self):
+        q = message_queue(4, overflow_policy.DROP_NEWEST)
+        results = [q.put(i) for i in range(10)]
+        self.assertEqual([True] * 4 + [False] * 6, results)
+        self.assertEqual([0, 1, 2, 3], q.drain())
+        self.assertEqual(6, q.dropped)
+
+    # Test block gives up after its timeout
+    def test_block_timeout(self):
+        q = message_queue(1, overflow_policy.BLOCK)
+        self.assertTrue(q.put(0))
+        self.assertFalse(q.put(1, timeout=0.01))
+        self.assertEqual(1, q.dropped)
+
+    # Test block waits for a consumer on another thread and loses nothing
+    def test_block_producer_consumer(self):
+        q = message_queue(8, overflow_policy.BLOCK)
+        received = []
+
+        def consumer():
+            while len(received) < 1000:
+                msg = q.pop(timeout=1)
+                if msg is not None:
+                    received.append(msg)
+
+        t = threading.Thread(target=consumer)
+        t.start()
+        for i in range(1000):
+            q.put(i)
+        t.join()
+        self.assertEqual(list(range(1000)), received)
+        self.assertEqual(0, q.dropped)
+
+    # Test drain with a limit and pop on an empty queue
+    def test_drain_max_n_and_pop(self):
+        q = message_queue()
+        self.assertIsNone(q.pop())
+        self.assertEqual([], q.drain())
+        for i in range(5):
+            q.put(i)
+        self.assertEqual([0, 1], q.drain(2))
+        self.assertEqual(2, q.pop())
+        self.assertEqual([3, 4], q.drain(10))
+
+    # Test the stats snapshot
+    def test_stats(self):
+        q = message_queue(2, overflow_policy.DROP_NEWEST)
+        for i in range(3):
+            q.put(i)
+        self.assertEqual({"length": 2, "capacity": 2, "accepted": 2, "dropped": 1}, q.stats())
+
+    # Test a flood into a bounded parser is capped and counted
+    def test_parser_flood(self):
+        p = prot.parser(0x01, capacity=16)
+        frame = prot.parser(0x02).build_message(0x01, 0x01, [1, 2, 3]).to_bytes()
+        p.parse_input_buffer(frame * 1000)
+        self.assertTrue(p.message_available)
+        self.assertEqual(16, len(p.check_for_parsed_messages()))
+        self.assertEqual(984, p.parsed_message_queue.dropped)
+        self.assertFalse(p.message_available)
+        self.assertIsNone(p.pop_message())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,11 +16,21 @@
 #Contact: budgettsfrog@protonmail.com
 #GitHub: https://github.com/warrenwoolseyiii
 
+import io
+import pickle
+import socket
+import threading
 import unittest
 import emb_ser_protocol.protocol as prot
 import emb_ser_protocol.version as ver
+from emb_ser_protocol.decode import decode_buffer
 from random import randint
 
+try:
+    import serial
+except ImportError:
+    serial = None
+
 
 # Helper function to generate a random message
 def generate_random_message(length=-1):
@@ -295,5 +305,739 @@ class TestParser(unittest.TestCase):
         print("Version: {}.{}.{}".format(major, minor, rev))
 
 
+# Helper function to build a noisy stream of frames: good, bad CRC, foreign address and junk
+def generate_noisy_stream(count=50, max_len=300):
+    stream = []
+    for i in range(count):
+        kind = randint(0, 3)
+        if kind == 3:
+            stream += [randint(0, 0xFF) for i in range(randint(0, 20))]
+            continue
+        frame = generate_random_message(randint(0, max_len))
+        if kind == 1:
+            frame[-1] ^= 0x01
+        elif kind == 2:
+            frame[4] = prot.my_addr + 1
+        stream += frame
+    return stream
+
+
+# Helper function to decode a stream one byte at a time through the state machine
+def parse_stream_bytewise(stream):
+    for byte in stream:
+        prot.parse_byte(byte)
+    return prot.check_for_parsed_messages()
+
+
+class TestBufferParser(unittest.TestCase):
+    # Test setup method
+    def setUp(self):
+        prot.default_parser.reset()
+        _ = prot.check_for_parsed_messages()
+
+    # Test teardown method
+    def tearDown(self):
+        prot.default_parser.reset()
+        _ = prot.check_for_parsed_messages()
+
+    # Assert two lists of parsed messages hold the same frames
+    def assertSameMessages(self, expected, actual):
+        self.assertEqual([m.to_list() for m in expected],
+                         [m.to_list() for m in actual])
+
+    # Test the scanner decodes a noisy stream exactly like the state machine
+    def test_matches_state_machine(self):
+        stream = generate_noisy_stream()
+        expected = parse_stream_bytewise(stream)
+        prot.reset_parsing_state()
+        prot.parse_input_buffer(bytes(stream))
+        self.assertSameMessages(expected, prot.check_for_parsed_messages())
+
+    # Test frames split across arbitrary chunk boundaries
+    def test_random_chunks(self):
+        stream = generate_noisy_stream()
+        expected = parse_stream_bytewise(stream)
+        prot.reset_parsing_state()
+        pos = 0
+        while pos < len(stream):
+            step = randint(1, 64)
+            prot.parse_input_buffer(stream[pos:pos + step])
+            pos += step
+        self.assertSameMessages(expected, prot.check_for_parsed_messages())
+
+    # Test the header itself split across calls
+    def test_split_header(self):
+        msg = generate_random_message(4)
+        for i in range(1, 4):
+            prot.parse_input_buffer(bytes(msg[:i]))
+            prot.parse_input_buffer(bytes(msg[i:]))
+            self.assertEqual(1, len(prot.check_for_parsed_messages()))
+
+    # Test a frame whose CRC bytes look like a partial header is not held back
+    def test_frame_ending_in_header_bytes(self):
+        msg = generate_random_message(0)
+        msg[-2] = prot.HEADER_BYTE0
+        msg[-1] = prot.HEADER_BYTE1
+        prot.parse_input_buffer(bytes(msg))
+        # The CRC no longer matches, so the frame is rescanned and its last two bytes kept as a header
+        self.assertEqual(bytes(msg[-2:]), bytes(prot.default_parser.rx_buffer))
+        self.assertEqual(0, len(prot.check_for_parsed_messages()))
+
+    # Test a header straight after a stray header byte is still found
+    def test_header_after_stray_header_byte(self):
+        msg = generate_random_message(4)
+        prot.parse_input_buffer(bytes([prot.HEADER_BYTE0] + msg))
+        self.assertEqual(1, len(prot.check_for_parsed_messages()))
+
+    # Test a bad CRC frame is consumed whole and the next frame still parses
+    def test_bad_crc_then_valid(self):
+        bad = generate_random_message(10)
+        bad[-1] ^= 0xFF
+        good = generate_random_message(10)
+        prot.parse_input_buffer(bytes(bad + good))
+        msg_list = prot.check_for_parsed_messages()
+        self.assertEqual(1, len(msg_list))
+        self.assertEqual(good, msg_list[0].to_list())
+
+    # Test mixing the byte state machine and the buffer scanner mid frame
+    def test_mixed_byte_and_buffer(self):
+        msg = generate_random_message(20)
+        for byte in msg[:12]:
+            prot.parse_byte(byte)
+        prot.parse_input_buffer(bytes(msg[12:]))
+        self.assertEqual(1, len(prot.check_for_parsed_messages()))
+
+        prot.parse_input_buffer(bytes(msg[:12]))
+        for byte in msg[12:]:
+            prot.parse_byte(byte)
+        self.assertEqual(1, len(prot.check_for_parsed_messages()))
+
+
+class TestParserInstances(unittest.TestCase):
+    # Test two parsers with different addresses decode the same stream independently
+    def test_independent_addresses(self):
+        p1 = prot.parser(0x01)
+        p2 = prot.parser(0x02)
+        frame1 = prot.parser(0x09).build_message(0x10, 0x01, [1, 2, 3]).to_list()
+        frame2 = prot.parser(0x09).build_message(0x11, 0x02, [4, 5]).to_list()
+        stream = bytes(frame1 + frame2)
+        p1.parse_input_buffer(stream[:7])
+        p2.parse_input_buffer(stream)
+        p1.parse_input_buffer(stream[7:])
+
+        msg_list = p1.check_for_parsed_messages()
+        self.assertEqual(1, len(msg_list))
+        self.assertEqual(frame1, msg_list[0].to_list())
+        msg_list = p2.check_for_parsed_messages()
+        self.assertEqual(1, len(msg_list))
+        self.assertEqual(frame2, msg_list[0].to_list())
+
+    # Test the module level functions leave other parsers alone
+    def test_default_parser_isolated(self):
+        other = prot.parser(prot.my_addr)
+        prot.parse_input_buffer(bytes(generate_random_message(3)))
+        self.assertEqual(0, len(other.check_for_parsed_messages()))
+        self.assertEqual(1, len(prot.check_for_parsed_messages()))
+
+    # Test the old module globals still reach the default parser
+    def test_module_globals(self):
+        prot.default_parser.reset()
+        self.assertFalse(prot.message_available)
+        for byte in generate_random_message(3)[:5]:
+            prot.parse_byte(byte)
+        self.assertEqual(prot.parsing_state.MSG_TYPE_POS, prot.p_state)
+        self.assertIs(prot.default_parser.current_msg, prot.current_msg)
+        prot.reset_parsing_state()
+        prot.parse_input_buffer(bytes(generate_random_message(3)))
+        self.assertTrue(prot.message_available)
+        self.assertEqual(1, len(prot.parsed_message_queue))
+        prot.check_for_parsed_messages()
+        self.assertFalse(prot.message_available)
+        with self.assertRaises(AttributeError):
+            prot.no_such_attribute
+
+    # Test assigning my_addr on the module changes the default parser's address
+    def test_assign_my_addr(self):
+        old = prot.my_addr
+        try:
+            prot.my_addr = 0x05
+            self.assertEqual(0x05, prot.default_parser.my_addr)
+            msg = prot.parser(0x10).build_message(0x01, 0x05, [1])
+            prot.parse_input_buffer(msg.to_bytes())
+            self.assertEqual([msg], prot.check_for_parsed_messages())
+        finally:
+            prot.set_my_address(old)
+
+    # Test one parser per thread, all decoding at the same time
+    def test_parser_per_thread(self):
+        results = {}
+
+        def worker(addr):
+            p = prot.parser(addr)
+            src = prot.parser(0x80)
+            frames = [src.build_message(i, addr, [addr] * i).to_list() for i in range(50)]
+            stream = bytes([byte for frame in frames for byte in frame])
+            pos = 0
+            while pos < len(stream):
+                step = randint(1, 32)
+                p.parse_input_buffer(stream[pos:pos + step])
+                pos += step
+            results[addr] = ([m.to_list() for m in p.check_for_parsed_messages()], frames)
+
+        threads = [threading.Thread(target=worker, args=(addr,)) for addr in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for addr in range(8):
+            self.assertEqual(results[addr][1], results[addr][0])
+
+    # Test one parser shared by several producer threads and a consumer thread
+    def test_shared_parser(self):
+        p = prot.parser(0x01)
+        src = prot.parser(0x02)
+        frame = bytes(src.build_message(0x05, 0x01, list(range(40))).to_list())
+        received = []
+        done = threading.Event()
+
+        def producer():
+            for i in range(200):
+                p.parse_input_buffer(frame)
+
+        def consumer():
+            while not done.is_set():
+                received.extend(p.check_for_parsed_messages())
+            received.extend(p.check_for_parsed_messages())
+
+        producers = [threading.Thread(target=producer) for i in range(4)]
+        reader = threading.Thread(target=consumer)
+        reader.start()
+        for t in producers:
+            t.start()
+        for t in producers:
+            t.join()
+        done.set()
+        reader.join()
+
+        self.assertEqual(800, len(received))
+        for m in received:
+            self.assertEqual(list(frame), m.to_list())
+
+
+class TestMessage(unittest.TestCase):
+    # Test messages are slotted and hold bytes payloads
+    def test_slotted_bytes_payload(self):
+        msg = prot.message(0x01, 0x02, 0x03, 3, [1, 2, 3], 0)
+        self.assertFalse(hasattr(msg, "__dict__"))
+        self.assertIsInstance(msg.msg_payload, bytes)
+        self.assertEqual(b"\x01\x02\x03", msg.msg_payload)
+
+    # Test payloads still compare equal to lists of ints
+    def test_payload_list_equality(self):
+        msg = prot.build_message(0x01, 0x02, [1, 2, 3])
+        self.assertEqual([1, 2, 3], msg.msg_payload)
+        self.assertEqual((1, 2, 3), msg.msg_payload)
+        self.assertNotEqual([1, 2, 4], msg.msg_payload)
+        self.assertNotEqual([1, 2, 256], msg.msg_payload)
+
+    # Test parsed payloads are bytes taken from the frame
+    def test_parsed_payload(self):
+        frame = generate_random_message(10)
+        prot.parse_input_buffer(bytes(frame))
+        msg_list = prot.check_for_parsed_messages()
+        self.assertEqual(bytes(frame[8:-2]), msg_list[0].msg_payload)
+
+    # Test message equality compares fields
+    def test_message_equality(self):
+        msg = prot.build_message(0x01, 0x02, [1, 2, 3])
+        self.assertEqual(msg, prot.build_message(0x01, 0x02, bytes([1, 2, 3])))
+        self.assertNotEqual(msg, prot.build_message(0x01, 0x02, [1, 2]))
+        self.assertNotEqual(msg, prot.build_message(0x02, 0x02, [1, 2, 3]))
+
+    # Test equal messages hash the same, so they work in sets and as dict keys
+    def test_message_hash(self):
+        msg = prot.build_message(0x01, 0x02, [1, 2, 3])
+        same = prot.build_message(0x01, 0x02, bytes([1, 2, 3]))
+        self.assertEqual(hash(msg), hash(same))
+        self.assertEqual(2, len({msg, same, prot.build_message(0x01, 0x02, [1, 2])}))
+        self.assertEqual("reply", {msg: "reply"}[same])
+
+    # Test messages survive a pickle round trip, as they do between processes
+    def test_pickle(self):
+        msg = prot.build_message(0x01, 0x02, [1, 2, 3])
+        copy = pickle.loads(pickle.dumps(msg))
+        self.assertEqual(msg, copy)
+        self.assertIsInstance(copy.msg_payload, prot.payload_bytes)
+
+    # Test the string and list forms are unchanged
+    def test_str_and_to_list(self):
+        msg = prot.message(0x00, 0x1a, 0x01, 2, bytes([0, 1]), 0xe200)
+        self.assertEqual(
+            "msg_type: 0x0, src_addr: 0x1a, tgt_addr: 0x1, msg_len: 0x2, msg_payload: [0, 1], "
+            "msg_crc: 0xe200, error: error_state.NO_ERROR", str(msg))
+        self.assertEqual([170, 85, 255, 26, 1, 0, 0, 2, 0, 1, 226, 0], msg.to_list())
+
+
+class TestEncoder(unittest.TestCase):
+    # Test to_bytes matches to_list for a range of payload sizes
+    def test_to_bytes(self):
+        for length in (0, 1, 100, prot.MAX_MSG_LEN):
+            msg = prot.build_message(0x07, 0x02, [randint(0, 255) for i in range(length)])
+            self.assertEqual(bytes(msg.to_list()), msg.to_bytes())
+            self.assertEqual(length + 10, msg.frame_len())
+
+    # Test encode_into writes at an offset and leaves the rest of the buffer alone
+    def test_encode_into(self):
+        msg = prot.build_message(0x07, 0x02, [1, 2, 3, 4])
+        buf = bytearray(b"\xEE" * 20)
+        end = msg.encode_into(buf, 3)
+        self.assertEqual(3 + msg.frame_len(), end)
+        self.assertEqual(b"\xEE" * 3, buf[:3])
+        self.assertEqual(msg.to_bytes(), buf[3:end])
+        self.assertEqual(b"\xEE" * (20 - end), buf[end:])
+
+    # Test encode_into refuses a buffer that is too small rather than growing it
+    def test_encode_into_short_buffer(self):
+        msg = prot.build_message(0x07, 0x02, [1, 2, 3, 4])
+        buf = bytearray(msg.frame_len() - 1)
+        with self.assertRaises(Exception):
+            msg.encode_into(buf)
+        self.assertEqual(msg.frame_len() - 1, len(buf))
+
+    # Test encode_many packs frames back to back and parses back out
+    def test_encode_many(self):
+        msgs = [prot.build_message(i, prot.my_addr, [i] * i) for i in range(20)]
+        buf = prot.encode_many(msgs)
+        self.assertEqual(b"".join(m.to_bytes() for m in msgs), bytes(buf))
+
+        p = prot.parser(prot.my_addr)
+        p.parse_input_buffer(buf)
+        self.assertEqual(msgs, p.check_for_parsed_messages())
+
+
+class TestPromiscuous(unittest.TestCase):
+    # Test a promiscuous parser emits frames for every address and counts bad CRCs and resyncs
+    def test_promiscuous_counts(self):
+        for bytewise in (False, True):
+            p = prot.parser(0x01, promiscuous=True)
+            src = prot.parser(0x10)
+            frames = [src.build_message(i, i, [i] * i) for i in range(10)]
+            bad = bytearray(src.build_message(0x20, 0x01, [1, 2]).to_bytes())
+            bad[-1] ^= 0xFF
+            stream = (frames[0].to_bytes() + b"\x00\x01" + frames[1].to_bytes() + bytes(bad) +
+                      b"".join(m.to_bytes() for m in frames[2:]) + b"\x13")
+            if bytewise:
+                for byte in stream:
+                    p.parse_byte(byte)
+            else:
+                p.parse_input_buffer(stream)
+            self.assertEqual(frames, p.check_for_parsed_messages())
+            snap = p.stats.snapshot()
+            self.assertEqual((1, 2, 10, 15, len(stream)), (
+                snap["crc_failures"], snap["resyncs"], snap["frames_ok"], snap["bytes_discarded"],
+                snap["bytes_in"]))
+
+    # Test a normal parser still drops frames for other addresses without counting them
+    def test_not_promiscuous(self):
+        p = prot.parser(0x01)
+        src = prot.parser(0x10)
+        p.parse_input_buffer(src.build_message(0x01, 0x02, [1]).to_bytes() +
+                             src.build_message(0x01, 0x01, [1]).to_bytes())
+        self.assertEqual(1, len(p.check_for_parsed_messages()))
+        self.assertEqual(0, p.stats.crc_failures)
+
+
+class TestAddressFilter(unittest.TestCase):
+    # Helper to build one frame for each of a list of target addresses
+    def build_stream(self, targets):
+        src = prot.parser(0x10)
+        frames = [src.build_message(0x30, tgt, [tgt]) for tgt in targets]
+        return frames, b"".join(m.to_bytes() for m in frames)
+
+    # Test a parser receives for all its local addresses and the broadcast address, on both paths
+    def test_local_and_broadcast(self):
+        for bytewise in (False, True):
+            p = prot.parser(0x01, broadcast_addr=0xFF, local_addrs=(0x20, 0x21))
+            frames, stream = self.build_stream([0x01, 0x02, 0x20, 0xFF, 0x22, 0x21])
+            if bytewise:
+                for byte in stream:
+                    p.parse_byte(byte)
+            else:
+                p.parse_input_buffer(stream)
+            msgs = p.check_for_parsed_messages()
+            self.assertEqual([frames[i] for i in (0, 2, 3, 5)], msgs)
+            self.assertEqual([0x01, 0x20, 0xFF, 0x21], [m.matched_addr for m in msgs])
+            self.assertEqual(2, p.stats.addr_mismatches)
+
+    # Test addresses can be added and removed, and changing my_addr updates the filter
+    def test_update_addresses(self):
+        p = prot.parser(0x01)
+        self.assertTrue(p.accepts(0x01))
+        self.assertFalse(p.accepts(0xFF))
+        p.add_address(0x40)
+        p.set_broadcast_address(0xFF)
+        self.assertTrue(p.accepts(0x40) and p.accepts(0xFF))
+        p.remove_address(0x40)
+        p.set_broadcast_address(None)
+        p.my_addr = 0x02
+        self.assertEqual([0x02], [a for a in range(256) if p.accepts(a)])
+        frames, stream = self.build_stream([0x01, 0x02, 0x40, 0xFF])
+        p.parse_input_buffer(stream)
+        self.assertEqual([frames[1]], p.check_for_parsed_messages())
+
+    # Test a promiscuous parser only tags the frames its filter accepted
+    def test_promiscuous_tags(self):
+        p = prot.parser(0x01, promiscuous=True, broadcast_addr=0xFF)
+        frames, stream = self.build_stream([0x01, 0x02, 0xFF])
+        p.parse_input_buffer(stream)
+        msgs = p.check_for_parsed_messages()
+        self.assertEqual(frames, msgs)
+        self.assertEqual([0x01, None, 0xFF], [m.matched_addr for m in msgs])
+
+    # Test the matched address survives pickling
+    def test_pickle_matched_addr(self):
+        p = prot.parser(0x01)
+        p.parse_input_buffer(self.build_stream([0x01])[1])
+        msg = pickle.loads(pickle.dumps(p.check_for_parsed_messages()[0]))
+        self.assertEqual(0x01, msg.matched_addr)
+        self.assertIsNone(pickle.loads(pickle.dumps(prot.build_message(1, 2, []))).matched_addr)
+
+
+class TestForeignSkip(unittest.TestCase):
+    # Helper to build a stream where every third frame is for another address, one of them long
+    def build_stream(self):
+        src = prot.parser(0x10)
+        ours = []
+        stream = b""
+        for i in range(30):
+            if i % 3 == 0:
+                size = 5000 if i == 3 else i
+                stream += src.build_message(0x40, 0x02, bytes([i]) * size).to_bytes()
+            else:
+                msg = src.build_message(i, 0x01, [i] * i)
+                ours.append(msg)
+                stream += msg.to_bytes()
+        return ours, stream
+
+    # Test frames for other addresses are skipped on both paths, whatever the chunking
+    def test_skip(self):
+        ours, stream = self.build_stream()
+        for chunk in (1, 7, 64, 1000, len(stream)):
+            p = prot.parser(0x01)
+            largest = 0
+            for pos in range(0, len(stream), chunk):
+                p.parse_input_buffer(stream[pos:pos + chunk])
+                largest = max(largest, len(p.rx_buffer))
+            self.assertEqual(ours, p.check_for_parsed_messages())
+            self.assertEqual(10, p.stats.addr_mismatches)
+            # The long foreign frame is never held whole
+            self.assertLess(largest, 1000)
+        p = prot.parser(0x01)
+        for byte in stream:
+            p.parse_byte(byte)
+        self.assertEqual(ours, p.check_for_parsed_messages())
+        self.assertEqual(10, p.stats.addr_mismatches)
+
+    # Test mixing parse_byte and parse_input_buffer in the middle of a skipped frame
+    def test_mixed_skip(self):
+        ours, stream = self.build_stream()
+        p = prot.parser(0x01)
+        for pos in range(0, len(stream), 50):
+            if pos % 100 == 0:
+                p.parse_input_buffer(stream[pos:pos + 50])
+            else:
+                for byte in stream[pos:pos + 50]:
+                    p.parse_byte(byte)
+        self.assertEqual(ours, p.check_for_parsed_messages())
+
+    # Test foreign CRCs are only checked when asked for
+    def test_validate_foreign_crc(self):
+        src = prot.parser(0x10)
+        bad = bytearray(src.build_message(0x40, 0x02, [1, 2, 3]).to_bytes())
+        bad[-1] ^= 0xFF
+        good = src.build_message(0x41, 0x02, [4]).to_bytes()
+        for bytewise in (False, True):
+            for validate in (False, True):
+                p = prot.parser(0x01, validate_foreign_crc=validate)
+                if bytewise:
+                    for byte in bytes(bad) + good:
+                        p.parse_byte(byte)
+                else:
+                    p.parse_input_buffer(bytes(bad) + good)
+                self.assertEqual((1 if validate else 0, 1 if validate else 2),
+                                 (p.stats.crc_failures, p.stats.addr_mismatches))
+                self.assertEqual([], p.check_for_parsed_messages())
+
+
+class TestIterMessages(unittest.TestCase):
+    # Helper to build a stream of frames with some noise between them
+    def build_stream(self, count=100):
+        src = prot.parser(0x10)
+        msgs = [src.build_message(i % 256, 0x01, [i % 256] * (i % 50)) for i in range(count)]
+        stream = b"".join(m.to_bytes() + b"\x00\xAA" for m in msgs)
+        return msgs, stream
+
+    # Test every kind of source gives the same messages
+    def test_sources(self):
+        msgs, stream = self.build_stream()
+        self.assertEqual(msgs, list(prot.iter_messages(stream)))
+        self.assertEqual(msgs, list(prot.iter_messages(io.BytesIO(stream), chunk_size=7)))
+        self.assertEqual(msgs, list(prot.iter_messages(
+            stream[i:i + 13] for i in range(0, len(stream), 13))))
+        self.assertEqual(msgs, list(prot.iter_messages(io.BufferedReader(io.BytesIO(stream)))))
+
+    # Test reading from a socket until the peer closes it
+    def test_socket(self):
+        msgs, stream = self.build_stream()
+        a, b = socket.socketpair()
+        try:
+            writer = threading.Thread(target=lambda: (a.sendall(stream), a.close()))
+            writer.start()
+            self.assertEqual(msgs, list(prot.iter_messages(b, chunk_size=100)))
+            writer.join()
+        finally:
+            b.close()
+
+    # Test reading from a serial port, which never ends by itself
+    @unittest.skipIf(serial is None, "pyserial is not installed")
+    def test_serial(self):
+        msgs, stream = self.build_stream(10)
+        ser = serial.serial_for_url("loop://", timeout=0.01)
+        try:
+            ser.write(stream)
+            gen = prot.iter_messages(ser)
+            self.assertEqual(msgs, [next(gen) for m in msgs])
+            gen.close()
+        finally:
+            ser.close()
+
+    # Test messages come out before the stream ends and nothing piles up in the queue
+    def test_lazy(self):
+        msgs, stream = self.build_stream()
+        read = []
+        def chunks():
+            for i in range(0, len(stream), 32):
+                read.append(i)
+                yield stream[i:i + 32]
+        p = prot.parser(0x01)
+        gen = p.iter_messages(chunks())
+        self.assertEqual(msgs[0], next(gen))
+        self.assertLess(len(read), 3)
+        for expected in msgs[1:]:
+            self.assertEqual(expected, next(gen))
+            self.assertLessEqual(len(p.parsed_message_queue), 2)
+        self.assertEqual([], list(gen))
+
+    # Test the default parser is left alone and a partial frame at the end is flushed
+    def test_default_parser_untouched(self):
+        prot.default_parser.reset()
+        msg = prot.build_message(0x05, 0x01, [1, 2, 3])
+        stream = bytes([0xAA, 0x55, 0xFF, 0x10, 0x01, 0x05, 0x00, 0x20]) + msg.to_bytes()
+        self.assertEqual([msg], list(prot.iter_messages(stream)))
+        self.assertEqual(0, prot.default_parser.stats.bytes_in)
+
+
+class TestResync(unittest.TestCase):
+    # Helper to build a stream of good frames, corrupted frames, truncated frames and header fragments
+    def build_stream(self, count=200):
+        src = prot.parser(0x10)
+        stream = bytearray()
+        for i in range(count):
+            kind = randint(0, 5)
+            frame = bytearray(src.build_message(randint(0, 255), randint(1, 2),
+                                                [randint(0, 255) for j in range(randint(0, 40))])
+                              .to_bytes())
+            if kind == 1:
+                frame[randint(3, len(frame) - 1)] ^= 1 << randint(0, 7)
+            elif kind == 2:
+                frame = frame[:randint(1, len(frame) - 1)]
+            elif kind == 3:
+                frame = bytearray(prot.HEADER[:randint(1, 3)]) + frame
+            elif kind == 4:
+                frame = bytearray(randint(0, 255) for j in range(randint(0, 10)))
+            stream += frame
+        return bytes(stream)
+
+    # Helper to run a stream through a parser in chunks, 0 for one byte at a time
+    def parse(self, p, stream, chunk):
+        if chunk == 0:
+            for byte in stream:
+                p.parse_byte(byte)
+        else:
+            for pos in range(0, len(stream), chunk):
+                p.parse_input_buffer(stream[pos:pos + chunk])
+        p.flush()
+        return p.check_for_parsed_messages()
+
+    # Test a frame starting inside a false header is found on both paths
+    def test_frame_inside_false_header(self):
+        good = prot.build_message(0x05, 0x01, [1, 2, 3])
+        prot.MAX_MSG_LEN = 1000
+        try:
+            for false_header in (bytes([0xAA, 0x55, 0xFF, 0x02, 0x01, 0x03, 0xFF]),
+                                 bytes([0xAA, 0x55, 0xFF, 0x02, 0x01, 0x03, 0x00, 0x05, 0xAA])):
+                stream = false_header + good.to_bytes()
+                for chunk in (0, 1, 3, len(stream)):
+                    p = prot.parser(0x01)
+                    self.assertEqual([good], self.parse(p, stream, chunk))
+        finally:
+            prot.MAX_MSG_LEN = 65535
+
+    # Test a header straight after a stray header byte is found one byte at a time
+    def test_repeated_header_byte(self):
+        good = prot.build_message(0x05, 0x01, [1, 2, 3])
+        p = prot.parser(0x01)
+        self.assertEqual([good], self.parse(p, bytes([prot.HEADER_BYTE0]) + good.to_bytes(), 0))
+
+    # Test noisy streams give the same frames as decode_buffer whatever the chunking
+    def test_matches_decode(self):
+        for i in range(5):
+            stream = self.build_stream()
+            every = decode_buffer(stream)
+            ours = decode_buffer(stream, addr=0x01)
+            for chunk in (0, 1, 5, 64, len(stream)):
+                self.assertEqual(every, self.parse(prot.parser(0x01, promiscuous=True), stream, chunk))
+                self.assertEqual(ours, self.parse(prot.parser(0x01, validate_foreign_crc=True),
+                                                  stream, chunk))
+
+    # Test rejected frames go to the error handler and never raise
+    def test_error_handler(self):
+        errors = []
+        bad = bytearray(prot.build_message(0x05, 0x01, [1, 2, 3]).to_bytes())
+        bad[-1] ^= 0xFF
+        oversize = bytes([0xAA, 0x55, 0xFF, 0x02, 0x01, 0x03, 0xFF, 0xFF])
+        prot.MAX_MSG_LEN = 1000
+        try:
+            for chunk in (0, len(bad) + len(oversize)):
+                errors.clear()
+                p = prot.parser(0x01, error_handler=errors.append)
+                self.assertEqual([], self.parse(p, bytes(bad) + oversize, chunk))
+                self.assertEqual([prot.error_state.CRC_MISMATCH,
+                                  prot.error_state.ILLEGAL_MESSAGE_LENGTH],
+                                 [m.error for m in errors])
+                self.assertEqual(bytes([1, 2, 3]), bytes(errors[0].msg_payload))
+                self.assertEqual(0xFFFF, errors[1].msg_len)
+                self.assertEqual((1, 1), (p.stats.crc_failures, p.stats.oversize_lengths))
+        finally:
+            prot.MAX_MSG_LEN = 65535
+
+    # Test flush gives up on a partial frame and keeps the frames after its header
+    def test_flush(self):
+        good = prot.build_message(0x05, 0x01, [1, 2, 3])
+        stream = bytes([0xAA, 0x55, 0xFF, 0x02, 0x01, 0x03, 0x00, 0x40]) + good.to_bytes()
+        for chunk in (0, len(stream)):
+            p = prot.parser(0x01)
+            if chunk == 0:
+                for byte in stream:
+                    p.parse_byte(byte)
+            else:
+                p.parse_input_buffer(stream)
+            self.assertEqual([], p.check_for_parsed_messages())
+            p.flush()
+            self.assertEqual([good], p.check_for_parsed_messages())
+            self.assertEqual(0, len(p.rx_buffer))
+
+
+class TestParserStats(unittest.TestCase):
+    # Helper to build a stream with one of each counted event
+    def build_stream(self):
+        src = prot.parser(0x10)
+        good = [src.build_message(i, 0x01, [i] * i) for i in range(5)]
+        bad = bytearray(src.build_message(0x20, 0x01, [1, 2]).to_bytes())
+        bad[-1] ^= 0xFF
+        stream = (good[0].to_bytes() + b"\x00\x01\x02" + good[1].to_bytes() + bytes(bad) +
+                  src.build_message(0x21, 0x07, [3]).to_bytes() +
+                  b"".join(m.to_bytes() for m in good[2:]))
+        return good, stream
+
+    # Test the counters agree between the buffer scanner and the byte state machine
+    def test_counters(self):
+        good, stream = self.build_stream()
+        for bytewise in (False, True):
+            p = prot.parser(0x01)
+            if bytewise:
+                for byte in stream:
+                    p.parse_byte(byte)
+            else:
+                p.parse_input_buffer(stream)
+            self.assertEqual(good, p.check_for_parsed_messages())
+            snap = p.stats_snapshot()
+            self.assertEqual(len(stream), snap["bytes_in"])
+            self.assertEqual(5, snap["frames_ok"])
+            self.assertEqual(1, snap["crc_failures"])
+            self.assertEqual(1, snap["addr_mismatches"])
+            self.assertEqual(2, snap["resyncs"])
+            self.assertEqual(15, snap["bytes_discarded"])
+            self.assertEqual(0, snap["oversize_lengths"])
+            self.assertEqual(0, snap["queue_length"])
+            self.assertEqual(0, snap["latency_count"])
+
+    # Test iterables without a length are parsed and counted
+    def test_iterable_input(self):
+        good, stream = self.build_stream()
+        p = prot.parser(0x01)
+        p.parse_input_buffer(byte for byte in stream)
+        p.parse_input_buffer(iter([]))
+        self.assertEqual(good, p.check_for_parsed_messages())
+        self.assertEqual(len(stream), p.stats.bytes_in)
+
+    # Test an oversize length is counted without raising
+    def test_oversize_length(self):
+        frame = bytes([0xAA, 0x55, 0xFF, 0x02, 0x01, 0x03, 0xFF, 0xFF])
+        p = prot.parser(0x01)
+        prot.MAX_MSG_LEN = 1000
+        try:
+            p.parse_input_buffer(frame)
+            for byte in frame:
+                p.parse_byte(byte)
+        finally:
+            prot.MAX_MSG_LEN = 65535
+        self.assertEqual(2, p.stats.oversize_lengths)
+        self.assertEqual(16, p.stats.bytes_discarded)
+
+    # Test frame latency is timed from the chunk holding the first header byte
+    def test_timing(self):
+        now = [0.0]
+        seen = []
+        good, stream = self.build_stream()
+        p = prot.parser(0x01)
+        p.enable_timing(lambda msg, latency: seen.append((msg.msg_type, latency)),
+                        clock=lambda: now[0])
+        split = len(good[0].to_bytes()) + 6
+        p.parse_input_buffer(stream[:split])
+        now[0] = 2.5
+        p.parse_input_buffer(stream[split:])
+        self.assertEqual([(0, 0.0), (1, 2.5), (2, 0.0), (3, 0.0), (4, 0.0)], seen)
+        snap = p.stats.snapshot()
+        self.assertEqual(5, snap["latency_count"])
+        self.assertEqual(2.5, snap["latency_max"])
+        self.assertEqual(0.5, snap["latency_mean"])
+
+        # Disabled timing leaves the latency counters alone
+        p.disable_timing()
+        p.parse_input_buffer(stream)
+        self.assertEqual(5, p.stats.latency_count)
+        self.assertEqual(10, p.stats.frames_ok)
+
+    # Test the byte state machine times frames from their first header byte
+    def test_timing_bytewise(self):
+        now = [0.0]
+        p = prot.parser(0x01)
+        p.enable_timing(clock=lambda: now[0])
+        for byte in prot.build_message(0x01, 0x01, [1, 2, 3]).to_bytes():
+            p.parse_byte(byte)
+            now[0] += 1.0
+        self.assertEqual(12.0, p.stats.latency_max)
+
+    # Test reset clears the counters
+    def test_reset(self):
+        good, stream = self.build_stream()
+        p = prot.parser(0x01)
+        p.parse_input_buffer(stream)
+        p.reset()
+        self.assertEqual(0, p.stats.bytes_in)
+        self.assertEqual(0, p.stats.frames_ok)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,112 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import threading
+import time
+import unittest
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol.serial_reader import serial_reader
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+
+# Helper function to build frames addressed to the reader
+def build_frames(count, addr=0x01):
+    sender = prot.parser(0x02)
+    return [sender.build_message(i & 0xFF, addr, [i & 0xFF] * (i % 50)) for i in range(count)]
+
+
+@unittest.skipIf(serial is None, "pyserial is not installed")
+class TestSerialReader(unittest.TestCase):
+    # Test setup method
+    def setUp(self):
+        self.ser = serial.serial_for_url("loop://", timeout=0.05)
+
+    # Test teardown method
+    def tearDown(self):
+        self.ser.close()
+
+    # Test frames written to the loopback come out of the parser queue
+    def test_queue(self):
+        p = prot.parser(0x01)
+        frames = build_frames(200)
+        with serial_reader(self.ser, p) as reader:
+            self.ser.write(prot.encode_many(frames))
+            received = []
+            while len(received) < len(frames):
+                msg = p.pop_message(timeout=2)
+                self.assertIsNotNone(msg)
+                received.append(msg)
+        self.assertFalse(reader.is_running())
+        self.assertEqual(frames, received)
+        stats = reader.stats()
+        self.assertEqual(sum(m.frame_len() for m in frames), stats["bytes_read"])
+        self.assertEqual(200, stats["messages"])
+        self.assertEqual("loop://", stats["port"])
+        self.assertIsNone(stats["error"])
+
+    # Test the callback sees every message on the reader thread
+    def test_callback(self):
+        received = []
+        threads = set()
+        done = threading.Event()
+        frames = build_frames(50)
+
+        def on_message(msg):
+            received.append(msg)
+            threads.add(threading.current_thread().name)
+            if len(received) == len(frames):
+                done.set()
+
+        reader = serial_reader(self.ser, prot.parser(0x01), on_message)
+        reader.start()
+        for m in frames:
+            self.ser.write(m.to_bytes())
+        self.assertTrue(done.wait(2))
+        reader.stop()
+        self.assertEqual(frames, received)
+        self.assertNotIn(threading.current_thread().name, threads)
+
+    # Test stop interrupts a reader blocked on a port without a timeout
+    def test_stop_without_timeout(self):
+        self.ser.timeout = None
+        reader = serial_reader(self.ser, prot.parser(0x01))
+        reader.start()
+        time.sleep(0.05)
+        reader.stop(timeout=2)
+        self.assertFalse(reader.is_running())
+
+    # Test a port failing under the reader is recorded rather than raised
+    def test_port_error(self):
+        reader = serial_reader(self.ser, prot.parser(0x01))
+        reader.start()
+        self.ser.close()
+        for i in range(100):
+            if not reader.is_running():
+                break
+            time.sleep(0.01)
+        self.assertFalse(reader.is_running())
+        self.assertIsNotNone(reader.error)
+        reader.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
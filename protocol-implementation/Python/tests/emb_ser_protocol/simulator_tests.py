@@ -0,0 +1,134 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import time
+import unittest
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol import simulator
+from emb_ser_protocol.simulator import device_simulator, basic_example_handlers
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+
+# Helper function to read frames for the host from a port until count arrive or timeout passes
+def read_frames(ser, host, count, timeout=2.0):
+    received = []
+    deadline = time.monotonic() + timeout
+    while len(received) < count and time.monotonic() < deadline:
+        data = ser.read(ser.in_waiting or 1)
+        if data:
+            host.parse_input_buffer(data)
+            received += host.check_for_parsed_messages()
+    return received
+
+
+@unittest.skipIf(serial is None or simulator.pty is None, "pyserial or pty is not available")
+class TestDeviceSimulator(unittest.TestCase):
+    # Test setup method
+    def setUp(self):
+        handlers, default = basic_example_handlers()
+        self.host = prot.parser(0x01)
+        self.sim = device_simulator(0x1A, handlers, default, seed=1)
+
+    # Test teardown method
+    def tearDown(self):
+        self.sim.close()
+
+    # Helper function to open the simulator port
+    def open(self):
+        self.sim.start()
+        return serial.Serial(self.sim.port, 115200, timeout=0.05)
+
+    # Test the default handlers answer like the basic example sketch
+    def test_basic_example(self):
+        with self.open() as ser:
+            for msg_type, payload in ((0, []), (1, []), (2, [0x42]), (3, []), (4, []), (9, [])):
+                ser.write(self.host.build_message(msg_type, 0x1A, payload).to_bytes())
+            replies = read_frames(ser, self.host, 6)
+        self.assertEqual([0, 1, 2, 3, 4, 5], [m.msg_type for m in replies])
+        self.assertEqual([0x00, 0x02], list(replies[0].msg_payload))
+        self.assertEqual([0x42], list(replies[3].msg_payload))
+        self.assertTrue(all(m.src_addr == 0x1A and m.tgt_addr == 0x01 for m in replies))
+
+    # Test frames for other addresses are ignored and custom handlers can reply with lists
+    def test_custom_handler(self):
+        self.sim.on(0x20, lambda msg: [(0x21, msg.msg_payload), (0x22, [])])
+        with self.open() as ser:
+            ser.write(self.host.build_message(0x20, 0x2B, [1]).to_bytes())
+            ser.write(self.host.build_message(0x20, 0x1A, [7, 8]).to_bytes())
+            replies = read_frames(ser, self.host, 2)
+        self.assertEqual([0x21, 0x22], [m.msg_type for m in replies])
+        self.assertEqual([7, 8], list(replies[0].msg_payload))
+        self.assertEqual(1, self.sim.stats()["frames_rx"])
+
+    # Test replies wait for the configured latency
+    def test_latency(self):
+        self.sim.latency = 0.2
+        with self.open() as ser:
+            start = time.monotonic()
+            ser.write(self.host.build_message(1, 0x1A, []).to_bytes())
+            replies = read_frames(ser, self.host, 1)
+            elapsed = time.monotonic() - start
+        self.assertEqual(1, len(replies))
+        self.assertGreaterEqual(elapsed, 0.2)
+
+    # Test replies are paced to the baud rate
+    def test_baud_pacing(self):
+        self.sim.baud = 9600
+        self.sim.on(0x30, lambda msg: (0x30, bytes(90)))
+        with self.open() as ser:
+            start = time.monotonic()
+            for i in range(10):
+                ser.write(self.host.build_message(0x30, 0x1A, []).to_bytes())
+            replies = read_frames(ser, self.host, 10)
+            elapsed = time.monotonic() - start
+        self.assertEqual(10, len(replies))
+        # 10 replies of 100 bytes at 960 bytes per second
+        self.assertGreaterEqual(elapsed, 1000 / 960.0)
+
+    # Test injected errors reach the host as dropped and corrupted frames
+    def test_error_injection(self):
+        self.sim.drop_rate = 0.25
+        self.sim.corrupt_rate = 0.25
+        self.sim.noise_rate = 0.25
+        with self.open() as ser:
+            for i in range(200):
+                ser.write(self.host.build_message(1, 0x1A, []).to_bytes())
+            replies = read_frames(ser, self.host, 200, timeout=1.0)
+        stats = self.sim.stats()
+        self.assertEqual(200, stats["replies"])
+        self.assertGreater(stats["dropped"], 0)
+        self.assertGreater(stats["corrupted"], 0)
+        self.assertGreater(stats["noise_bursts"], 0)
+        self.assertLessEqual(len(replies), 200 - stats["dropped"])
+        self.assertGreater(self.host.stats.crc_failures + self.host.stats.resyncs, 0)
+
+    # Test unsolicited frames from the device
+    def test_send(self):
+        with self.open() as ser:
+            self.sim.send(0x40, 0x01, [1, 2, 3])
+            replies = read_frames(ser, self.host, 1)
+        self.assertEqual(1, len(replies))
+        self.assertEqual(0x40, replies[0].msg_type)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import os
+import tempfile
+import unittest
+from random import Random
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol import simulator
+from emb_ser_protocol import transfer
+from emb_ser_protocol.transfer import transfer_receiver, transfer_sender
+from fake_device import DEVICE_ADDR, HOST_ADDR, every, fake_device
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+
+# Fake device running a receiver, answering on the next read
+def receiver_device(receiver, drop_every=0, drop_acks_every=0):
+    return fake_device(receiver.handle, drop=every(drop_every), drop_reply=every(drop_acks_every))
+
+
+class TestTransfer(unittest.TestCase):
+    # Helper function to build a sender against a fake device
+    def sender(self, device, **kwargs):
+        return transfer_sender(device.write, device.read, prot.parser(HOST_ADDR), DEVICE_ADDR,
+                               clock=lambda: device.clock, **kwargs)
+
+    # Helper function to build random data
+    def data(self, size):
+        rng = Random(size)
+        return bytes(rng.getrandbits(8) for i in range(size))
+
+    # Test data several times MAX_MSG_LEN is reassembled exactly
+    def test_large(self):
+        data = self.data(3 * prot.MAX_MSG_LEN + 123)
+        receiver = transfer_receiver()
+        device = receiver_device(receiver)
+        report = self.sender(device, chunk_size=transfer.MAX_CHUNK_SIZE, window=2).send(data)
+        self.assertTrue(report["complete"])
+        self.assertTrue(receiver.done)
+        self.assertEqual(data, bytes(receiver.data))
+        self.assertEqual(4, report["chunks"])
+        self.assertEqual(0, report["retransmits"])
+
+    # Test lost chunks and lost acknowledgements are recovered by going back
+    def test_loss(self):
+        data = self.data(20000)
+        for drop_every, drop_acks_every in ((7, 0), (0, 5), (11, 3)):
+            receiver = transfer_receiver()
+            device = receiver_device(receiver, drop_every, drop_acks_every)
+            report = self.sender(device, chunk_size=256, window=8, timeout=0.02).send(data)
+            self.assertTrue(report["complete"])
+            self.assertEqual(data, bytes(receiver.data))
+            if drop_every:
+                self.assertGreater(report["retransmits"], 0)
+                self.assertGreater(receiver.out_of_order, 0)
+
+    # Test reassembling into a preallocated buffer, and refusing a transfer that does not fit
+    def test_preallocated(self):
+        data = self.data(5000)
+        buf = bytearray(6000)
+        completed = []
+        receiver = transfer_receiver(buf, on_complete=lambda view: completed.append(bytes(view)))
+        device = receiver_device(receiver)
+        sender = self.sender(device, chunk_size=1000, window=3, timeout=0.01, retries=2)
+        self.assertTrue(sender.send(data)["complete"])
+        self.assertEqual(data, bytes(buf[:5000]))
+        self.assertEqual([data], completed)
+        report = sender.send(self.data(7000))
+        self.assertFalse(report["complete"])
+        self.assertEqual(3, report["timeouts"])
+        self.assertEqual(3, receiver.rejected)
+
+    # Test two different buffers of the same size from fresh senders both arrive
+    def test_same_size(self):
+        receiver = transfer_receiver()
+        device = receiver_device(receiver)
+        for data in (self.data(3000), bytes(reversed(self.data(3000)))):
+            report = self.sender(device, chunk_size=1000).send(data)
+            self.assertTrue(report["complete"])
+            self.assertEqual(3, report["chunks_acked"])
+            self.assertEqual(data, bytes(receiver.data))
+
+    # Test a start frame sent again is acknowledged without starting over, until the transfer is done
+    def test_start_resent(self):
+        receiver = transfer_receiver()
+        host = prot.parser(HOST_ADDR)
+        start = host.build_message(transfer.TRANSFER_START, DEVICE_ADDR,
+                                   transfer.START_STRUCT.pack(7, 2000, 1000))
+        receiver.handle(start)
+        for seq in range(2):
+            self.assertEqual((transfer.TRANSFER_ACK, transfer.ACK_STRUCT.pack(7, seq)),
+                             receiver.handle(start))
+            self.assertFalse(receiver.done)
+            receiver.handle(host.build_message(transfer.TRANSFER_DATA, DEVICE_ADDR,
+                                               transfer.DATA_STRUCT.pack(7, seq) + b"x" * 1000))
+        self.assertTrue(receiver.done)
+        self.assertEqual((transfer.TRANSFER_ACK, transfer.ACK_STRUCT.pack(7, 2)),
+                         receiver.handle(start))
+        self.assertTrue(receiver.done)
+
+    # Test an empty transfer whose first acknowledgement is lost completes once
+    def test_empty_start_ack_lost(self):
+        completed = []
+        receiver = transfer_receiver(on_complete=lambda view: completed.append(bytes(view)))
+        device = fake_device(receiver.handle, drop_reply=lambda count, msg: count == 1)
+        report = self.sender(device, timeout=0.01).send(b"")
+        self.assertTrue(report["complete"])
+        self.assertEqual(1, report["timeouts"])
+        self.assertEqual([b""], completed)
+
+    # Test an empty transfer and sending a file through mmap
+    def test_file(self):
+        data = self.data(10000)
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            receiver = transfer_receiver()
+            sender = self.sender(receiver_device(receiver), chunk_size=4000)
+            self.assertTrue(sender.send_file(path)["complete"])
+            self.assertEqual(data, bytes(receiver.data))
+            self.assertTrue(sender.send(b"")["complete"])
+            self.assertEqual(b"", bytes(receiver.data))
+        finally:
+            os.remove(path)
+
+    # Test a receiver that never answers stops after the retries
+    def test_no_receiver(self):
+        device = receiver_device(transfer_receiver(), drop_every=1)
+        report = self.sender(device, timeout=0.01, retries=3).send(b"x" * 100)
+        self.assertFalse(report["complete"])
+        self.assertEqual(4, device.requests)
+        self.assertEqual(0, report["bytes_acked"])
+
+    # Test the throughput is reported against the baud rate
+    def test_baud_fraction(self):
+        receiver = transfer_receiver()
+        device = receiver_device(receiver)
+        report = self.sender(device, chunk_size=512, window=4, baud=115200).send(self.data(8192))
+        self.assertAlmostEqual(report["bytes_per_second"] * 10 / 115200, report["baud_fraction"])
+        self.assertGreater(report["wire_fraction"], report["baud_fraction"])
+
+    # Test bad arguments
+    def test_bad_arguments(self):
+        device = receiver_device(transfer_receiver())
+        with self.assertRaises(Exception):
+            self.sender(device, chunk_size=0)
+        with self.assertRaises(Exception):
+            self.sender(device, chunk_size=transfer.MAX_CHUNK_SIZE + 1)
+        with self.assertRaises(Exception):
+            self.sender(device, window=0)
+
+    # Test a transfer to a simulated device over a pseudo-terminal
+    @unittest.skipIf(serial is None or simulator.pty is None, "pyserial or pty is not available")
+    def test_simulator(self):
+        data = self.data(100000)
+        receiver = transfer_receiver()
+        with simulator.device_simulator(DEVICE_ADDR, receiver.handlers()) as sim:
+            ser = serial.Serial(sim.port, 115200, timeout=0.01)
+            try:
+                sender = transfer_sender(ser.write, lambda: ser.read(max(1, ser.in_waiting)),
+                                         prot.parser(HOST_ADDR), DEVICE_ADDR, chunk_size=4096)
+                report = sender.send(data)
+            finally:
+                ser.close()
+        self.assertTrue(report["complete"])
+        self.assertEqual(data, bytes(receiver.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,276 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import getopt
+import json
+import sys
+import time
+import serial
+from concurrent.futures import ThreadPoolExecutor
+import emb_ser_protocol.protocol as protocol
+from emb_ser_protocol.correlator import correlator, percentile
+import protocol_tester as tester
+
+
+# Build the command and expected response pairs one device runs
+def build_device_pairs(config, opmode, my_address, target_address):
+    if opmode == "message":
+        message_config = tester.get_config_field(config, "message_config")
+        expected_rsp_config = tester.get_config_field(config, "expected_rsp_config")
+        return [tester.build_command_pair(
+            int(tester.get_config_field(message_config, "message_type"), 16),
+            [int(x, 16) for x in tester.get_config_field(message_config, "message_payload")],
+            int(tester.get_config_field(expected_rsp_config, "message_type"), 16),
+            [int(x, 16) for x in tester.get_config_field(expected_rsp_config, "message_payload")],
+            my_address, target_address)]
+    elif opmode == "cmd_rsp":
+        return tester.load_command_response_pairs(
+            tester.get_config_field(config, "command_response_config"), my_address, target_address)
+    print("Error: Unknown opmode: " + opmode)
+    sys.exit(2)
+
+
+# Read a float option from a configuration section, falling back to a default
+def config_float(section, key, default):
+    if section == None or tester.get_config_field(section, key) == None:
+        return default
+    return float(tester.get_config_field(section, key))
+
+
+# Run the scenario on one device and report how it went
+def run_device(device, pairs, options):
+    """
+    Open one device's port, wait for it to be ready and run the command / response pairs through a
+    correlator. Runs on a worker thread, every device has its own port, parser and correlator.
+
+    Args:
+        device: Dictionary with the name, port, baud and target_address of the device
+        pairs: List of (command, expected_response) message tuples
+        options: Dictionary of the window, timeout, retries, repeat and connection options
+
+    Returns:
+        Dictionary of the device results
+    """
+    target_address = int(device["target_address"], 16)
+    result = {
+        "name": device.get("name", device["port"]),
+        "port": device["port"],
+        "target_address": hex(target_address),
+        "passed": False,
+        "ready_seconds": None,
+        "exchanges": 0,
+        "responses": 0,
+        "timeouts": 0,
+        "mismatches": 0,
+        "unexpected": 0,
+        "failures": [],
+        "rtt_ms": None,
+        "error": None,
+    }
+    try:
+        ser = serial.serial_for_url(device["port"], int(device.get("baud", 9600)), timeout=1)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    try:
+        result["ready_seconds"] = tester.wait_for_device(
+            ser, options["strategy"], target_address, options["connect_timeout"],
+            options["poll_interval"], options["max_interval"], options["probe_type"], [],
+            options["probe_type"] if options["strategy"] == "probe" else None)
+        if result["ready_seconds"] == None:
+            result["error"] = "No answer from device after {} seconds".format(
+                options["connect_timeout"])
+            return result
+
+        # Same correlator as the tester's cmd_rsp mode, on a parser of the device's own
+        ser.timeout = 0.01
+        device_parser = protocol.parser(options["my_address"],
+                                        broadcast_addr=options["broadcast_address"])
+        corr = correlator(ser.write, lambda: ser.read(max(1, ser.in_waiting)), device_parser,
+                          options["window"], options["timeout"], options["retries"])
+        exchanges = corr.run(pairs * options["repeat"])
+
+        rtts = []
+        for ex in exchanges:
+            result["exchanges"] += 1
+            if ex.response == None:
+                result["timeouts"] += 1
+                result["failures"].append("No response to message type " + hex(ex.command.msg_type))
+                continue
+            result["responses"] += 1
+            rtts.append(ex.rtt)
+            mismatch = tester.describe_mismatch(ex.response, ex.expected)
+            if mismatch != None:
+                result["mismatches"] += 1
+                result["failures"].append(mismatch)
+        result["unexpected"] = len(corr.unmatched)
+        for m in corr.unmatched:
+            result["failures"].append("Unexpected message: " + str(m))
+        if len(rtts) > 0:
+            result["rtt_ms"] = {
+                "p50": percentile(rtts, 50) * 1000,
+                "p90": percentile(rtts, 90) * 1000,
+                "p99": percentile(rtts, 99) * 1000,
+                "max": max(rtts) * 1000,
+            }
+        result["passed"] = len(result["failures"]) == 0
+    except (Exception, SystemExit) as e:
+        # The tester helpers exit on port errors, which only ends this device's thread
+        result["error"] = str(e) if isinstance(e, Exception) else "Serial port error"
+    finally:
+        ser.close()
+    return result
+
+
+# Print one line per device
+def print_report(results):
+    print("{:<16} {:<16} {:>6} {:>10} {:>10} {:>10} {:>10}  {}".format(
+        "device", "port", "addr", "responses", "p50 ms", "p99 ms", "max ms", "result"))
+    for r in results:
+        rtt = r["rtt_ms"] or {"p50": 0.0, "p99": 0.0, "max": 0.0}
+        status = "PASS" if r["passed"] else "FAIL"
+        if r["error"] != None:
+            status += " (" + r["error"] + ")"
+        elif not r["passed"]:
+            status += " (" + r["failures"][0] + ")"
+        print("{:<16} {:<16} {:>6} {:>10} {:>10.2f} {:>10.2f} {:>10.2f}  {}".format(
+            r["name"], r["port"], r["target_address"],
+            "{}/{}".format(r["responses"], r["exchanges"]), rtt["p50"], rtt["p99"], rtt["max"],
+            status))
+
+
+# Print the usage of the program.
+def print_usage():
+    print("Usage: fleet_runner.py -c fleet_config.json [options]")
+    print("Options:")
+    print("-h, --help: Print this help message.")
+    print("-c, --config_file: The fleet configuration file to use.")
+    print("-o, --opmode: The opmode to run on every device, message or cmd_rsp.")
+    print("-n, --repeat: Number of times each device runs the scenario, default 1.")
+    print("-j, --json: File to write the JSON report to.")
+    print("-v, --verbose: Print every device's failures.")
+
+
+# Main function for the fleet runner.
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hc:o:n:j:v", [
+            "help", "config_file=", "opmode=", "repeat=", "json=", "verbose"])
+    except getopt.GetoptError:
+        print(sys.exc_info()[1])
+        print_usage()
+        sys.exit(2)
+
+    config_file = ""
+    opmode = "cmd_rsp"
+    repeat = 1
+    json_file = ""
+    verbose = False
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print_usage()
+            sys.exit()
+        elif opt in ("-c", "--config_file"):
+            config_file = arg
+        elif opt in ("-o", "--opmode"):
+            opmode = arg
+        elif opt in ("-n", "--repeat"):
+            repeat = int(arg)
+        elif opt in ("-j", "--json"):
+            json_file = arg
+        elif opt in ("-v", "--verbose"):
+            verbose = True
+    if config_file == "":
+        print("A fleet configuration file is required.")
+        print_usage()
+        sys.exit(2)
+
+    # Shared settings come from the usual tester sections, the devices list adds one entry per board
+    config = tester.load_config(config_file)
+    devices = tester.get_config_field(config, "devices")
+    if devices == None or len(devices) == 0:
+        print("Error: The configuration has no devices")
+        sys.exit(2)
+    tester_config = tester.get_config_field(config, "tester_config")
+    command_response_config = tester.get_config_field(config, "command_response_config")
+    connection_config = tester.get_config_field(config, "connection_config")
+    my_address = int(tester.get_config_field(tester_config, "my_address"), 16)
+    broadcast_address = None
+    if tester.get_config_field(tester_config, "broadcast_address") != None:
+        broadcast_address = int(tester.get_config_field(tester_config, "broadcast_address"), 16)
+    protocol.set_my_address(my_address)
+    options = {
+        "my_address": my_address,
+        "broadcast_address": broadcast_address,
+        "window": int(config_float(command_response_config, "window_size", 1)),
+        "timeout": config_float(command_response_config, "timeout", 1.0),
+        "retries": int(config_float(command_response_config, "retries", 0)),
+        "repeat": repeat,
+        "strategy": "probe",
+        "connect_timeout": config_float(connection_config, "timeout", 10.0),
+        "poll_interval": config_float(connection_config, "poll_interval", 0.05),
+        "max_interval": config_float(connection_config, "max_interval", 1.0),
+        "probe_type": 0x01,
+    }
+    if connection_config != None:
+        if tester.get_config_field(connection_config, "strategy") != None:
+            options["strategy"] = tester.get_config_field(connection_config, "strategy")
+        if tester.get_config_field(connection_config, "probe_type") != None:
+            options["probe_type"] = int(tester.get_config_field(connection_config, "probe_type"), 16)
+
+    # One thread per device, they spend their time waiting on their ports
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(devices)) as pool:
+        futures = [pool.submit(run_device, device,
+                               build_device_pairs(config, opmode, my_address,
+                                                  int(device["target_address"], 16)),
+                               options)
+                   for device in devices]
+        results = [f.result() for f in futures]
+    elapsed = time.monotonic() - start
+
+    print_report(results)
+    if verbose:
+        for r in results:
+            for failure in r["failures"]:
+                print(r["name"] + ": " + failure)
+    passed = sum(1 for r in results if r["passed"])
+    print("")
+    print("Passed: {}/{} devices in {:.2f} seconds".format(passed, len(results), elapsed))
+
+    if json_file != "":
+        report = {
+            "opmode": opmode,
+            "repeat": repeat,
+            "seconds": elapsed,
+            "passed": passed,
+            "failed": len(results) - passed,
+            "devices": results,
+        }
+        with open(json_file, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Report written to " + json_file)
+
+    if passed != len(results):
+        sys.exit(1)
+
+
+# Main caller
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -5,37 +5,90 @@ import sys
 import time
 import serial
 import importlib.util
+from collections import deque
 import emb_ser_protocol.protocol as protocol
+from emb_ser_protocol.correlator import correlator, percentile
+from emb_ser_protocol.serial_reader import serial_reader
+from emb_ser_protocol.capture import capture_writer
+from emb_ser_protocol.load import load_generator
 
 # Compare a message against an expected message
 
 
 def compare_message(msg, expected_msg):
-    if msg.msg_type != expected_msg.msg_type:
-        print("Error: Message type mismatch. Expected: {}, Actual: {}".format(
-            hex(expected_msg.msg_type), hex(msg.msg_type)))
+    mismatch = describe_mismatch(msg, expected_msg)
+    if mismatch != None:
+        print("Error: " + mismatch)
         return False
+    return True
+
+
+# Describe how a message differs from an expected message, None if they match
+def describe_mismatch(msg, expected_msg):
+    # Matching messages take the single equality check, the field checks only run to report a mismatch
+    if msg == expected_msg:
+        return None
+    if msg.msg_type != expected_msg.msg_type:
+        return "Message type mismatch. Expected: {}, Actual: {}".format(
+            hex(expected_msg.msg_type), hex(msg.msg_type))
     if msg.src_addr != expected_msg.src_addr:
-        print("Error: Source address mismatch. Expected: {}, Actual: {}".format(
-            hex(expected_msg.src_addr), hex(msg.src_addr)))
-        return False
+        return "Source address mismatch. Expected: {}, Actual: {}".format(
+            hex(expected_msg.src_addr), hex(msg.src_addr))
     if msg.tgt_addr != expected_msg.tgt_addr:
-        print("Error: Target address mismatch. Expected: {}, Actual: {}".format(
-            hex(expected_msg.tgt_addr), hex(msg.tgt_addr)))
-        return False
+        return "Target address mismatch. Expected: {}, Actual: {}".format(
+            hex(expected_msg.tgt_addr), hex(msg.tgt_addr))
     if msg.msg_len != expected_msg.msg_len:
-        print("Error: Message length mismatch. Expected: {}, Actual: {}".format(
-            hex(expected_msg.msg_len), hex(msg.msg_len)))
-        return False
+        return "Message length mismatch. Expected: {}, Actual: {}".format(
+            hex(expected_msg.msg_len), hex(msg.msg_len))
     if msg.msg_payload != expected_msg.msg_payload:
-        print("Error: Message payload mismatch. Expected: {}, Actual: {}".format(
-            expected_msg.msg_payload, msg.msg_payload))
-        return False
+        return "Message payload mismatch. Expected: {}, Actual: {}".format(
+            list(expected_msg.msg_payload), list(msg.msg_payload))
     if msg.msg_crc != expected_msg.msg_crc:
-        print("Error: Message CRC mismatch. Expected: {}, Actual: {}".format(
-            hex(expected_msg.msg_crc), hex(msg.msg_crc)))
-        return False
-    return True
+        return "Message CRC mismatch. Expected: {}, Actual: {}".format(
+            hex(expected_msg.msg_crc), hex(msg.msg_crc))
+    return None
+
+
+# Build a message from src_addr to tgt_addr, without a parser of that address
+def build_addressed_message(msg_type, src_addr, tgt_addr, payload):
+    if len(payload) > protocol.MAX_MSG_LEN:
+        raise Exception("Message length too large")
+    msg = protocol.message(msg_type, src_addr, tgt_addr, len(payload), payload, 0)
+    msg.msg_crc = protocol.calculate_crc(msg)
+    return msg
+
+
+# Build a command and its expected response, the response comes back from target_address
+def build_command_pair(command_type, command_payload, response_type, response_payload,
+                       my_address, target_address, dest_address=None):
+    if dest_address == None:
+        dest_address = target_address
+    command = build_addressed_message(command_type, my_address, dest_address, command_payload)
+    expected = build_addressed_message(response_type, target_address, my_address, response_payload)
+    return command, expected
+
+
+# Build the command and expected response pairs of the command_response_config
+def load_command_response_pairs(command_response_config, my_address, target_address,
+                                dest_address=None):
+    pairs = []
+    for cmd in get_config_field(command_response_config, "command_response_pairs"):
+        # Convert the hex strings to ints
+        command_type = int(get_config_field(cmd, "command_type"), 16)
+        response_type = int(get_config_field(cmd, "response_type"), 16)
+        # Convert the payload from a hex string to a list of ints
+        command_payload = [
+            int(x, 16)
+            for x in get_config_field(cmd, "command_payload")
+        ]
+        response_payload = [
+            int(x, 16)
+            for x in get_config_field(cmd, "response_payload")
+        ]
+        pairs.append(build_command_pair(command_type, command_payload, response_type,
+                                        response_payload, my_address, target_address,
+                                        dest_address))
+    return pairs
 
 # Send a message through a serial port
 
@@ -60,6 +113,84 @@ def receive_message(ser, length):
         sys.exit(2)
 
 
+# Read whatever has arrived on the serial port, waiting at most the port timeout for the first byte
+def read_available(ser):
+    try:
+        return ser.read(max(1, ser.in_waiting))
+    except Exception as e:
+        print("Error: " + str(e))
+        sys.exit(2)
+
+
+# Write out every sniffed frame waiting in the queue with a single write
+def print_sniffed_frames(frames):
+    lines = []
+    while frames:
+        stamp, msg = frames.popleft()
+        lines.append("{:.6f} src: {}, tgt: {}, type: {}, len: {}, payload: {}, crc: {}".format(
+            stamp, hex(msg.src_addr), hex(msg.tgt_addr), hex(msg.msg_type), msg.msg_len,
+            msg.msg_payload.hex(), hex(msg.msg_crc)))
+    if len(lines) > 0:
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+    return len(lines)
+
+
+# Open a capture file to record frames to, None if no capture file was given
+def open_capture(capture_file):
+    if capture_file == "":
+        return None
+    try:
+        return capture_writer(capture_file)
+    except Exception as e:
+        print("Error: " + str(e))
+        sys.exit(2)
+
+
+# Passively decode all traffic on the port, for duration seconds or until interrupted
+def run_sniffer(ser, duration=0, verbose=False, capture=None):
+    # Decode on a reader thread with a promiscuous parser, frames are stamped as they complete
+    frames = deque()
+    sniffer = protocol.parser(protocol.my_addr, promiscuous=True)
+    ser.timeout = 0.1
+
+    def on_frame(msg):
+        stamp = time.time()
+        frames.append((stamp, msg))
+        if capture != None:
+            capture.write_message(msg, stamp)
+    reader = serial_reader(ser, sniffer, on_frame)
+    reader.start()
+    start = time.monotonic()
+    count = 0
+    try:
+        while duration <= 0 or time.monotonic() - start < duration:
+            time.sleep(0.05)
+            count += print_sniffed_frames(frames)
+            if not reader.is_running():
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.stop()
+    count += print_sniffed_frames(frames)
+
+    # Report the link statistics
+    stats = reader.stats()
+    print("")
+    print("Frames: " + str(count))
+    print("Bad CRC: " + str(sniffer.stats.crc_failures))
+    print("Resyncs: " + str(sniffer.stats.resyncs))
+    if verbose:
+        print("Bytes read: " + str(stats["bytes_read"]))
+        print("Reads: " + str(stats["reads"]))
+        print("Bytes per second: {:.0f}".format(stats["bytes_per_second"]))
+    if capture != None:
+        print("Recorded: " + str(capture.records) + " frames to " + capture.path)
+    if reader.error != None:
+        print("Error: " + str(reader.error))
+
+
 # Helper function to import a module from a file.
 def module_from_file(module_name, file_path):
     spec = importlib.util.spec_from_file_location(module_name, file_path)
@@ -68,18 +199,188 @@ def module_from_file(module_name, file_path):
     return module
 
 
-# Open the serial port
+# Run the load generator on the port as set up by the load_config
+def run_load(ser, load_test_config, port, target_address, window_size=1, verbose=False):
+    if load_test_config == None:
+        load_test_config = {}
+
+    # Read the load options, the window from the command line is used unless the config sets one
+    message_type = 0x01
+    response_type = None
+    if get_config_field(load_test_config, "message_type") != None:
+        message_type = int(get_config_field(load_test_config, "message_type"), 16)
+    if get_config_field(load_test_config, "response_type") != None:
+        response_type = int(get_config_field(load_test_config, "response_type"), 16)
+    count = int(get_config_field(load_test_config, "count") or 0)
+    duration = float(get_config_field(load_test_config, "duration") or 0)
+    if count <= 0 and duration <= 0:
+        count = 1000
+    rate = float(get_config_field(load_test_config, "rate") or 0)
+    if get_config_field(load_test_config, "window") != None:
+        window_size = int(get_config_field(load_test_config, "window"))
+    timeout = float(get_config_field(load_test_config, "timeout") or 1.0)
+    guard = get_config_field(load_test_config, "guard")
+    if guard != None:
+        guard = float(guard)
+    seed = get_config_field(load_test_config, "seed")
+    payload_sizes = get_config_field(load_test_config, "payload_sizes") or [0]
+    payload_sizes = [tuple(x) if isinstance(x, list) else x for x in payload_sizes]
+    loopback = get_config_field(load_test_config, "loopback")
+    if loopback == None:
+        loopback = port.startswith("loop://")
+    output = get_config_field(load_test_config, "output")
+    if verbose:
+        print("Message type: " + hex(message_type))
+        print("Count: " + str(count) + ", duration: " + str(duration))
+        print("Rate: " + str(rate) + ", window: " + str(window_size))
+        print("Payload sizes: " + str(payload_sizes))
+        print("Loopback: " + str(loopback))
+        print("")
+
+    # On a loopback the requests come back as they were sent, so they are their own responses
+    ser.timeout = 0.001
+    if loopback:
+        load_parser = protocol.parser(protocol.my_addr, promiscuous=True)
+        response_addr = protocol.my_addr
+    else:
+        load_parser = protocol.parser(protocol.my_addr)
+        response_addr = target_address
+    try:
+        gen = load_generator(lambda data: send_message(ser, data), lambda: read_available(ser),
+                             load_parser, message_type, target_address, response_type,
+                             response_addr, payload_sizes, window_size, rate, timeout, seed, guard)
+        report = gen.run(count, duration)
+    except Exception as e:
+        print("Error: " + str(e))
+        sys.exit(2)
+    report["port"] = port
+    report["message_type"] = hex(message_type)
+    report["payload_sizes"] = payload_sizes
+    if output != None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        if verbose:
+            print("Report written to " + output)
+    return report
+
+
+# Serial ports kept open between test configurations, keyed by port name
+open_ports = {}
+
+# Set to keep ports open when a configuration finishes, for running several in one process
+keep_ports_open = False
+
+
+# Open the serial port, reusing it if it was kept open by an earlier configuration
 def open_serial_port(port, baud, delay_seconds=0):
+    ser = open_ports.get(port)
+    if ser != None and ser.is_open:
+        ser.baudrate = int(baud)
+        ser.timeout = 1
+        return ser
     try:
-        ser = serial.Serial(port, baud)
+        # serial_for_url opens plain device names as well as URLs such as loop:// or socket://
+        ser = serial.serial_for_url(port, baud)
         ser.timeout = 1
         time.sleep(delay_seconds)
+        if keep_ports_open:
+            open_ports[port] = ser
         return ser
     except Exception as e:
         print("Error: " + str(e))
         sys.exit(2)
 
 
+# Close the serial port unless ports are kept open between configurations
+def close_serial_port(ser):
+    if not keep_ports_open:
+        ser.close()
+
+
+# Close every port kept open between configurations
+def close_all_ports():
+    for ser in open_ports.values():
+        ser.close()
+    open_ports.clear()
+
+
+# Wait until the device is ready to talk, instead of sleeping a fixed time after opening the port
+def wait_for_device(ser, strategy, target_address, timeout=10.0, poll_interval=0.05,
+                    max_interval=1.0, probe_type=0x01, probe_payload=[], ready_type=None,
+                    quiet_time=0.25):
+    """
+    Wait for the device on the port to be ready. The probe strategy sends one probe message, a ping
+    by default, per attempt and waits for the answer before sending the next. The hello strategy
+    sends nothing and waits for the device to announce itself. Both wait poll_interval seconds on
+    the first attempt, doubling up to max_interval, until a message from the target arrives or
+    timeout seconds have passed. Once the device answers, everything it still sends is read and
+    discarded until the line has been quiet for quiet_time seconds, so late answers to earlier
+    probes are not taken for the reply to the first real message. The sleep strategy keeps the old
+    behaviour of sleeping timeout seconds, none returns straight away.
+
+    Args:
+        ser: Serial port the device is on
+        strategy: One of "probe", "hello", "sleep" or "none"
+        target_address: Address of the device
+        timeout: Overall seconds to wait for the device
+        poll_interval: Seconds of the first attempt
+        max_interval: Longest attempt in seconds
+        probe_type: Message type of the probe
+        probe_payload: Payload of the probe
+        ready_type: Message type that shows the device is ready, None for any message from it
+        quiet_time: Seconds the line must be quiet after the device answers
+
+    Returns:
+        Seconds waited for the answer, None if the device did not answer in time
+    """
+    if strategy == "none":
+        return 0.0
+    if strategy == "sleep":
+        time.sleep(timeout)
+        return timeout
+    if strategy not in ("probe", "hello"):
+        print("Error: Unknown connection strategy: " + str(strategy))
+        sys.exit(2)
+
+    # A parser of our own keeps stray bytes out of the one the tester uses
+    ready_parser = protocol.parser(protocol.my_addr)
+    probe = protocol.build_message(probe_type, target_address, probe_payload).to_bytes()
+    start = time.monotonic()
+    deadline = start + timeout
+    interval = poll_interval
+    port_timeout = ser.timeout
+    try:
+        waited = None
+        while waited == None:
+            if strategy == "probe":
+                send_message(ser, probe)
+            attempt_end = min(time.monotonic() + interval, deadline)
+            while waited == None and time.monotonic() < attempt_end:
+                ser.timeout = max(0, attempt_end - time.monotonic())
+                data = read_available(ser)
+                if len(data) == 0:
+                    continue
+                ready_parser.parse_input_buffer(data)
+                for m in ready_parser.check_for_parsed_messages():
+                    if m.src_addr == target_address and (ready_type == None or m.msg_type == ready_type):
+                        waited = time.monotonic() - start
+            if waited == None and time.monotonic() >= deadline:
+                # Answers to the probe that did not count, such as a NACK, are not left for the tester
+                ser.reset_input_buffer()
+                return None
+            interval = min(interval * 2, max_interval)
+
+        # Drain until the line is quiet, giving up on a device that never stops talking after timeout
+        ser.timeout = quiet_time
+        drain_end = time.monotonic() + timeout
+        while len(read_available(ser)) > 0 and time.monotonic() < drain_end:
+            pass
+        ser.reset_input_buffer()
+        return waited
+    finally:
+        ser.timeout = port_timeout
+
+
 # Parse the objects from the configuration file
 def get_config_field(config, key):
     if key in config:
@@ -121,23 +422,30 @@ def print_usage():
     print("-e", "--response_type: The expected response message type.")
     print("-r", "--response_payload: The expected response message payload.")
     print("-d", "--broadcast: place the tester in broadcast mode.")
+    print("-w", "--window: Number of commands kept in flight in cmd_rsp mode.")
+    print("-f", "--capture_file: Record the frames seen in message and sniffer mode to a capture file.")
+    print("-s", "--connect: How to wait for the device after opening the port, probe, hello, sleep or none.")
+    print("More than one configuration file can be given, they run in turn on ports kept open between them.")
 
 
-# Main function for the protocol tester.
-def main(argv):
+# Argument list
+short_options = "hc:p:b:t:m:p:a:v:o:e:r:dw:f:s:"
+long_options = [
+    "help", "config_file=", "port=", "baud=", "target_address=",
+    "message_type=", "message_payload=", "my_address=", "verbose",
+    "opmode=", "response_type=", "response_payload=", "broadcast",
+    "window=", "capture_file=", "connect="
+]
+
+
+# Run the tester for one configuration.
+def run_tester(argv):
     # Check the argument length
     if len(argv) < 1:
         print("At least one argument is required.")
         print_usage()
         sys.exit(2)
 
-    # Argument list
-    short_options = "hc:p:b:t:m:p:a:v:o:e:r:d"
-    long_options = [
-        "help", "config_file=", "port=", "baud=", "target_address=",
-        "message_type=", "message_payload=", "my_address=", "verbose",
-        "opmode=", "response_type=", "response_payload=", "broadcast"
-    ]
     try:
         opts, args = getopt.getopt(argv, short_options, long_options)
     except getopt.GetoptError:
@@ -160,6 +468,20 @@ def main(argv):
     exp_rsp_message_payload = []
     broadcast_address = -1
     broadcast_mode = False
+    window_size = 1
+    sniffer_duration = 0
+    capture_file = ""
+    response_timeout = 1.0
+    response_retries = 0
+    connect_strategy = ""
+    load_test_config = None
+    connect_timeout = 10.0
+    connect_poll_interval = 0.05
+    connect_max_interval = 1.0
+    connect_quiet_time = 0.25
+    probe_type = 0x01
+    probe_payload = []
+    ready_type = None
 
     # Configure the arguments
     for opt, arg in opts:
@@ -190,6 +512,12 @@ def main(argv):
             exp_rsp_message_payload = arg
         elif opt in ("-d", "--broadcast"):
             broadcast_mode = True
+        elif opt in ("-w", "--window"):
+            window_size = int(arg)
+        elif opt in ("-f", "--capture_file"):
+            capture_file = arg
+        elif opt in ("-s", "--connect"):
+            connect_strategy = arg
 
     # Print the arguments if verbose is enabled
     if verbose:
@@ -222,6 +550,9 @@ def main(argv):
         expected_rsp_config = get_config_field(config, "expected_rsp_config")
         command_response_config = get_config_field(
             config, "command_response_config")
+        sniffer_config = get_config_field(config, "sniffer_config")
+        load_test_config = get_config_field(config, "load_config")
+        connection_config = get_config_field(config, "connection_config")
 
         # Load the tester configuration options
         if tester_config != None:
@@ -274,6 +605,41 @@ def main(argv):
                 print("Overriding expected response message payload: " +
                       str(exp_rsp_message_payload))
 
+        # Load the sniffer configuration options
+        if sniffer_config != None:
+            if get_config_field(sniffer_config, "duration") != None:
+                sniffer_duration = float(
+                    get_config_field(sniffer_config, "duration"))
+            if verbose:
+                print("Overriding sniffer duration: " + str(sniffer_duration))
+
+        # Load the connection configuration options
+        if connection_config != None:
+            if get_config_field(connection_config, "strategy") != None:
+                connect_strategy = get_config_field(connection_config, "strategy")
+            if get_config_field(connection_config, "timeout") != None:
+                connect_timeout = float(get_config_field(connection_config, "timeout"))
+            if get_config_field(connection_config, "poll_interval") != None:
+                connect_poll_interval = float(
+                    get_config_field(connection_config, "poll_interval"))
+            if get_config_field(connection_config, "max_interval") != None:
+                connect_max_interval = float(
+                    get_config_field(connection_config, "max_interval"))
+            if get_config_field(connection_config, "quiet_time") != None:
+                connect_quiet_time = float(get_config_field(connection_config, "quiet_time"))
+            if get_config_field(connection_config, "probe_type") != None:
+                probe_type = int(get_config_field(connection_config, "probe_type"), 16)
+            if get_config_field(connection_config, "probe_payload") != None:
+                probe_payload = [
+                    int(x, 16)
+                    for x in get_config_field(connection_config, "probe_payload")
+                ]
+            if get_config_field(connection_config, "ready_type") != None:
+                ready_type = int(get_config_field(connection_config, "ready_type"), 16)
+            if verbose:
+                print("Overriding connection strategy: " + str(connect_strategy))
+                print("Overriding connection timeout: " + str(connect_timeout))
+
         # Give an extra space if we are verbose
         if verbose:
             print("")
@@ -282,12 +648,45 @@ def main(argv):
     if verbose:
         print("Setting my address: " + str(my_address))
     protocol.set_my_address(my_address)
+    if broadcast_address >= 0:
+        protocol.set_broadcast_address(broadcast_address)
 
     # Attempt to open the  serial port
     if verbose:
         print("Opening serial port: " + port + " at baud " + str(baud))
         print("")
-    ser = open_serial_port(port, baud, 10)
+    fresh = port not in open_ports
+    ser = open_serial_port(port, baud)
+
+    # Wait for the device, a port kept open from an earlier configuration is already known to be ready.
+    # The sniffer listens from the start and never transmits, the other modes probe with a ping.
+    # Only a probe that was asked for fails the run, firmware that does not answer the default ping
+    # still gets the timeout as a settle delay, as before the probe existed.
+    probe_required = connect_strategy != ""
+    if connect_strategy == "":
+        # A loopback has no device to answer the probe
+        if opmode == "sniffer" or port.startswith("loop://"):
+            connect_strategy = "none"
+        else:
+            connect_strategy = "probe"
+    if ready_type == None and connect_strategy == "probe":
+        ready_type = probe_type
+    if fresh:
+        waited = wait_for_device(ser, connect_strategy, target_address, connect_timeout,
+                                 connect_poll_interval, connect_max_interval, probe_type,
+                                 probe_payload, ready_type, connect_quiet_time)
+        if waited == None and probe_required:
+            print("Error: No answer from device {} after {} seconds".format(
+                hex(target_address), connect_timeout))
+            close_serial_port(ser)
+            sys.exit(2)
+        if waited == None:
+            print("Warning: No answer to the probe from device {} after {} seconds, carrying on. "
+                  "Set the connection strategy to skip the probe.".format(
+                      hex(target_address), connect_timeout))
+        elif verbose:
+            print("Device ready after {:.3f} seconds".format(waited))
+            print("")
 
     if opmode == "message":
         if verbose:
@@ -317,8 +716,11 @@ def main(argv):
                   str(exp_rsp_msg.to_list()))
             print("")
 
-        # Send the message
-        send_message(ser, msg.to_list())
+        # Send the message, recording it if a capture file was given
+        capture = open_capture(capture_file)
+        send_message(ser, msg.to_bytes())
+        if capture != None:
+            capture.write_message(msg)
 
         # Receive the message
         rx_buf = receive_message(ser, 1024)
@@ -331,6 +733,12 @@ def main(argv):
         # Parse the message
         protocol.parse_input_buffer(rx_buf)
         rx_msg = protocol.check_for_parsed_messages()
+        if capture != None:
+            for m in rx_msg:
+                capture.write_message(m)
+            capture.close()
+            if verbose:
+                print("Recorded: " + str(capture.records) + " frames to " + capture.path)
         if rx_msg != None:
             if verbose:
                 print("Got " + str(len(rx_msg)) + " messages")
@@ -343,99 +751,132 @@ def main(argv):
                 if verbose:
                     print("Raw message: " + str(m.to_list()))
 
-        # For now close the serial port before exiting
+        # Close the serial port before exiting
         if verbose:
             print("Closing serial port")
             print("")
-        ser.close()
-        sys.exit()
+        close_serial_port(ser)
     elif opmode == "cmd_rsp":
         if verbose:
             print("Command response mode")
             print("")
 
         # Build a list of messages and expected responses from the command_response_config object
-        messages = []
-        expected_responses = []
-        command_response_pairs = get_config_field(
-            command_response_config, "command_response_pairs")
-        for cmd in command_response_pairs:
-            # Convert the hex strings to ints
-            command_type = int(get_config_field(cmd, "command_type"), 16)
-            response_type = int(get_config_field(cmd, "response_type"), 16)
-            # Convert the payload from a hex string to a list of ints
-            command_payload = [
-                int(x, 16)
-                for x in get_config_field(cmd, "command_payload")
-            ]
-            response_payload = [
-                int(x, 16)
-                for x in get_config_field(cmd, "response_payload")
-            ]
-            if verbose:
-                print("Overriding command type: " + str(command_type))
-                print("Overriding command payload: " + str(command_payload))
-                print("Overriding response type: " + str(response_type))
-                print("Overriding response payload: " + str(response_payload))
-                print("")
-
-            # Build the message
-            if broadcast_mode:
-                msg = protocol.build_message(
-                    command_type, broadcast_address, command_payload)
-            else:
-                msg = protocol.build_message(command_type, target_address,
-                                             command_payload)
-
-            if verbose:
+        dest_address = broadcast_address if broadcast_mode else target_address
+        pairs = load_command_response_pairs(command_response_config, protocol.my_addr,
+                                            target_address, dest_address)
+        messages = [command for command, expected in pairs]
+        expected_responses = [expected for command, expected in pairs]
+        if verbose:
+            for msg, exp_rsp_msg in pairs:
                 print("Command: " + str(msg))
                 print("Raw command: " + str(msg.to_list()))
-                print("")
-
-            # Build the expected response message
-            exp_rsp_msg = protocol.build_message(
-                response_type, protocol.my_addr, response_payload)
-            exp_rsp_msg.src_addr = target_address
-            exp_rsp_msg.msg_crc = protocol.calculate_crc(exp_rsp_msg)
-            if verbose:
                 print("Expected response message: " + str(exp_rsp_msg))
                 print("Raw expected response message: " +
                       str(exp_rsp_msg.to_list()))
                 print("")
-            messages.append(msg)
-            expected_responses.append(exp_rsp_msg)
 
-        # Loop through the messages and get the expected responses
-        for i in range(len(messages)):
-            # Send the message
-            if verbose:
-                print("Sending message: " + str(messages[i]))
-                print("Raw message: " + str(messages[i].to_list()))
-            send_message(ser, messages[i].to_list())
+        # Pipelining options, the defaults keep the old one command at a time behaviour
+        if get_config_field(command_response_config, "window_size") != None:
+            window_size = int(get_config_field(
+                command_response_config, "window_size"))
+        if get_config_field(command_response_config, "timeout") != None:
+            response_timeout = float(get_config_field(
+                command_response_config, "timeout"))
+        if get_config_field(command_response_config, "retries") != None:
+            response_retries = int(get_config_field(
+                command_response_config, "retries"))
+        if verbose:
+            print("Window size: " + str(window_size))
+            print("Response timeout: " + str(response_timeout))
+            print("Response retries: " + str(response_retries))
+            print("")
 
-            # Receive the message
-            rx_buf = receive_message(ser, 1024)
-            # Convert the bytes int a list of ints
-            rx_buf = [x for x in rx_buf]
+        # Run the commands through the correlator, keeping window_size commands in flight
+        ser.timeout = 0.01
+        corr = correlator(lambda data: send_message(ser, data),
+                          lambda: read_available(ser), protocol.default_parser,
+                          window_size, response_timeout, response_retries)
+        exchanges = corr.run(zip(messages, expected_responses))
 
+        # Report each command and response pair
+        rtts = []
+        for ex in exchanges:
+            if verbose:
+                print("Sent message: " + str(ex.command))
+                print("Raw message: " + str(ex.command.to_list()))
+                print("Attempts: " + str(ex.attempts))
+            if ex.response == None:
+                print("Error: No response to message type {}".format(
+                    hex(ex.command.msg_type)))
+            elif compare_message(ex.response, ex.expected):
+                print("Got expected response message!")
+                print("Message: " + str(ex.response))
+                print("Round trip time: {:.2f} ms".format(ex.rtt * 1000))
+                rtts.append(ex.rtt)
+            if verbose and ex.response != None:
+                print("Raw message: " + str(ex.response.to_list()))
+                print("")
+        for m in corr.unmatched:
+            print("Error: Unexpected message: " + str(m))
             if verbose:
-                print("Raw bytes received: " + str(rx_buf))
+                print("Raw message: " + str(m.to_list()))
+        if len(rtts) > 0:
+            print("Round trip time p50: {:.2f} ms, p99: {:.2f} ms, max: {:.2f} ms".format(
+                percentile(rtts, 50) * 1000, percentile(rtts, 99) * 1000,
+                max(rtts) * 1000))
+        close_serial_port(ser)
+    elif opmode == "load":
+        if verbose:
+            print("Load mode")
+            print("")
+        report = run_load(ser, load_test_config, port, target_address, window_size, verbose)
+        print(json.dumps(report, indent=2))
+        close_serial_port(ser)
+    elif opmode == "sniffer":
+        if verbose:
+            print("Sniffer mode")
+            print("")
+        capture = open_capture(capture_file)
+        run_sniffer(ser, sniffer_duration, verbose, capture)
+        if capture != None:
+            capture.close()
+        close_serial_port(ser)
 
-            # Parse the message
-            protocol.parse_input_buffer(rx_buf)
-            rx_msg = protocol.check_for_parsed_messages()
-            if rx_msg != None:
-                if verbose:
-                    print("Got " + str(len(rx_msg)) + " messages")
-
-                # Loop through the messages and see if we got the expected response message
-                for m in rx_msg:
-                    if compare_message(m, expected_responses[i]):
-                        print("Got expected response message!")
-                        print("Message: " + str(m))
-                    if verbose:
-                        print("Raw message: " + str(m.to_list()))
-                        print("")
+
+# Main function for the protocol tester.
+def main(argv):
+    global keep_ports_open
+    try:
+        opts, args = getopt.getopt(argv, short_options, long_options)
+    except getopt.GetoptError:
+        print(sys.exc_info()[1])
+        print_usage()
+        sys.exit(2)
+
+    # A single configuration runs as is
+    config_files = [arg for opt, arg in opts if opt in ("-c", "--config_file")]
+    if len(config_files) < 2:
+        run_tester(argv)
+        return
+
+    # Run each configuration in turn with the other arguments, keeping the ports open between them
+    common = []
+    for opt, arg in opts:
+        if opt in ("-c", "--config_file"):
+            continue
+        common.append(opt)
+        if (opt[1] + ":" in short_options) if len(opt) == 2 else (opt[2:] + "=" in long_options):
+            common.append(arg)
+    keep_ports_open = True
+    try:
+        for config_file in config_files:
+            print("Configuration: " + config_file)
+            run_tester(common + ["-c", config_file])
+            print("")
+    finally:
+        close_all_ports()
+        keep_ports_open = False
 
 
 # Main caller
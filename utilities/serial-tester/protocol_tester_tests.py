@@ -0,0 +1,200 @@
+
+#DISCLAIMER:
+
+#This code is protected under the MIT open source license. The code is provided
+#"as is" without warranty of any kind, either express or implied, including but
+#not limited to the implied warranties of merchantability, fitness for a particular
+#purpose, or non-infringement. In no event shall the author or any other party be
+#liable for any direct, indirect, incidental, special, exemplary, or consequential
+#damages, however caused and on any theory of liability, whether in contract,
+#strict liability, or tort (including negligence or otherwise), arising in any way
+#out of the use of this code or performance or use of the results of this code. By
+#using this code, you agree to hold the author and any other party harmless from
+#any and all liability and to use the code at your own risk.
+
+#This code was written by GitHub user: budgettsfrog
+#Contact: budgettsfrog@protonmail.com
+#GitHub: https://github.com/warrenwoolseyiii
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import emb_ser_protocol.protocol as prot
+from emb_ser_protocol import simulator
+from emb_ser_protocol.simulator import device_simulator, basic_example_handlers
+
+try:
+    import serial
+    import protocol_tester as tester
+except ImportError:
+    serial = None
+
+DEVICE_ADDR = 0x1a
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              ".example_tester_config.json")
+
+
+@unittest.skipIf(serial is None or simulator.pty is None, "pyserial or pty is not available")
+class TestWaitForDevice(unittest.TestCase):
+    # Test teardown method
+    def tearDown(self):
+        self.ser.close()
+        self.sim.close()
+
+    # Helper function to start a simulated device and open its port
+    def open(self, handlers=None, default=None, latency=0.0):
+        self.sim = device_simulator(DEVICE_ADDR, handlers, default, latency=latency)
+        self.sim.start()
+        self.ser = serial.Serial(self.sim.port, 115200, timeout=1)
+
+    # Helper function to send a version request and return the first frame that comes back
+    def first_reply(self):
+        self.ser.write(prot.parser(0x01).build_message(0x00, DEVICE_ADDR, []).to_bytes())
+        host = prot.parser(0x01)
+        deadline = time.monotonic() + 2.0
+        while time.monotonic() < deadline:
+            host.parse_input_buffer(self.ser.read(max(1, self.ser.in_waiting)))
+            msgs = host.check_for_parsed_messages()
+            if msgs:
+                return msgs[0]
+        return None
+
+    # Test a device that answers at once is ready after the first probe
+    def test_ready(self):
+        self.open(*basic_example_handlers())
+        waited = tester.wait_for_device(self.ser, "probe", DEVICE_ADDR, 2.0, ready_type=0x01)
+        self.assertIsNotNone(waited)
+        self.assertLess(waited, 0.5)
+        self.assertEqual(1, self.sim.stats()["frames_rx"])
+        self.assertEqual(0x00, self.first_reply().msg_type)
+
+    # Test the late answers to earlier probes are drained, not taken for the first reply
+    def test_late(self):
+        self.open(*basic_example_handlers(), latency=0.3)
+        waited = tester.wait_for_device(self.ser, "probe", DEVICE_ADDR, 2.0, 0.05, ready_type=0x01)
+        self.assertIsNotNone(waited)
+        self.assertGreaterEqual(waited, 0.3)
+        self.assertGreater(self.sim.stats()["frames_rx"], 1)
+        self.assertLessEqual(self.sim.stats()["frames_rx"], 4)
+        self.assertEqual(0x00, self.first_reply().msg_type)
+
+    # Test a device that never answers times out with the input flushed
+    def test_never(self):
+        self.open(default=lambda msg: (0x05, []))
+        start = time.monotonic()
+        self.assertIsNone(tester.wait_for_device(self.ser, "probe", DEVICE_ADDR, 0.3,
+                                                 ready_type=0x01))
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(0, self.ser.in_waiting)
+
+    # Test the hello strategy waits for the device to announce itself without transmitting
+    def test_hello(self):
+        self.open()
+        self.sim.send(0x07, 0x01, [], delay=0.2)
+        waited = tester.wait_for_device(self.ser, "hello", DEVICE_ADDR, 2.0, ready_type=0x07)
+        self.assertGreaterEqual(waited, 0.2)
+        self.assertEqual(0, self.sim.stats()["frames_rx"])
+
+
+@unittest.skipIf(serial is None or simulator.pty is None, "pyserial or pty is not available")
+class TestMain(unittest.TestCase):
+    # Test setup method
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sim = None
+
+    # Test teardown method
+    def tearDown(self):
+        if self.sim is not None:
+            self.sim.close()
+        shutil.rmtree(self.dir)
+
+    # Helper function to start a simulated device
+    def start(self, handlers=None, default=None, latency=0.0):
+        self.sim = device_simulator(DEVICE_ADDR, handlers, default, latency=latency)
+        self.sim.start()
+
+    # Helper function to write the example configuration for the simulator port, with changes
+    def config(self, name, **sections):
+        with open(EXAMPLE_CONFIG) as f:
+            config = json.load(f)
+        config["serial_config"]["port"] = self.sim.port
+        config["serial_config"]["baud"] = 115200
+        config.update(sections)
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as f:
+            json.dump(config, f)
+        return path
+
+    # Helper function to run the tester and return what it printed
+    def run_main(self, argv):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            tester.main(argv)
+        return out.getvalue()
+
+    # Test message mode against a device that is ready
+    def test_message_ready(self):
+        self.start(*basic_example_handlers())
+        out = self.run_main(["-c", self.config("message.json")])
+        self.assertIn("Got expected response message!", out)
+        self.assertNotIn("Warning", out)
+
+    # Test cmd_rsp mode against a device that answers late gets every response, none unexpected
+    def test_cmd_rsp_late(self):
+        self.start(*basic_example_handlers(), latency=0.2)
+        path = self.config("cmd_rsp.json", connection_config={"poll_interval": 0.05})
+        out = self.run_main(["-c", path, "-o", "cmd_rsp"])
+        self.assertEqual(6, out.count("Got expected response message!"))
+        self.assertNotIn("Error", out)
+
+    # Test the default probe carries on with a warning when the device never answers it
+    def test_never_default(self):
+        self.start()
+        out = self.run_main(["-c", self.config("message.json", connection_config={"timeout": 0.3})])
+        self.assertIn("Warning: No answer to the probe", out)
+
+    # Test a probe asked for in the configuration fails the run when the device never answers
+    def test_never_required(self):
+        self.start()
+        path = self.config("message.json", connection_config={"strategy": "probe", "timeout": 0.3})
+        with self.assertRaises(SystemExit) as cm:
+            self.run_main(["-c", path])
+        self.assertEqual(2, cm.exception.code)
+
+    # Test several configurations share one port, probed once
+    def test_several_configs(self):
+        self.start(*basic_example_handlers())
+        out = self.run_main(["-c", self.config("first.json"), "-c", self.config("second.json"),
+                             "-o", "cmd_rsp"])
+        self.assertEqual(12, out.count("Got expected response message!"))
+        self.assertEqual(13, self.sim.stats()["frames_rx"])
+        self.assertEqual({}, tester.open_ports)
+
+    # Test load mode reports every request answered
+    def test_load(self):
+        self.start(*basic_example_handlers())
+        path = self.config("load.json", load_config={"count": 50, "window": 4})
+        out = self.run_main(["-c", path, "-o", "load"])
+        report = json.loads(out[out.index("{"):])
+        self.assertEqual(50, report["sent"])
+        self.assertEqual(50, report["received"])
+
+    # Test sniffer mode decodes the device's traffic without transmitting
+    def test_sniffer(self):
+        self.start()
+        for i in range(3):
+            self.sim.send(0x04, 0x01, [i], delay=0.1)
+        path = self.config("sniffer.json", sniffer_config={"duration": 0.5})
+        out = self.run_main(["-c", path, "-o", "sniffer"])
+        self.assertIn("Frames: 3", out)
+        self.assertEqual(0, self.sim.stats()["frames_rx"])
+
+
+if __name__ == '__main__':
+    unittest.main()